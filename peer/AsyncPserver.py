@@ -0,0 +1,180 @@
+import os
+import json
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import grpc
+import p2p_pb2
+import p2p_pb2_grpc
+
+import Pserver
+from channels import SERVER_OPTIONS
+
+ASYNC_MAX_RPCS = int(os.getenv('ASYNC_MAX_RPCS', '1000'))
+ASYNC_MAX_TRANSFERS = int(os.getenv('ASYNC_MAX_TRANSFERS', '256'))
+ASYNC_MAX_STREAMS = int(os.getenv('ASYNC_MAX_STREAMS', '100'))
+ASYNC_IO_WORKERS = int(os.getenv('ASYNC_IO_WORKERS', '8'))
+
+# Disk reads and tracker requests block, so they run on these bounded pools
+# while the event loop keeps serving every other stream. Lookups answered by
+# the catalog replica only read memory, peer loads included, so they never
+# leave the loop.
+io_executor = ThreadPoolExecutor(max_workers=ASYNC_IO_WORKERS, thread_name_prefix='peer-io')
+tracker_executor = ThreadPoolExecutor(max_workers=Pserver.GRPC_WORKERS, thread_name_prefix='peer-tracker')
+
+async def lookup(answer, func, *args):
+    # answer is the catalog-only form of func: it runs on the loop, and
+    # only when it has nothing does func go to the tracker pool.
+    result = answer(*args)
+    if result is not None:
+        return result
+    return await asyncio.get_running_loop().run_in_executor(tracker_executor, func, *args)
+
+def open_shared(path, username, filename):
+    # Everything RequestFile needs from the disk before streaming, run on
+    # the I/O pool: None when the file is not shared, else the open file,
+    # its stat and the fileurl it was registered with.
+    if not os.path.isfile(path):
+        return None
+    fileurl = Pserver.shared_fileurl(username, filename)
+    f = open(path, 'rb')
+    return f, os.fstat(f.fileno()), fileurl
+
+
+class AsyncFileService(p2p_pb2_grpc.FileServiceServicer):
+    def __init__(self):
+        self.transfers = asyncio.Semaphore(ASYNC_MAX_TRANSFERS)
+
+    async def ListFiles(self, request, context):
+        logging.info(f"Received ListFiles request from {context.peer()}")
+        status_code, files = await lookup(Pserver.catalog_files, Pserver.fetch_files)
+        if status_code != 200:
+            logging.error(f"Failed to retrieve file list from server for {context.peer()}")
+            await context.abort(grpc.StatusCode.INTERNAL, "Failed to retrieve file list from server")
+        return p2p_pb2.ListFilesResponse(files=[p2p_pb2.File(filename=file['filename'], fileurl=file['fileurl']) for file in files])
+
+    async def RequestFile(self, request, context):
+        logging.info(f"Received RequestFile for '{request.filename}' from {context.peer()}")
+        loop = asyncio.get_running_loop()
+
+        path = Pserver.shared_path(request.filename)
+        if not path:
+            logging.error(f"File {request.filename} not found in {Pserver.SHARED_DIR}")
+            await context.abort(grpc.StatusCode.NOT_FOUND, "File not found")
+
+        # Beyond ASYNC_MAX_TRANSFERS open files, new downloads wait here
+        # instead of failing.
+        async with self.transfers:
+            shared = await loop.run_in_executor(io_executor, open_shared, path, request.username, request.filename)
+            if shared is None:
+                logging.error(f"File {request.filename} not found in {Pserver.SHARED_DIR}")
+                await context.abort(grpc.StatusCode.NOT_FOUND, "File not found")
+            f, stat, fileurl = shared
+            fileurl = fileurl or request.fileurl
+            with Pserver.uploads.transfer():
+                try:
+                    size = stat.st_size
+                    if request.offset < 0 or request.length < 0 or request.offset > size:
+                        await context.abort(grpc.StatusCode.OUT_OF_RANGE, f"Range starts past the end of the file ({size} bytes)")
+                    end = min(size, request.offset + request.length) if request.length else size
+                    file_hash = await loop.run_in_executor(io_executor, Pserver.file_digest, path, stat)
+
+                    offset = request.offset
+                    # Copying a chunk out of the mapping can fault pages in from
+                    # disk, so the chunks are taken on the I/O pool as well.
+                    chunks = Pserver.read_chunks(f, offset, end)
+                    try:
+                        content = await loop.run_in_executor(io_executor, next, chunks, b'')
+                        yield p2p_pb2.FileChunk(content=content, filename=request.filename, fileurl=fileurl, size=size,
+                                                offset=offset, checksum=Pserver.chunk_checksum(content), file_hash=file_hash)
+                        offset += len(content)
+                        Pserver.uploads.sent(len(content))
+                        # Each yield waits for the HTTP/2 flow-control window, so a
+                        # slow reader holds a file handle but no thread.
+                        while offset < end:
+                            content = await loop.run_in_executor(io_executor, next, chunks, b'')
+                            if not content:
+                                break
+                            yield p2p_pb2.FileChunk(content=content, offset=offset, checksum=Pserver.chunk_checksum(content))
+                            offset += len(content)
+                            Pserver.uploads.sent(len(content))
+                    finally:
+                        try:
+                            chunks.close()
+                        except ValueError:
+                            # A cancelled call can leave the generator running on
+                            # the I/O pool; it is closed once that read returns.
+                            pass
+                finally:
+                    f.close()
+
+        logging.info(f"Sent '{request.filename}' bytes {request.offset}-{offset} of {size} to {context.peer()}")
+
+    async def DiscoverFile(self, request, context):
+        logging.info(f"Received DiscoverFile for '{request.filename}' from {context.peer()}")
+        peers_info = await lookup(Pserver.catalog_peers, Pserver.discover_peers, request.filename)
+        if not peers_info:
+            logging.info(f"File '{request.filename}' not found for {context.peer()}")
+            await context.abort(grpc.StatusCode.NOT_FOUND, "File not found")
+        peer_addresses = [f"{peer['username']} {peer['grpc_url']}:{peer['grpc_port']}" for peer in peers_info]
+        logging.info(f"File '{request.filename}' discovered on peers: {', '.join(peer_addresses)} for {context.peer()}")
+        return p2p_pb2.DiscoverFileResponse(peerAddresses=json.dumps(peer_addresses))
+
+    async def DiscoverFiles(self, request, context):
+        logging.info(f"Received DiscoverFiles for {len(request.filenames)} files and {len(request.content_hashes)} contents from {context.peer()}")
+        response = await lookup(Pserver.catalog_discover_all, Pserver.discover_all, list(dict.fromkeys(request.filenames)), list(dict.fromkeys(request.content_hashes)))
+        if response is None:
+            logging.error(f"Failed to discover files on the server for {context.peer()}")
+            await context.abort(grpc.StatusCode.INTERNAL, "Failed to discover files on the server")
+        return response
+
+    async def ListAllFiles(self, request, context):
+        logging.info(f"Received ListAllFiles request from {context.peer()}")
+        status_code, files = await lookup(Pserver.catalog_files, Pserver.fetch_files)
+        if status_code != 200:
+            logging.error(f"Failed to retrieve all file list from server for {context.peer()}")
+            await context.abort(grpc.StatusCode.INTERNAL, "Failed to retrieve all file list from server")
+        return p2p_pb2.ListAllFilesResponse(files=[p2p_pb2.File(filename=file['filename'], fileurl=file['fileurl']) for file in files])
+
+    # The DHT and gossip handlers only touch in-memory tables.
+    async def Ping(self, request, context):
+        return Pserver.dht.on_ping(request)
+
+    async def FindNode(self, request, context):
+        return Pserver.dht.on_find_node(request)
+
+    async def FindValue(self, request, context):
+        return Pserver.dht.on_find_value(request)
+
+    async def Store(self, request, context):
+        return Pserver.dht.on_store(request)
+
+    async def ListPeers(self, request, context):
+        return Pserver.view.on_list_peers(request)
+
+    async def Shuffle(self, request, context):
+        return Pserver.view.on_shuffle(request)
+
+
+async def serve():
+    if Pserver.CATALOG_REPLICA:
+        Pserver.catalog.start()
+    threading.Thread(target=Pserver.log_cache_stats, daemon=True).start()
+    threading.Thread(target=Pserver.uploads.report, daemon=True).start()
+    Pserver.start_discovery()
+    server = grpc.aio.server(maximum_concurrent_rpcs=ASYNC_MAX_RPCS,
+                             options=SERVER_OPTIONS + [('grpc.max_concurrent_streams', ASYNC_MAX_STREAMS)])
+    p2p_pb2_grpc.add_FileServiceServicer_to_server(AsyncFileService(), server)
+    server.add_insecure_port(f'[::]:{Pserver.GRPC_PORT}')
+    await server.start()
+    logging.info(f'Async server listening on port {Pserver.GRPC_PORT}')
+    try:
+        await server.wait_for_termination()
+    finally:
+        await server.stop(5)
+        io_executor.shutdown(wait=False)
+        tracker_executor.shutdown(wait=False)
+
+if __name__ == '__main__':
+    asyncio.run(serve())
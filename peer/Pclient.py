@@ -1,37 +1,73 @@
 import os
-import requests
 import json
-import threading
+import hashlib
 import time
+import threading
 import grpc
 import p2p_pb2
-import p2p_pb2_grpc
 import logging
+from collections import Counter
+from shards import open_tracker, open_catalog
+from swarm import SwarmDownload, SwarmError
+from channels import ChannelPool
+from registry import open_registry
+from content import cached_description
+from transfer import BufferPool, file_sha256
+from heartbeat import Heartbeat
+from load import read_load, load_path
+from ranking import PeerMeter, address_of
+from dht import DHTNode, key_for
 
 
 SERVER_URL = os.getenv('SERVER_URL')
 SERVER_PORT = os.getenv('SERVER_PORT')
 GRPC_URL = os.getenv('GRPC_URL')
 GRPC_PORT = os.getenv('GRPC_PORT')
+CATALOG_REPLICA = os.getenv('CATALOG_REPLICA', '1') == '1'
+# Files are only published in the DHT when peer servers discover through it.
+DISCOVERY_SOURCE = os.getenv('DISCOVERY_SOURCE', 'tracker')
+SHARED_DIR = os.getenv('SHARED_DIR', 'shared')
+JOURNAL_INTERVAL = int(os.getenv('JOURNAL_INTERVAL', str(1024 * 1024)))
+SHARED_DIR_SCAN_INTERVAL = float(os.getenv('SHARED_DIR_SCAN_INTERVAL', '30'))
+
+tracker = open_tracker(f'http://{SERVER_URL}:{SERVER_PORT}')
+catalog = open_catalog(tracker)
+channels = ChannelPool()
+# Piece buffers shared by every swarm download this client runs.
+buffers = BufferPool()
+heartbeat = None
+meter = PeerMeter()
+# Looks up and publishes in the DHT, joining through this peer's server.
+dht = DHTNode(None, channels)
 
 def clear_screen():
     os.system('cls' if os.name == 'nt' else 'clear')
 
 def manage_user_files(username, new_file=None):
-    filename = f"{username}files.json"
-    if os.path.exists(filename):
-        with open(filename, 'r') as f:
-            user_files = json.load(f)
+    registry = open_registry(username)
+    if new_file:
+        registry.add(**new_file)
     else:
-        user_files = []
+        registry.compact()
+        changed, removed = registry.sync(SHARED_DIR, shared_entry)
+        for _, entry in changed:
+            print(f"Registered '{entry['filename']}' found in {SHARED_DIR}")
+        for entry in removed:
+            print(f"Unregistered '{entry['filename']}', it is no longer in {SHARED_DIR}")
+
+def shared_entry(name, entry):
+    # A file in SHARED_DIR as the registry should hold it: described again
+    # only when it changed on disk, keeping the fileurl it was shared with.
+    description = cached_description(entry, os.path.join(SHARED_DIR, name))
+    if description is None:
+        return None
+    return dict(description, fileurl=entry['fileurl'] if entry else f"grpc://{GRPC_URL}:{GRPC_PORT}/{name}")
 
-    if new_file:
-        user_files.append(new_file)
-        with open(filename, 'w') as f:
-            json.dump(user_files, f, indent=4)
+def register_peer(username, password):
+    return tracker.post('/login', {'username': username, 'password': password, 'grpc_url': GRPC_URL, 'grpc_port': GRPC_PORT})
 
 def login(username, password):
-    response = requests.post(f'http://{SERVER_URL}:{SERVER_PORT}/login', json={'username': username, 'password': password, 'grpc_url': GRPC_URL, 'grpc_port': GRPC_PORT})
+    response = register_peer(username, password)
     if response.status_code == 200:
         manage_user_files(username)
         print(response.json()['message'])
@@ -41,27 +77,81 @@ def login(username, password):
         return False
     
 def logout(username):
-    response = requests.post(f'http://{SERVER_URL}:{SERVER_PORT}/logout', json={'username': username})
+    # Stopped first, or its next beat would mark the peer active again.
+    if heartbeat is not None:
+        heartbeat.stop()
+    response = tracker.post('/logout', {'username': username})
     if response.status_code == 200:
         print(response.json()['message'])
     else:
         print("Logout failed")
 
-def send_heartbeat(username):
+def tracker_entry(entry):
+    # What the tracker is told about a shared file.
+    return {key: value for key, value in entry.items() if key != 'mtime_ns'}
+
+def shared_entries(username):
+    return [tracker_entry(entry) for entry in open_registry(username).files()]
+
+def peer_load():
+    # Transfers and upload capacity come from this peer's server process.
+    return dict(read_load(load_path(GRPC_PORT)) or {}, cpu_load=os.getloadavg()[0], cpus=os.cpu_count() or 1)
+
+def start_heartbeat(username, password):
+    global heartbeat
+    heartbeat = Heartbeat(tracker, username, lambda: register_peer(username, password).status_code == 200,
+                          lambda: shared_entries(username), load=peer_load)
+    heartbeat.resync()
+    heartbeat.start()
+
+def publish_entry(username, entry):
+    if DISCOVERY_SOURCE != 'dht':
+        return
+    provider = {'username': username, 'grpc_url': GRPC_URL, 'grpc_port': GRPC_PORT,
+                'filename': entry['filename'], 'content_hash': entry.get('content_hash')}
+    dht.announce(key_for('file', entry['filename']), provider)
+    if entry.get('content_hash'):
+        dht.announce(key_for('content', entry['content_hash']), provider)
+
+def withdraw_entry(username, entry):
+    if DISCOVERY_SOURCE != 'dht':
+        return
+    dht.withdraw(key_for('file', entry['filename']), username, entry['filename'])
+    if entry.get('content_hash'):
+        dht.withdraw(key_for('content', entry['content_hash']), username, entry['filename'])
+
+def watch_shared_dir(username):
+    # Files added, edited or deleted in SHARED_DIR while the client runs
+    # reach the tracker with the next heartbeat and the DHT with the next
+    # publish.
     while True:
+        time.sleep(SHARED_DIR_SCAN_INTERVAL)
         try:
-            response = requests.post(f'http://{SERVER_URL}:{SERVER_PORT}/heartbeat', json={'username': username})
-            if response.status_code != 200:
-                print("Failed to send heartbeat")
-            time.sleep(8)
-        except Exception as e:
-            print(f"Error sending heartbeat: {e}")
-            break
+            changed, removed = open_registry(username).sync(SHARED_DIR, shared_entry)
+        except OSError as e:
+            logging.error(f"Failed to scan {SHARED_DIR}: {e}")
+            continue
+        for previous, entry in changed:
+            logging.info(f"Registered '{entry['filename']}' found in {SHARED_DIR}")
+            if previous:
+                withdraw_entry(username, previous)
+            heartbeat.add(tracker_entry(entry))
+            publish_entry(username, entry)
+        for entry in removed:
+            logging.info(f"Unregistered '{entry['filename']}', it is no longer in {SHARED_DIR}")
+            heartbeat.remove(entry['filename'])
+            withdraw_entry(username, entry)
+
+def start_dht(username):
+    if DISCOVERY_SOURCE != 'dht':
+        return
+    for entry in shared_entries(username):
+        publish_entry(username, entry)
+    dht.start(lambda: [f'{GRPC_URL}:{GRPC_PORT}'])
 
 def list_active_peers():
-    response = requests.get(f'http://{SERVER_URL}:{SERVER_PORT}/list_peers')
-    if response.status_code == 200:
-        peers = response.json()
+    status_code, peers = (200, catalog.list_peers()) if catalog.ready else tracker.get_json('/list_peers')
+    if status_code == 200:
         print("Active peers:")
         for peer in peers:
             print(f"Username: {peer['username']}, gRPC URL: {peer['grpc_url']}, gRPC Port: {peer['grpc_port']}, Status: {peer['status']}, Number of Files: {peer['num_files']}")
@@ -75,18 +165,23 @@ def upload_file(username, filename=None, fileurl=None):
         fileurl = input("Enter the file URL: ")
 
     new_file = {'filename': filename, 'fileurl': fileurl}
+    path = os.path.join(SHARED_DIR, os.path.basename(filename))
+    if os.path.isfile(path):
+        # Files actually present in the share directory are registered by
+        # content too, hashed once and reused until they change.
+        new_file.update(cached_description(open_registry(username).get(filename), path))
     manage_user_files(username, new_file)
 
-    response = requests.post(f'http://{SERVER_URL}:{SERVER_PORT}/upload_file', json={'username': username, 'filename': filename, 'fileurl': fileurl})
-    if response.status_code == 200:
-        print(response.json()['message'])
+    heartbeat.add(tracker_entry(new_file))
+    publish_entry(username, new_file)
+    if heartbeat.flush():
+        print("File uploaded successfully")
     else:
-        print("Failed to upload file")
+        print("The tracker did not answer, the file will be sent with the next heartbeat")
 
 def list_all_files():
-    response = requests.get(f'http://{SERVER_URL}:{SERVER_PORT}/list_files')
-    if response.status_code == 200:
-        files = response.json()
+    status_code, files = (200, catalog.list_files()) if catalog.ready else tracker.get_json('/list_files')
+    if status_code == 200:
         if files:
             seen_files = set()
             for i, file in enumerate(files, start=1):
@@ -102,24 +197,28 @@ def list_all_files():
         return []
 
 def list_peers_from_peer(peer):
-    with grpc.insecure_channel(f"{peer['grpc_url']}:{peer['grpc_port']}") as channel:
-        stub = p2p_pb2_grpc.FileServiceStub(channel)
-        response = stub.ListPeers(p2p_pb2.ListPeersRequest())
+    # The peer's gossiped view of the network, freshest first.
+    with channels.stub(f"{peer['grpc_url']}:{peer['grpc_port']}") as stub:
+        try:
+            response = stub.ListPeers(p2p_pb2.ListPeersRequest())
+        except grpc.RpcError as e:
+            print(f"Failed to list peers from peer: {e}")
+            return []
         print("Peers from peer:", (f"{peer['grpc_url']}:{peer['grpc_port']}"))
-        for peer in response.peers:
-            print(peer.peerAddress)
+        for descriptor in response.peers:
+            print(f"{descriptor.peerAddress} (heard from {descriptor.age:.0f}s ago)")
+        return [descriptor.peerAddress for descriptor in response.peers]
 
 def list_files_from_peer(selected_peer):
-    with grpc.insecure_channel(f"{selected_peer['grpc_url']}:{selected_peer['grpc_port']}") as channel:
-        stub = p2p_pb2_grpc.FileServiceStub(channel)
+    with channels.stub(f"{selected_peer['grpc_url']}:{selected_peer['grpc_port']}") as stub:
         try:
             response = stub.ListAllFiles(p2p_pb2.ListAllFilesRequest())
             files = []
             print("Files available:")
+            locations = stub.DiscoverFiles(p2p_pb2.DiscoverFilesRequest(filenames=[file.filename for file in response.files]))
+            peer_counts = {location.filename: len(location.peers) for location in locations.files}
             for i, file in enumerate(response.files, start=1):
-                stub = p2p_pb2_grpc.FileServiceStub(channel)
-                peers_with_file = discover_file_from_peer(stub, file.filename)
-                peer_count = len(peers_with_file) if peers_with_file else 0
+                peer_count = peer_counts.get(file.filename, 0)
                 print(f"{i}. Filename: {file.filename}, URL: {file.fileurl}, Peers: {peer_count}")
                 files.append({'filename': file.filename, 'fileurl': file.fileurl, 'peer_count': peer_count})
             return files
@@ -129,43 +228,161 @@ def list_files_from_peer(selected_peer):
 
 def discover_file_from_peer(stub, filename):
     try:
-        response = stub.DiscoverFile(p2p_pb2.DiscoverFileRequest(filename=filename))
-        if response.peerAddresses:
-            peer_info = json.loads(response.peerAddresses)
-            logging.info(f"Discovered peers: {peer_info}")
-            return peer_info
-        else:
-            logging.info("Received an empty response for peer addresses.")
-            return None
-    except json.JSONDecodeError as e:
-        logging.error(f"JSON decoding failed for string: {response.peerAddresses}, Error: {e}")
-        return None
-    except Exception as e:
-        logging.error(f"An error occurred: {e}")
+        response = stub.DiscoverFiles(p2p_pb2.DiscoverFilesRequest(filenames=[filename]))
+        peers = [located_peer(peer, filename) for location in response.files for peer in location.peers]
+        logging.info(f"Discovered peers: {[peer['username'] for peer in peers]}")
+        return peers
+    except grpc.RpcError as e:
+        logging.error(f"Failed to discover peers for '{filename}': {e.details()}")
         return None
 
-def download_file_from_peer( username, selected_peer, filename, fileurl):
-    peer_address = f"{selected_peer['grpc_url']}:{selected_peer['grpc_port']}"
-    with grpc.insecure_channel(peer_address) as channel:
-        stub = p2p_pb2_grpc.FileServiceStub(channel)
-        file_chunks = stub.RequestFile(p2p_pb2.RequestFileRequest(filename=filename, fileurl=fileurl, username=selected_peer['username']))
+def describe_peer(peer):
+    rtt = meter.rtt(address_of(peer))
+    rtt = 'unknown' if rtt is None else f"{rtt * 1000:.0f} ms"
+    transfers = 'unknown' if peer.get('transfers') is None else peer['transfers']
+    return f"RTT: {rtt}, Expected: {meter.throughput(peer) / 1024:.0f} KiB/s, Transfers: {transfers}"
+
+def load_journal(path):
+    # A partial download is a <file>.part holding the bytes received so far
+    # and a <file>.part.json journal recording how many of them are good and
+    # which version of the file they belong to.
+    journal_path = f"{path}.part.json"
+    try:
+        with open(journal_path, 'r') as f:
+            journal = json.load(f)
+        with open(f"{path}.part", 'r+b') as f:
+            if os.fstat(f.fileno()).st_size < journal['received']:
+                raise ValueError("partial file is shorter than its journal")
+            f.truncate(journal['received'])
+        return journal
+    except (OSError, ValueError, KeyError):
+        return None
 
-        decoded_filename = None
-        decoded_fileurl = None
+def save_journal(path, journal):
+    journal_path = f"{path}.part.json"
+    with open(f"{journal_path}.tmp", 'w') as f:
+        json.dump(journal, f)
+    os.replace(f"{journal_path}.tmp", journal_path)
 
-        for chunk in file_chunks:
-            decoded_content = chunk.content.decode()
-            decoded_filename, decoded_fileurl = decoded_content.split(", ")
-            decoded_filename = decoded_filename.split(": ")[1]
-            decoded_fileurl = decoded_fileurl.split(": ")[1]
-            break  
+def discard_partial(path):
+    for leftover in (f"{path}.part", f"{path}.part.json"):
+        if os.path.exists(leftover):
+            os.remove(leftover)
 
-        if decoded_filename and decoded_fileurl:
-            print(f"Downloaded '{decoded_filename}' with URL '{decoded_fileurl}' from peer: {selected_peer['username']} at {peer_address}")
-            upload_file( username, decoded_filename, decoded_fileurl)
+def download_file_from_peer( username, selected_peer, filename, fileurl):
+    peer_address = f"{selected_peer['grpc_url']}:{selected_peer['grpc_port']}"
+    os.makedirs(SHARED_DIR, exist_ok=True)
+    path = os.path.join(SHARED_DIR, os.path.basename(filename))
+    partial_path = f"{path}.part"
+
+    journal = load_journal(path)
+    if journal is None:
+        discard_partial(path)
+        journal = {'filename': filename, 'fileurl': fileurl, 'size': None, 'file_hash': None, 'received': 0}
+    elif journal['received']:
+        print(f"Resuming '{filename}' at byte {journal['received']} of {journal['size']}")
+
+    start, start_offset = time.monotonic(), journal['received']
+    with channels.stub(peer_address) as stub:
+        file_chunks = stub.RequestFile(p2p_pb2.RequestFileRequest(filename=filename, fileurl=fileurl, username=selected_peer['username'], offset=journal['received']))
+
+        unsaved = 0
+        try:
+            with open(partial_path, 'ab') as f:
+                try:
+                    for chunk in file_chunks:
+                        if chunk.file_hash:
+                            if journal['file_hash'] and chunk.file_hash != journal['file_hash']:
+                                # The peer has a different version of the file
+                                # than the one the partial data belongs to.
+                                file_chunks.cancel()
+                                f.truncate(0)
+                                journal.update(received=0, file_hash=None)
+                                raise ValueError("the file changed since the download started, run it again to start over")
+                            journal.update(size=chunk.size, file_hash=chunk.file_hash, fileurl=chunk.fileurl or fileurl)
+                        if chunk.offset != journal['received']:
+                            raise ValueError(f"expected offset {journal['received']}, got {chunk.offset}")
+                        if hashlib.sha256(chunk.content).hexdigest() != chunk.checksum:
+                            raise ValueError(f"checksum mismatch in chunk at offset {chunk.offset}")
+                        f.write(chunk.content)
+                        journal['received'] += len(chunk.content)
+                        unsaved += len(chunk.content)
+                        if unsaved >= JOURNAL_INTERVAL:
+                            f.flush()
+                            save_journal(path, journal)
+                            unsaved = 0
+                finally:
+                    f.flush()
+                    f.truncate(journal['received'])
+                    save_journal(path, journal)
+        except grpc.RpcError as e:
+            if e.code() == grpc.StatusCode.OUT_OF_RANGE:
+                discard_partial(path)
+                print(f"'{filename}' on peer {selected_peer['username']} is now shorter than the partial download, discarded it: {e.details()}")
+                return
+            print(f"Download of '{filename}' from peer {selected_peer['username']} interrupted at byte {journal['received']}: {e.details()}")
+            return
+        except ValueError as e:
+            print(f"Download of '{filename}' from peer {selected_peer['username']} stopped at byte {journal['received']}: {e}")
+            return
+
+    meter.record_transfer(peer_address, journal['received'] - start_offset, time.monotonic() - start)
+    if journal['size'] is None or journal['received'] != journal['size']:
+        print(f"Incomplete download of '{filename}': received {journal['received']} of {journal['size']} bytes, run it again to resume.")
+        return
+    if file_sha256(partial_path) != journal['file_hash']:
+        discard_partial(path)
+        print(f"Downloaded '{filename}' does not match its hash, discarded.")
+        return
+
+    os.replace(partial_path, path)
+    os.remove(f"{partial_path}.json")
+    print(f"Downloaded '{filename}' ({journal['received']} bytes) with URL '{journal['fileurl']}' from peer: {selected_peer['username']} at {peer_address}")
+    upload_file( username, filename, journal['fileurl'])
+
+def located_peer(peer, filename):
+    return {'username': peer.username, 'grpc_url': peer.grpc_url, 'grpc_port': peer.grpc_port, 'filename': peer.filename or filename,
+            'transfers': peer.transfers if peer.HasField('transfers') else None,
+            'capacity': peer.capacity if peer.HasField('capacity') else None}
+
+def locate_content(stub, filename):
+    # Peers may share different files under the same name. The swarm takes
+    # the version most of them hold and downloads it from every peer that has
+    # that content, under any name. Holders that registered no content hash
+    # are only used when nobody did.
+    response = stub.DiscoverFiles(p2p_pb2.DiscoverFilesRequest(filenames=[filename]))
+    holders = [peer for location in response.files for peer in location.peers]
+    versions = Counter(peer.content_hash for peer in holders if peer.content_hash)
+    if not versions:
+        return None, [located_peer(peer, filename) for peer in holders]
+
+    content_hash, holder_count = versions.most_common(1)[0]
+    if len(versions) > 1:
+        print(f"{len(versions)} different files are shared as '{filename}', downloading the one held by {holder_count} peers.")
+    response = stub.DiscoverFiles(p2p_pb2.DiscoverFilesRequest(content_hashes=[content_hash]))
+    peers = [located_peer(peer, filename) for location in response.files for peer in location.peers]
+    status_code, content = tracker.get_json(f'/contents/{content_hash}')
+    return (content if status_code == 200 else None), peers
+
+def swarm_download_file(username, peers, filename, fileurl, content=None):
+    os.makedirs(SHARED_DIR, exist_ok=True)
+    # Best peers first, so the size probe and the first pieces go to them.
+    peers = meter.rank(peers, channels)
+    download = SwarmDownload(filename, fileurl, peers, os.path.join(SHARED_DIR, os.path.basename(filename)), channels, content=content, buffers=buffers)
+    start = time.monotonic()
+    try:
+        fileurl = download.run()
+    except SwarmError as e:
+        print(f"Swarm download of '{filename}' failed: {e}")
+        return
+    elapsed = time.monotonic() - start
 
-        else:
-            print("Failed to decode filename and fileurl from the received file chunk.")
+    print(f"Downloaded '{filename}' ({download.size} bytes) in {elapsed:.1f}s, {download.size / max(elapsed, 1e-6) / 1024:.0f} KiB/s")
+    for stats in download.stats.values():
+        meter.record_rate(address_of(stats.peer), stats.rate)
+        state = "dropped" if stats.dropped else f"{(stats.rate or 0) / 1024:.0f} KiB/s"
+        print(f"  {stats.username}: {stats.pieces} pieces, {stats.bytes} bytes, {state}")
+    upload_file( username, filename, fileurl)
 
 
 def main():
@@ -173,9 +390,11 @@ def main():
     username = input("Enter username: ")
     password = input("Enter password: ")
     if login(username, password):
-        heartbeat_thread = threading.Thread(target=send_heartbeat, args=(username,))
-        heartbeat_thread.daemon = True 
-        heartbeat_thread.start()
+        start_heartbeat(username, password)
+        start_dht(username)
+        threading.Thread(target=watch_shared_dir, args=(username,), daemon=True, name='shared-dir').start()
+        if CATALOG_REPLICA:
+            catalog.start()
         
         connection_target = None
 
@@ -236,8 +455,9 @@ def main():
                 print("1. List files p2p")
                 print("2. Download file p2p")
                 print("3. Upload a file")
-                print("4. Change connection")
-                print("5. Exit")
+                print("4. List peers p2p")
+                print("5. Change connection")
+                print("6. Exit")
 
                 peer_action = input("Enter choice: ")
 
@@ -255,26 +475,26 @@ def main():
                             peer_grpc_url = selected_peer['grpc_url']
                             peer_grpc_port = selected_peer['grpc_port']
 
-                            channel = grpc.insecure_channel(f'{peer_grpc_url}:{peer_grpc_port}')
-                            stub = p2p_pb2_grpc.FileServiceStub(channel)
-                            peers_with_file = discover_file_from_peer(stub, filename)
+                            with channels.stub(f'{peer_grpc_url}:{peer_grpc_port}') as stub:
+                                peers_with_file = discover_file_from_peer(stub, filename)
 
                             if peers_with_file:
-                                print(f"\nPeers that have '{filename}':")
-                                for index, peer_str in enumerate(peers_with_file, start=1):
-                                    peer_username, address = peer_str.split(' ', 1)
-                                    grpc_url, grpc_port = address.split(':', 1)
-                                    print(f"{index}. Username: {peer_username}, Address: {grpc_url}:{grpc_port}")
-                                peer_index = int(input("\nSelect a peer to download from by number: ")) - 1
-                                
-                                if 0 <= peer_index < len(peers_with_file):
-                                    peer_str = peers_with_file[peer_index]
-                                    peer_username, address = peer_str.split(' ', 1)
-                                    grpc_url, grpc_port = address.split(':', 1)
-                                    selected_peer = {'username': peer_username, 'grpc_url': grpc_url, 'grpc_port': grpc_port}
-
-                                    print(f"\nAttempting to download '{filename}' from {selected_peer['username']} at {selected_peer['grpc_url']}:{selected_peer['grpc_port']}...")
-                                    download_file_from_peer(username, selected_peer, filename, fileurl)
+                                peers_with_file = meter.rank(peers_with_file, channels)
+                                print(f"\nPeers that have '{filename}', best first:")
+                                for index, peer in enumerate(peers_with_file, start=1):
+                                    print(f"{index}. Username: {peer['username']}, Address: {address_of(peer)}, {describe_peer(peer)}")
+                                choice = input("\nSelect a peer to download from by number (Enter for the best one, 0 to download from all of them at once): ").strip()
+                                peer_index = int(choice) - 1 if choice else 0
+
+                                if peer_index == -1:
+                                    with channels.stub(f'{peer_grpc_url}:{peer_grpc_port}') as stub:
+                                        content, swarm_peers = locate_content(stub, filename)
+                                    print(f"\nDownloading '{filename}' from {len(swarm_peers)} peers...")
+                                    swarm_download_file(username, swarm_peers, filename, fileurl, content)
+                                elif 0 <= peer_index < len(peers_with_file):
+                                    source = peers_with_file[peer_index]
+                                    print(f"\nAttempting to download '{filename}' from {source['username']} at {address_of(source)}...")
+                                    download_file_from_peer(username, source, filename, fileurl)
                                 else:
                                     print("Invalid peer selection.")
 
@@ -287,13 +507,18 @@ def main():
                     upload_file(username)
                     input("\nPress Enter to continue...")
                 elif peer_action == "4":
-                        connection_target = None
+                    list_peers_from_peer(selected_peer)
+                    input("\nPress Enter to continue...")
                 elif peer_action == "5":
+                        connection_target = None
+                elif peer_action == "6":
                     logout(username)
                     break
                 else:
                     print("Invalid option.")
                     input("\nPress Enter to continue...")
 
+        channels.close()
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
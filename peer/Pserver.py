@@ -6,19 +6,263 @@ import p2p_pb2
 import p2p_pb2_grpc
 from concurrent import futures
 import json
+import hashlib
+import threading
+import time
+from shards import open_tracker, open_catalog
+from cache import TTLCache
+from registry import open_registry
+from transfer import mapped_views, file_sha256, MMAP_WINDOW
+from load import UploadLoad, load_path, ranked
+from channels import ChannelPool, SERVER_OPTIONS
+from dht import DHTNode, DHT_BOOTSTRAP, key_for
+from gossip import PartialView
 
 GRPC_PORT = os.getenv('GRPC_PORT')
+GRPC_URL = os.getenv('GRPC_URL', 'localhost')
 SERVER_URL = os.getenv('SERVER_URL')
 SERVER_PORT = os.getenv('SERVER_PORT')
+CATALOG_REPLICA = os.getenv('CATALOG_REPLICA', '1') == '1'
+# 'dht' resolves discovery through the DHT; 'tracker' through the catalog
+# replica or the tracker.
+DISCOVERY_SOURCE = os.getenv('DISCOVERY_SOURCE', 'tracker')
+SHARED_DIR = os.getenv('SHARED_DIR', 'shared')
+CHUNK_SIZE = int(os.getenv('CHUNK_SIZE', str(64 * 1024)))
+SERVE_MMAP = os.getenv('SERVE_MMAP', '0') == '1'
+DISCOVER_BATCH_LIMIT = int(os.getenv('DISCOVER_BATCH_LIMIT', '1000'))
+GRPC_WORKERS = int(os.getenv('GRPC_WORKERS', '10'))
+TRACKER_CACHE_TTL = float(os.getenv('TRACKER_CACHE_TTL', '5'))
+TRACKER_CACHE_SIZE = int(os.getenv('TRACKER_CACHE_SIZE', '1024'))
+CACHE_STATS_INTERVAL = float(os.getenv('CACHE_STATS_INTERVAL', '60'))
 
 logging.basicConfig(level=logging.INFO)
 
+# Sized so every gRPC worker can hold a keep-alive connection to the tracker.
+tracker = open_tracker(f'http://{SERVER_URL}:{SERVER_PORT}', pool_size=GRPC_WORKERS)
+catalog = open_catalog(tracker)
+# Used for everything while the catalog replica is not in sync.
+cache = TTLCache(TRACKER_CACHE_SIZE, TRACKER_CACHE_TTL)
+# Last /peer_loads answer, refreshed in the background so that discovery
+# answered from the catalog replica never waits on the tracker.
+known_loads = {}
+
+uploads = UploadLoad(load_path(GRPC_PORT))
+# Connections to other peer servers, for the DHT and for gossip.
+peer_channels = ChannelPool()
+dht = DHTNode(f'{GRPC_URL}:{GRPC_PORT}', peer_channels)
+view = PartialView(f'{GRPC_URL}:{GRPC_PORT}', peer_channels)
+
+file_hashes = {}
+file_hashes_lock = threading.Lock()
+
+def load_files():
+    status_code, files = tracker.get_json('/list_files')
+    return files if status_code == 200 else None
+
+def load_peers(filename):
+    status_code, peers = tracker.post_json('/discover_file', {'filename': filename})
+    if status_code == 200:
+        return ranked(peers)
+    return [] if status_code == 404 else None
+
+def load_peer_loads():
+    # Discovery still works from the replica while the tracker is down,
+    # just without loads.
+    try:
+        status_code, body = tracker.get_json('/peer_loads')
+    except requests.RequestException as e:
+        logging.warning(f"Failed to fetch peer loads: {e}")
+        return None
+    return body['loads'] if status_code == 200 else None
+
+def bootstrap_peers():
+    # The DHT and the peer view only ask the tracker for peers to join
+    # through.
+    if DHT_BOOTSTRAP:
+        return [address.strip() for address in DHT_BOOTSTRAP.split(',') if address.strip()]
+    try:
+        status_code, peers = tracker.get_json('/list_peers')
+    except requests.RequestException as e:
+        logging.warning(f"Failed to fetch DHT bootstrap peers: {e}")
+        return []
+    return [f"{peer['grpc_url']}:{peer['grpc_port']}" for peer in peers] if status_code == 200 else []
+
+def with_loads(peers, loads):
+    # The catalog replica does not follow load changes, so its answers get
+    # the last known loads before they are ranked.
+    return ranked([dict(peer, **loads.get(peer['username'], {})) for peer in peers])
+
+def peer_loads():
+    return known_loads
+
+def refresh_peer_loads():
+    global known_loads
+    while True:
+        loads = load_peer_loads()
+        if loads is not None:
+            known_loads = loads
+        time.sleep(TRACKER_CACHE_TTL)
+
+def catalog_files():
+    # The catalog_* answers come from the replica alone and are None while
+    # it is not in sync. They only read memory, never the tracker, so the
+    # async server runs them on its event loop.
+    return (200, catalog.list_files()) if catalog.ready else None
+
+def catalog_peers(filename):
+    if DISCOVERY_SOURCE == 'dht' or not catalog.ready:
+        return None
+    return with_loads(catalog.discover(filename), peer_loads())
+
+def catalog_discover_all(filenames, content_hashes):
+    if DISCOVERY_SOURCE == 'dht' or not catalog.ready:
+        return None
+    loads = peer_loads()
+    return discovery_response(
+        filenames, content_hashes,
+        {filename: with_loads(catalog.discover(filename), loads) for filename in filenames},
+        {content_hash: with_loads(catalog.discover_content(content_hash), loads) for content_hash in content_hashes})
+
+def fetch_files():
+    answer = catalog_files()
+    if answer is not None:
+        return answer
+    files = cache.get_or_load(('list_files',), load_files)
+    return (200, files) if files is not None else (502, None)
+
+def discover_peers(filename):
+    if DISCOVERY_SOURCE == 'dht':
+        return with_loads(dht.find_providers(key_for('file', filename)), peer_loads())
+    peers = catalog_peers(filename)
+    if peers is not None:
+        return peers
+    return cache.get_or_load(('discover', filename), lambda: load_peers(filename)) or []
+
+def discover_batch(keys, kind, field, result):
+    # Answers what the cache has and asks the tracker for the rest in
+    # batches; field is the /discover_files request list and result the
+    # response object it is answered in.
+    locations = {}
+    missing = []
+    for key in keys:
+        found, peers = cache.get((kind, key))
+        if found:
+            locations[key] = peers
+        else:
+            missing.append(key)
+    for start in range(0, len(missing), DISCOVER_BATCH_LIMIT):
+        status_code, body = tracker.post_json('/discover_files', {field: missing[start:start + DISCOVER_BATCH_LIMIT]})
+        if status_code != 200:
+            return None
+        for key, peers in body[result].items():
+            peers = ranked(peers)
+            cache.put((kind, key), peers)
+            locations[key] = peers
+    return locations
+
+def discover_dht(kind, keys):
+    # Lookups for the whole batch run in parallel.
+    found = dht.find_all([key_for(kind, key) for key in keys])
+    loads = peer_loads()
+    return {key: with_loads(found[key_for(kind, key)], loads) for key in keys}
+
+def discover_many(filenames):
+    if DISCOVERY_SOURCE == 'dht':
+        return discover_dht('file', filenames)
+    return discover_batch(filenames, 'discover', 'filenames', 'files')
+
+def discover_contents(content_hashes):
+    if DISCOVERY_SOURCE == 'dht':
+        return discover_dht('content', content_hashes)
+    return discover_batch(content_hashes, 'content', 'content_hashes', 'contents')
+
+def discover_all(filenames, content_hashes):
+    response = catalog_discover_all(filenames, content_hashes)
+    if response is not None:
+        return response
+    locations = discover_many(filenames) if filenames else {}
+    contents = discover_contents(content_hashes) if content_hashes else {}
+    if locations is None or contents is None:
+        return None
+    return discovery_response(filenames, content_hashes, locations, contents)
+
+def discovery_response(filenames, content_hashes, locations, contents):
+    return p2p_pb2.DiscoverFilesResponse(files=[
+        p2p_pb2.FileLocation(filename=filename, peers=[peer_info(peer) for peer in locations.get(filename, [])])
+        for filename in filenames] + [
+        p2p_pb2.FileLocation(content_hash=content_hash, peers=[peer_info(peer) for peer in contents.get(content_hash, [])])
+        for content_hash in content_hashes])
+
+def peer_info(peer):
+    info = p2p_pb2.PeerInfo(username=peer['username'], grpc_url=peer['grpc_url'], grpc_port=str(peer['grpc_port']),
+                            filename=peer.get('filename') or '', content_hash=peer.get('content_hash') or '')
+    if peer.get('transfers') is not None:
+        info.transfers = peer['transfers']
+    if peer.get('capacity') is not None:
+        info.capacity = peer['capacity']
+    return info
+
+def log_cache_stats():
+    while True:
+        time.sleep(CACHE_STATS_INTERVAL)
+        logging.info(f"Tracker cache: {cache.stats()}")
+
+def shared_path(filename):
+    name = os.path.basename(filename)
+    if not name or name != filename:
+        return None
+    return os.path.join(SHARED_DIR, name)
+
+def shared_fileurl(username, filename):
+    registry = open_registry(username, create=False)
+    file_info = registry.get(filename) if registry else None
+    return file_info['fileurl'] if file_info else None
+
+def chunk_checksum(content):
+    return hashlib.sha256(content).hexdigest()
+
+def file_digest(path, stat):
+    # Whole-file hashes are cached until the file changes on disk, so resumed
+    # and repeated downloads do not re-read it.
+    key = (stat.st_mtime_ns, stat.st_size)
+    with file_hashes_lock:
+        cached = file_hashes.get(path)
+    if cached and cached[0] == key:
+        return cached[1]
+
+    file_hash = file_sha256(path)
+    with file_hashes_lock:
+        file_hashes[path] = (key, file_hash)
+    return file_hash
+
+def read_chunks(f, start, end):
+    # Yields [start, end) of an open file in CHUNK_SIZE pieces. With
+    # SERVE_MMAP=1 the file is mapped a window at a time and every chunk is
+    # copied once, straight from the mapping into the message, instead of
+    # read() allocating and filling a buffer per call. It is opt-in: our
+    # downloads replace shared files with os.replace, but anything else
+    # truncating a file in SHARED_DIR while it is served makes the mapped
+    # read raise SIGBUS and takes the whole peer server down.
+    if not SERVE_MMAP:
+        f.seek(start)
+        while start < end:
+            content = f.read(min(CHUNK_SIZE, end - start))
+            if not content:
+                return
+            start += len(content)
+            yield content
+        return
+    # Whole chunks per window keep the chunk boundaries of the read path.
+    window = max(1, MMAP_WINDOW // CHUNK_SIZE) * CHUNK_SIZE
+    for view in mapped_views(f, start, end, window):
+        for position in range(0, len(view), CHUNK_SIZE):
+            yield view[position:position + CHUNK_SIZE].tobytes()
+
 class FileServiceImpl(p2p_pb2_grpc.FileServiceServicer):
     def ListFiles(self, request, context):
         logging.info(f"Received ListFiles request from {context.peer()}")
-        response = requests.get(f'http://{SERVER_URL}:{SERVER_PORT}/list_files')
-        if response.status_code == 200:
-            files = response.json()
+        status_code, files = fetch_files()
+        if status_code == 200:
             logging.info(f"Sending file list to {context.peer()}: {files}")
             return p2p_pb2.ListFilesResponse(files=[p2p_pb2.File(filename=file['filename'], fileurl=file['fileurl']) for file in files])
         else:
@@ -27,32 +271,46 @@ class FileServiceImpl(p2p_pb2_grpc.FileServiceServicer):
 
     def RequestFile(self, request, context):
         logging.info(f"Received RequestFile for '{request.filename}' from {context.peer()}")
-        
-        peer_files_json = f"{request.username}files.json"
-        try:
-            with open(peer_files_json, 'r') as f:
-                peer_files = json.load(f)
-                file_info = next((item for item in peer_files if item['filename'] == request.filename), None)
-                if not file_info:
-                    logging.error(f"File {request.filename} not found in {request.username}'s file list.")
-                    return
-        except FileNotFoundError:
-            logging.error(f"No file list found for {request.username} in {peer_files_json}.")
-            return
-        except Exception as e:
-            logging.error(f"Error reading {request.username}files.json: {e}")
-            return
-        
-        response_content = f"Filename: {file_info['filename']}, FileURL: {file_info['fileurl']}".encode()
-        yield p2p_pb2.FileChunk(content=response_content)
-
-        logging.info(f"Returned file info for '{request.filename}' to {request.username}")
+
+        path = shared_path(request.filename)
+        if not path or not os.path.isfile(path):
+            logging.error(f"File {request.filename} not found in {SHARED_DIR}")
+            context.abort(grpc.StatusCode.NOT_FOUND, "File not found")
+
+        fileurl = shared_fileurl(request.username, request.filename) or request.fileurl
+        with open(path, 'rb') as f, uploads.transfer():
+            stat = os.fstat(f.fileno())
+            size = stat.st_size
+            if request.offset < 0 or request.length < 0 or request.offset > size:
+                context.abort(grpc.StatusCode.OUT_OF_RANGE, f"Range starts past the end of the file ({size} bytes)")
+            end = min(size, request.offset + request.length) if request.length else size
+            file_hash = file_digest(path, stat)
+
+            offset = request.offset
+            chunks = read_chunks(f, offset, end)
+            try:
+                # The first chunk carries the file metadata; the rest are just
+                # the next CHUNK_SIZE bytes of the range, read as they are sent.
+                content = next(chunks, b'')
+                yield p2p_pb2.FileChunk(content=content, filename=request.filename, fileurl=fileurl, size=size,
+                                        offset=offset, checksum=chunk_checksum(content), file_hash=file_hash)
+                offset += len(content)
+                uploads.sent(len(content))
+                for content in chunks:
+                    if not context.is_active():
+                        break
+                    yield p2p_pb2.FileChunk(content=content, offset=offset, checksum=chunk_checksum(content))
+                    offset += len(content)
+                    uploads.sent(len(content))
+            finally:
+                chunks.close()
+
+        logging.info(f"Sent '{request.filename}' bytes {request.offset}-{offset} of {size} to {context.peer()}")
 
     def DiscoverFile(self, request, context):
         logging.info(f"Received DiscoverFile for '{request.filename}' from {context.peer()}")
-        response = requests.post(f'http://{SERVER_URL}:{SERVER_PORT}/discover_file', json={'filename': request.filename})
-        if response.status_code == 200:
-            peers_info = response.json()
+        peers_info = discover_peers(request.filename)
+        if peers_info:
             peer_addresses = [f"{peer['username']} {peer['grpc_url']}:{peer['grpc_port']}" for peer in peers_info]
             peer_addresses_json = json.dumps(peer_addresses) 
             logging.info(f"File '{request.filename}' discovered on peers: {', '.join(peer_addresses)} for {context.peer()}")
@@ -61,20 +319,59 @@ class FileServiceImpl(p2p_pb2_grpc.FileServiceServicer):
             logging.info(f"File '{request.filename}' not found for {context.peer()}")
             context.abort(grpc.StatusCode.NOT_FOUND, "File not found")
 
+    def DiscoverFiles(self, request, context):
+        logging.info(f"Received DiscoverFiles for {len(request.filenames)} files and {len(request.content_hashes)} contents from {context.peer()}")
+        response = discover_all(list(dict.fromkeys(request.filenames)), list(dict.fromkeys(request.content_hashes)))
+        if response is None:
+            logging.error(f"Failed to discover files on the server for {context.peer()}")
+            context.abort(grpc.StatusCode.INTERNAL, "Failed to discover files on the server")
+        return response
+
     def ListAllFiles(self, request, context):
         logging.info(f"Received ListAllFiles request from {context.peer()}")
-        response = requests.get(f'http://{SERVER_URL}:{SERVER_PORT}/list_files')
-        if response.status_code == 200:
-            files = response.json()
+        status_code, files = fetch_files()
+        if status_code == 200:
             logging.info(f"Sending all file list to {context.peer()}: {files}")
             return p2p_pb2.ListAllFilesResponse(files=[p2p_pb2.File(filename=file['filename'], fileurl=file['fileurl']) for file in files])
         else:
             logging.error(f"Failed to retrieve all file list from server for {context.peer()}")
             context.abort(grpc.StatusCode.INTERNAL, "Failed to retrieve all file list from server")
 
+    def Ping(self, request, context):
+        return dht.on_ping(request)
+
+    def FindNode(self, request, context):
+        return dht.on_find_node(request)
+
+    def FindValue(self, request, context):
+        return dht.on_find_value(request)
+
+    def Store(self, request, context):
+        return dht.on_store(request)
+
+    def ListPeers(self, request, context):
+        return view.on_list_peers(request)
+
+    def Shuffle(self, request, context):
+        return view.on_shuffle(request)
+
+
+def start_discovery():
+    # The DHT only runs when discovery goes through it, and then no loads
+    # are fetched from the tracker. The gossiped peer view always runs.
+    view.start(bootstrap_peers)
+    if DISCOVERY_SOURCE == 'dht':
+        dht.start(bootstrap_peers)
+    else:
+        threading.Thread(target=refresh_peer_loads, daemon=True).start()
 
 def serve():
-    server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
+    if CATALOG_REPLICA:
+        catalog.start()
+    threading.Thread(target=log_cache_stats, daemon=True).start()
+    threading.Thread(target=uploads.report, daemon=True).start()
+    start_discovery()
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=GRPC_WORKERS), options=SERVER_OPTIONS)
     p2p_pb2_grpc.add_FileServiceServicer_to_server(FileServiceImpl(), server)
     server.add_insecure_port(f'[::]:{GRPC_PORT}')
     server.start()
@@ -0,0 +1,161 @@
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import threading
+import subprocess
+import multiprocessing
+import requests
+from shards import ShardedTracker, parse_shards
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SERVER_DIR = os.path.join(HERE, '..', 'server')
+
+# Heartbeats carrying a new file are the writes. Discovery asks the shard
+# owning the filename; listings are the reads every shard has to answer.
+COMMON_FILES = 16
+TRAFFIC_MIX = 'heartbeat=0.5,share=0.2,discover=0.2,list_peers=0.1'
+
+def send(tracker, action, username, seed, counter):
+    if action == 'heartbeat':
+        return tracker.post('/heartbeat', {'username': username}).status_code
+    elif action == 'share':
+        return tracker.post('/heartbeat', {'username': username, 'added': [{'filename': f'file{seed}-{counter}.bin', 'fileurl': f'http://{username}/file{seed}-{counter}.bin'}]}).status_code
+    elif action == 'discover':
+        status_code, _ = tracker.post_json('/discover_file', {'filename': f'common{counter % COMMON_FILES}.bin'})
+        return status_code
+    else:
+        status_code, _ = tracker.get_json('/list_peers')
+        return status_code
+
+def parse_mix(spec):
+    return [(action, float(weight)) for action, weight in (item.split('=') for item in spec.split(','))]
+
+def worker(tracker, usernames, deadline, seed, mix, latencies, errors):
+    rng = random.Random(seed)
+    actions, weights = zip(*mix)
+    counter = 0
+    while time.monotonic() < deadline:
+        action = rng.choices(actions, weights)[0]
+        start = time.perf_counter()
+        try:
+            ok = send(tracker, action, rng.choice(usernames), seed, counter) == 200
+        except requests.RequestException:
+            ok = False
+        latencies.append(time.perf_counter() - start)
+        if not ok:
+            errors.append(action)
+        counter += 1
+
+def load_process(spec, usernames, duration, concurrency, seed, mix, results):
+    # One client process with its own routing and connections, so the load
+    # generator is not held back by a single interpreter.
+    tracker = ShardedTracker(parse_shards(spec, concurrency), concurrency)
+    latencies, errors = [], []
+    deadline = time.monotonic() + duration
+    threads = [threading.Thread(target=worker, args=(tracker, usernames, deadline, seed * 1000 + i, mix, latencies, errors))
+               for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    results.put((latencies, len(errors)))
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+def run_load(name, spec, args):
+    usernames = [f'bench{i}' for i in range(args.users)]
+    tracker = ShardedTracker(parse_shards(spec))
+    for username in usernames:
+        tracker.post('/login', {'username': username, 'password': username, 'grpc_url': 'localhost', 'grpc_port': '5001'})
+        tracker.post('/heartbeat', {'username': username, 'added': [{'filename': f'common{i}.bin', 'fileurl': f'http://{username}/common{i}.bin'}
+                                                              for i in range(COMMON_FILES)]})
+
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=load_process, args=(spec, usernames, args.duration, args.concurrency, seed, parse_mix(args.mix), results))
+                 for seed in range(args.processes)]
+    start = time.perf_counter()
+    for process in processes:
+        process.start()
+    latencies, errors = [], 0
+    for _ in processes:
+        process_latencies, process_errors = results.get()
+        latencies += process_latencies
+        errors += process_errors
+    for process in processes:
+        process.join()
+    elapsed = time.perf_counter() - start
+
+    if not latencies:
+        print(f"{name:>10}: no requests completed")
+        return
+    print(f"{name:>10}: {len(latencies)} requests, {errors} errors, {len(latencies) / elapsed:,.0f} req/s, "
+          f"p50 {percentile(latencies, 0.50) * 1000:.1f} ms, p99 {percentile(latencies, 0.99) * 1000:.1f} ms")
+
+def wait_until_up(base_url, timeout=15):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(f'{base_url}/').status_code == 200:
+                return True
+        except requests.ConnectionError:
+            pass
+        time.sleep(0.2)
+    return False
+
+def pin(core):
+    # One core per shard, so adding shards adds CPU instead of sharing it.
+    # Cores are reused once there are more shards than cores.
+    def pin_to_core():
+        if hasattr(os, 'sched_setaffinity'):
+            os.sched_setaffinity(0, {core % (os.cpu_count() or 1)})
+    return pin_to_core
+
+def spawn(script, port, workdir, users, core):
+    env = dict(os.environ, SERVER_URL='localhost', SERVER_PORT=str(port), SERVER_DEBUG='0',
+               TRACKER_USERS=','.join(f'{username}:{username}' for username in users))
+    return subprocess.Popen([sys.executable, os.path.join(SERVER_DIR, script)], cwd=workdir, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, preexec_fn=pin(core))
+
+def main():
+    parser = argparse.ArgumentParser(description="Load generator for a sharded tracker. Without --spec it starts 1, 2 "
+                                                 "and 4 tracker shards in turn on fresh databases and compares the "
+                                                 "throughput of the same client load.")
+    parser.add_argument('--spec', action='append', help="benchmark running shards instead, in TRACKER_SHARDS form (repeatable)")
+    parser.add_argument('--shards', default='1,2,4', help="shard counts to start")
+    parser.add_argument('--server', default='Server.py', help="tracker script (Server.py or AsyncServer.py)")
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--processes', type=int, default=os.cpu_count() or 1, help="client processes")
+    parser.add_argument('--concurrency', type=int, default=16, help="threads per client process")
+    parser.add_argument('--users', type=int, default=200, help="accounts spread over the shards, password equal to username")
+    parser.add_argument('--port', type=int, default=4201)
+    parser.add_argument('--mix', default=TRAFFIC_MIX, help="weights of heartbeat, share, discover and list_peers requests")
+    args = parser.parse_args()
+
+    print(f"{args.processes} x {args.concurrency} concurrent clients for {args.duration:.0f}s per setup, {os.cpu_count()} cores")
+    if args.spec:
+        for spec in args.spec:
+            run_load(spec, spec, args)
+        return
+
+    users = [f'bench{i}' for i in range(args.users)]
+    for count in map(int, args.shards.split(',')):
+        ports = [args.port + i for i in range(count)]
+        processes = [spawn(args.server, port, tempfile.mkdtemp(prefix=f'bench-shards-{port}-'), users, core)
+                     for core, port in enumerate(ports)]
+        try:
+            if not all(wait_until_up(f'http://127.0.0.1:{port}') for port in ports):
+                print(f"{count:>3} shards: a tracker did not start")
+                continue
+            run_load(f'{count} shards', ','.join(f'127.0.0.1:{port}' for port in ports), args)
+        finally:
+            for process in processes:
+                process.terminate()
+                process.wait()
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,151 @@
+import os
+import sys
+import time
+import argparse
+import tempfile
+import threading
+import subprocess
+import grpc
+import p2p_pb2
+import p2p_pb2_grpc
+from channels import ChannelPool
+from swarm import SwarmDownload
+from transfer import BufferPool
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Serving paths of RequestFile, selected in the peer server with SERVE_MMAP.
+MODES = {
+    'read': '0',
+    'mmap': '1',
+}
+
+def rss_kib(pid='self'):
+    with open(f'/proc/{pid}/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+    return 0
+
+class RssSampler:
+    # Polls the resident set size of a process and keeps the largest value
+    # seen, which is what a file-sized buffer would show up in.
+    def __init__(self, pid='self', interval=0.05):
+        self.pid = pid
+        self.interval = interval
+        self.peak = rss_kib(pid)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, rss_kib(self.pid))
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.start = rss_kib(self.pid)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+def make_file(path, size):
+    # Repeats one random block, which is quick to write and still defeats
+    # any compression along the way.
+    block = os.urandom(4 * 1024 * 1024)
+    with open(path, 'wb') as f:
+        written = 0
+        while written < size:
+            f.write(block[:size - written])
+            written += min(len(block), size - written)
+
+def spawn(mode, script, workdir, port):
+    env = dict(os.environ, GRPC_PORT=str(port), SHARED_DIR='shared', SERVE_MMAP=MODES[mode],
+               SERVER_URL='localhost', SERVER_PORT='1', CATALOG_REPLICA='0')
+    return subprocess.Popen([sys.executable, os.path.join(HERE, script)], cwd=workdir, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+def wait_until_up(address, timeout=15):
+    channel = grpc.insecure_channel(address)
+    try:
+        grpc.channel_ready_future(channel).result(timeout=timeout)
+        return True
+    except grpc.FutureTimeoutError:
+        return False
+    finally:
+        channel.close()
+
+def stream(address, filename, size):
+    # Pulls the whole file over one RequestFile call and drops the chunks,
+    # so only the serving side is measured.
+    with grpc.insecure_channel(address) as channel:
+        stub = p2p_pb2_grpc.FileServiceStub(channel)
+        received = 0
+        for chunk in stub.RequestFile(p2p_pb2.RequestFileRequest(filename=filename)):
+            received += len(chunk.content)
+    if received != size:
+        raise RuntimeError(f"received {received} of {size} bytes")
+
+def swarm(address, filename, connections, workdir):
+    # Downloads through the swarm, one worker per connection, into a file
+    # on disk, so the pooled piece buffers are what the client holds.
+    host, port = address.rsplit(':', 1)
+    peers = [{'username': f'bench{i}', 'grpc_url': host, 'grpc_port': port} for i in range(connections)]
+    path = os.path.join(workdir, 'download.bin')
+    channels = ChannelPool()
+    try:
+        SwarmDownload(filename, '', peers, path, channels, buffers=BufferPool()).run()
+    finally:
+        channels.close()
+        os.remove(path)
+
+def report(name, size, elapsed, server, client):
+    print(f"{name:>12}: {size / elapsed / 1e6:8.1f} MB/s, server RSS peak {server.peak / 1024:7.1f} MiB "
+          f"(+{(server.peak - server.start) / 1024:.1f}), client RSS peak {client.peak / 1024:7.1f} MiB "
+          f"(+{(client.peak - client.start) / 1024:.1f})")
+
+def run_mode(mode, args, workdir, size):
+    address = f'localhost:{args.port}'
+    process = spawn(mode, args.server, workdir, args.port)
+    try:
+        if not wait_until_up(address):
+            print(f"{mode:>12}: peer server did not start")
+            return
+        for name, transfer in (('stream', lambda: stream(address, 'bench.bin', size)),
+                               ('swarm', lambda: swarm(address, 'bench.bin', args.connections, workdir))):
+            with RssSampler(process.pid) as server, RssSampler() as client:
+                start = time.perf_counter()
+                transfer()
+                elapsed = time.perf_counter() - start
+            report(f'{mode}/{name}', size, elapsed, server, client)
+    finally:
+        process.terminate()
+        process.wait()
+
+def main():
+    parser = argparse.ArgumentParser(description="Serves one large file from a peer server with plain reads and "
+                                                 "with memory-mapped windows, and reports throughput and peak RSS "
+                                                 "of both sides for a single stream and for a swarm download.")
+    parser.add_argument('--size', type=int, default=1024, help="file size in MiB")
+    parser.add_argument('--connections', type=int, default=4, help="parallel connections of the swarm download")
+    parser.add_argument('--server', default='Pserver.py', help="peer server script (Pserver.py or AsyncPserver.py)")
+    parser.add_argument('--mode', action='append', choices=list(MODES), help="serving path to measure (repeatable)")
+    parser.add_argument('--port', type=int, default=5301)
+    args = parser.parse_args()
+
+    size = args.size * 1024 * 1024
+    workdir = tempfile.mkdtemp(prefix='bench-transfer-')
+    os.makedirs(os.path.join(workdir, 'shared'))
+    path = os.path.join(workdir, 'shared', 'bench.bin')
+    print(f"Writing a {args.size} MiB file to {workdir}")
+    make_file(path, size)
+    try:
+        for mode in args.mode or MODES:
+            run_mode(mode, args, workdir, size)
+    finally:
+        os.remove(path)
+
+if __name__ == '__main__':
+    sys.exit(main())
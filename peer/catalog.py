@@ -0,0 +1,172 @@
+import json
+import time
+import logging
+import threading
+import requests
+
+CATALOG_RETRY_DELAY = 2
+CATALOG_MAX_RETRY_DELAY = 30
+SUBSCRIBE_READ_TIMEOUT = 45
+
+
+class CatalogReplica:
+    # Local copy of the tracker catalog: a snapshot from /catalog kept up to
+    # date by the /subscribe event stream. While it is in sync, listings and
+    # discovery are answered from memory instead of a round trip to the
+    # tracker.
+    def __init__(self, tracker):
+        self.tracker = tracker
+        self.version = 0
+        self._lock = threading.Lock()
+        self._peers = {}
+        self._holders = {}
+        self._contents = {}
+        self._synced = threading.Event()
+        self._thread = None
+
+    @property
+    def ready(self):
+        return self._synced.is_set()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def wait_ready(self, timeout):
+        return self._synced.wait(timeout)
+
+    def _run(self):
+        delay = CATALOG_RETRY_DELAY
+        while True:
+            try:
+                self._load_snapshot()
+                self._follow()
+                delay = CATALOG_RETRY_DELAY
+            except (requests.RequestException, ValueError) as e:
+                logging.warning(f"Catalog replica out of sync, retrying in {delay}s: {e}")
+                self._synced.clear()
+                time.sleep(delay)
+                delay = min(delay * 2, CATALOG_MAX_RETRY_DELAY)
+            self._synced.clear()
+
+    def _load_snapshot(self):
+        response = self.tracker.session.get(self.tracker.url('/catalog'), timeout=30)
+        response.raise_for_status()
+        snapshot = response.json()
+        peers, holders, contents = {}, {}, {}
+        for peer in snapshot['peers']:
+            peers[peer['username']] = {
+                'username': peer['username'],
+                'grpc_url': peer['grpc_url'],
+                'grpc_port': peer['grpc_port'],
+                'status': peer['status'],
+            }
+            for file in peer['files']:
+                content_hash = file.get('content_hash')
+                holders.setdefault(file['filename'], {})[peer['username']] = {'fileurl': file['fileurl'], 'content_hash': content_hash}
+                if content_hash:
+                    contents.setdefault(content_hash, {}).setdefault(peer['username'], file['filename'])
+        with self._lock:
+            self._peers, self._holders, self._contents, self.version = peers, holders, contents, snapshot['version']
+
+    def _follow(self):
+        # Reads the event stream until the tracker asks for a resync (reset)
+        # or the connection drops. Resuming is done by a fresh snapshot.
+        response = self.tracker.session.get(self.tracker.url('/subscribe'), params={'since': self.version},
+                                            stream=True, timeout=(5, SUBSCRIBE_READ_TIMEOUT))
+        response.raise_for_status()
+        self._synced.set()
+        event, data = None, []
+        with response:
+            for line in response.iter_lines(decode_unicode=True):
+                if line:
+                    field, _, value = line.partition(':')
+                    if field == 'event':
+                        event = value.strip()
+                    elif field == 'data':
+                        data.append(value.strip())
+                    continue
+                if event == 'reset':
+                    return
+                if data:
+                    self._apply(event, json.loads('\n'.join(data)))
+                event, data = None, []
+
+    def _apply(self, kind, change):
+        username = change['username']
+        with self._lock:
+            if kind == 'peer':
+                self._peers[username] = {
+                    'username': username,
+                    'grpc_url': change['grpc_url'],
+                    'grpc_port': change['grpc_port'],
+                    'status': change['status'],
+                }
+            elif kind == 'file_added':
+                self._forget_content(username, change['filename'])
+                self._holders.setdefault(change['filename'], {})[username] = {'fileurl': change['fileurl'], 'content_hash': change.get('content_hash')}
+                if change.get('content_hash'):
+                    self._contents.setdefault(change['content_hash'], {}).setdefault(username, change['filename'])
+            elif kind == 'file_removed':
+                self._forget_content(username, change['filename'])
+                holders = self._holders.get(change['filename'], {})
+                holders.pop(username, None)
+                if not holders:
+                    self._holders.pop(change['filename'], None)
+            self.version = change['version']
+
+    def _forget_content(self, username, filename):
+        file = self._holders.get(filename, {}).get(username)
+        if not file or not file['content_hash']:
+            return
+        names = self._contents.get(file['content_hash'], {})
+        if names.get(username) != filename:
+            return
+        # The peer may still hold the same content under another name.
+        other = next((name for name, holders in self._holders.items()
+                      if name != filename and holders.get(username, {}).get('content_hash') == file['content_hash']), None)
+        if other:
+            names[username] = other
+        else:
+            names.pop(username, None)
+            if not names:
+                self._contents.pop(file['content_hash'], None)
+
+    def _is_active(self, username):
+        peer = self._peers.get(username)
+        return peer is not None and peer['status'] == 'active'
+
+    def list_peers(self):
+        with self._lock:
+            files_per_peer = {}
+            for holders in self._holders.values():
+                for username in holders:
+                    files_per_peer[username] = files_per_peer.get(username, 0) + 1
+            return [dict(peer, num_files=files_per_peer.get(peer['username'], 0))
+                    for peer in self._peers.values() if peer['status'] == 'active']
+
+    def list_files(self):
+        with self._lock:
+            files = []
+            for filename, holders in self._holders.items():
+                active = [username for username in holders if self._is_active(username)]
+                if active:
+                    files.append({'filename': filename, 'fileurl': holders[active[0]]['fileurl'], 'count': len(active)})
+            return files
+
+    def _located(self, username, filename, content_hash):
+        peer = self._peers[username]
+        return {'username': username, 'grpc_url': peer['grpc_url'], 'grpc_port': peer['grpc_port'],
+                'filename': filename, 'content_hash': content_hash}
+
+    def discover(self, filename):
+        with self._lock:
+            return [self._located(username, filename, file['content_hash'])
+                    for username, file in self._holders.get(filename, {}).items() if self._is_active(username)]
+
+    def discover_content(self, content_hash):
+        with self._lock:
+            return [self._located(username, filename, content_hash)
+                    for username, filename in self._contents.get(content_hash, {}).items() if self._is_active(username)]
@@ -0,0 +1,111 @@
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+import grpc
+import p2p_pb2_grpc
+
+CHANNEL_POOL_SIZE = int(os.getenv('CHANNEL_POOL_SIZE', '32'))
+CHANNEL_IDLE_TIMEOUT = float(os.getenv('CHANNEL_IDLE_TIMEOUT', '300'))
+CHANNEL_KEEPALIVE_MS = int(os.getenv('CHANNEL_KEEPALIVE_MS', '30000'))
+
+CHANNEL_OPTIONS = [
+    ('grpc.keepalive_time_ms', CHANNEL_KEEPALIVE_MS),
+    ('grpc.keepalive_timeout_ms', 10000),
+    ('grpc.keepalive_permit_without_calls', 1),
+    ('grpc.http2.max_pings_without_data', 0),
+]
+# Peer servers must accept those pings on idle connections, or they answer
+# them with a GOAWAY (too_many_pings) and pooled channels keep reconnecting.
+# Half the client interval leaves room for pings that arrive a bit early.
+SERVER_OPTIONS = [
+    ('grpc.keepalive_permit_without_calls', 1),
+    ('grpc.http2.min_ping_interval_without_data_ms', CHANNEL_KEEPALIVE_MS // 2),
+]
+
+UNHEALTHY_STATES = (grpc.ChannelConnectivity.TRANSIENT_FAILURE, grpc.ChannelConnectivity.SHUTDOWN)
+
+
+class PooledChannel:
+    def __init__(self, address):
+        self.address = address
+        self.channel = grpc.insecure_channel(address, options=CHANNEL_OPTIONS)
+        self.stub = p2p_pb2_grpc.FileServiceStub(self.channel)
+        self.state = grpc.ChannelConnectivity.IDLE
+        self.last_used = time.monotonic()
+        self.in_use = 0
+        self.channel.subscribe(self._on_state, try_to_connect=False)
+
+    def _on_state(self, state):
+        self.state = state
+
+    @property
+    def healthy(self):
+        return self.state not in UNHEALTHY_STATES
+
+    def close(self):
+        self.channel.unsubscribe(self._on_state)
+        self.channel.close()
+
+
+class ChannelPool:
+    # Keeps one HTTP/2 connection per peer address open between calls, with
+    # keepalive pings so idle connections are not silently dropped. Channels
+    # are replaced once they report a failed connection, closed after
+    # CHANNEL_IDLE_TIMEOUT seconds without use, and the least recently used
+    # ones are closed when more than CHANNEL_POOL_SIZE are open. Channels
+    # with calls in progress are never closed.
+    def __init__(self, max_size=CHANNEL_POOL_SIZE, idle_timeout=CHANNEL_IDLE_TIMEOUT):
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self._lock = threading.Lock()
+        self._channels = OrderedDict()
+
+    @contextmanager
+    def stub(self, address):
+        entry = self._acquire(address)
+        try:
+            yield entry.stub
+        finally:
+            with self._lock:
+                entry.in_use -= 1
+                entry.last_used = time.monotonic()
+                self._evict()
+
+    def _acquire(self, address):
+        with self._lock:
+            entry = self._channels.get(address)
+            if entry is not None and not entry.healthy and not entry.in_use:
+                logging.info(f"Replacing channel to {address} ({entry.state.name})")
+                self._discard(address)
+                entry = None
+            if entry is None:
+                entry = PooledChannel(address)
+                self._channels[address] = entry
+            self._channels.move_to_end(address)
+            entry.in_use += 1
+            entry.last_used = time.monotonic()
+            self._evict()
+            return entry
+
+    def _evict(self):
+        now = time.monotonic()
+        idle = [address for address, entry in self._channels.items()
+                if not entry.in_use and now - entry.last_used > self.idle_timeout]
+        for address in idle:
+            self._discard(address)
+        for address in list(self._channels):
+            if len(self._channels) <= self.max_size:
+                break
+            if not self._channels[address].in_use:
+                self._discard(address)
+
+    def _discard(self, address):
+        self._channels.pop(address).close()
+
+    def close(self):
+        with self._lock:
+            for address in list(self._channels):
+                self._discard(address)
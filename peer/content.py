@@ -0,0 +1,37 @@
+import os
+import hashlib
+from transfer import hash_buffers, read_pieces
+
+PIECE_SIZE = int(os.getenv('PIECE_SIZE', str(1024 * 1024)))
+
+
+def describe_file(path, piece_size=PIECE_SIZE):
+    # Content identity of a shared file: the SHA-256 of the whole file plus
+    # one SHA-256 per piece, so a download can verify each piece as it
+    # arrives. mtime_ns and size let callers reuse it until the file changes.
+    digest = hashlib.sha256()
+    piece_hashes = []
+    with open(path, 'rb') as f, hash_buffers.buffer(piece_size) as buffer:
+        stat = os.fstat(f.fileno())
+        for piece in read_pieces(f, memoryview(buffer)[:piece_size]):
+            digest.update(piece)
+            piece_hashes.append(hashlib.sha256(piece).hexdigest())
+    return {
+        'content_hash': digest.hexdigest(),
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'piece_size': piece_size,
+        'piece_hashes': piece_hashes,
+    }
+
+
+def cached_description(entry, path):
+    # Reuses the description stored with a registry entry while the file on
+    # disk still has the same size and mtime.
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    if entry and entry.get('mtime_ns') == stat.st_mtime_ns and entry.get('size') == stat.st_size and entry.get('content_hash'):
+        return {key: entry[key] for key in ('content_hash', 'size', 'mtime_ns', 'piece_size', 'piece_hashes')}
+    return describe_file(path)
@@ -0,0 +1,346 @@
+import os
+import random
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import grpc
+import p2p_pb2
+
+DHT_K = int(os.getenv('DHT_K', '20'))
+DHT_ALPHA = int(os.getenv('DHT_ALPHA', '3'))
+DHT_RPC_TIMEOUT = float(os.getenv('DHT_RPC_TIMEOUT', '2'))
+DHT_RECORD_TTL = int(os.getenv('DHT_RECORD_TTL', '3600'))
+DHT_REPUBLISH_INTERVAL = float(os.getenv('DHT_REPUBLISH_INTERVAL', str(DHT_RECORD_TTL / 3)))
+DHT_REFRESH_INTERVAL = float(os.getenv('DHT_REFRESH_INTERVAL', '600'))
+# Peer addresses to join through, separated by commas. Without them the
+# peer server asks the tracker for active peers.
+DHT_BOOTSTRAP = os.getenv('DHT_BOOTSTRAP', '')
+DHT_MAX_PROVIDERS = 100
+DHT_PARALLEL_LOOKUPS = 8
+# How long an empty routing table waits before bootstrapping again,
+# doubling after each failed attempt up to DHT_MAX_RETRY_INTERVAL.
+DHT_RETRY_INTERVAL = 5
+DHT_MAX_RETRY_INTERVAL = float(os.getenv('DHT_MAX_RETRY_INTERVAL', '300'))
+ID_BITS = 160
+
+
+def make_id(value):
+    return int.from_bytes(hashlib.sha1(value.encode()).digest(), 'big')
+
+
+def key_for(kind, value):
+    # Files are published under their name and under their content hash.
+    return make_id(f'{kind}:{value}')
+
+
+def id_bytes(node_id):
+    return node_id.to_bytes(ID_BITS // 8, 'big')
+
+
+def provider_info(provider):
+    return p2p_pb2.PeerInfo(username=provider['username'], grpc_url=provider['grpc_url'], grpc_port=str(provider['grpc_port']),
+                            filename=provider['filename'], content_hash=provider.get('content_hash') or '')
+
+
+def provider_dict(info):
+    return {'username': info.username, 'grpc_url': info.grpc_url, 'grpc_port': info.grpc_port,
+            'filename': info.filename, 'content_hash': info.content_hash or None}
+
+
+class RoutingTable:
+    # Kademlia k-buckets: bucket i holds up to DHT_K contacts whose XOR
+    # distance from this node has bit length i + 1, least recently seen
+    # first. A full bucket keeps its old contacts, which have proven to stay
+    # up, and parks newcomers in a replacement cache; a contact that fails
+    # an RPC is dropped and the newest replacement takes its place.
+    def __init__(self, node_id, k=DHT_K):
+        self.node_id = node_id
+        self.k = k
+        self._lock = threading.Lock()
+        self._buckets = [OrderedDict() for _ in range(ID_BITS)]
+        self._replacements = [OrderedDict() for _ in range(ID_BITS)]
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(bucket) for bucket in self._buckets)
+
+    def _index(self, node_id):
+        return (self.node_id ^ node_id).bit_length() - 1
+
+    def update(self, node_id, address):
+        if node_id == self.node_id:
+            return
+        index = self._index(node_id)
+        with self._lock:
+            bucket = self._buckets[index]
+            if node_id in bucket or len(bucket) < self.k:
+                bucket[node_id] = address
+                bucket.move_to_end(node_id)
+                return
+            replacements = self._replacements[index]
+            replacements[node_id] = address
+            replacements.move_to_end(node_id)
+            if len(replacements) > self.k:
+                replacements.popitem(last=False)
+
+    def remove(self, node_id):
+        if node_id == self.node_id:
+            return
+        index = self._index(node_id)
+        with self._lock:
+            bucket = self._buckets[index]
+            if bucket.pop(node_id, None) is not None and self._replacements[index]:
+                replacement, address = self._replacements[index].popitem()
+                bucket[replacement] = address
+
+    def closest(self, target, count=DHT_K):
+        with self._lock:
+            contacts = [contact for bucket in self._buckets for contact in bucket.items()]
+        return sorted(contacts, key=lambda contact: contact[0] ^ target)[:count]
+
+
+class RecordStore:
+    # Provider records this node holds for other peers, keyed by DHT key and
+    # then by (username, filename). Records expire unless republished.
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._records = {}
+
+    def put(self, key, providers, ttl):
+        expires = time.monotonic() + min(ttl, DHT_RECORD_TTL)
+        with self._lock:
+            records = self._records.setdefault(key, {})
+            for provider in providers:
+                records[(provider['username'], provider['filename'])] = (provider, expires)
+            if len(records) > DHT_MAX_PROVIDERS:
+                for name in sorted(records, key=lambda name: records[name][1])[:len(records) - DHT_MAX_PROVIDERS]:
+                    del records[name]
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            return [provider for provider, expires in self._records.get(key, {}).values() if expires > now]
+
+    def expire(self):
+        now = time.monotonic()
+        with self._lock:
+            for key in list(self._records):
+                records = self._records[key]
+                for name in [name for name, (_, expires) in records.items() if expires <= now]:
+                    del records[name]
+                if not records:
+                    del self._records[key]
+
+
+class DHTNode:
+    # A Kademlia node over the FileService gRPC API. Keys and node ids share
+    # one 160-bit space (node ids hash the node's address), and lookups ask
+    # the DHT_ALPHA closest contacts not asked yet in parallel, round after
+    # round, until the DHT_K closest known nodes have all answered.
+    #
+    # Values are provider records: who shares a file under which name. They
+    # are stored on the DHT_K nodes closest to the key, republished every
+    # DHT_REPUBLISH_INTERVAL and dropped DHT_RECORD_TTL seconds after the
+    # last store. A node without an address (the peer client) can look up
+    # and publish but is never added to anyone's routing table.
+    def __init__(self, address, channels):
+        self.address = address
+        self.node_id = make_id(address) if address else random.getrandbits(ID_BITS)
+        self.channels = channels
+        self.table = RoutingTable(self.node_id)
+        self.store = RecordStore()
+        self._published = {}
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._rpcs = ThreadPoolExecutor(max_workers=DHT_ALPHA * DHT_PARALLEL_LOOKUPS, thread_name_prefix='dht-rpc')
+        self._lookups = ThreadPoolExecutor(max_workers=DHT_PARALLEL_LOOKUPS, thread_name_prefix='dht-lookup')
+
+    def _sender(self):
+        return {'sender': p2p_pb2.Node(node_id=id_bytes(self.node_id), address=self.address)} if self.address else {}
+
+    def _seen(self, request):
+        if request.HasField('sender') and len(request.sender.node_id) == ID_BITS // 8 and request.sender.address:
+            self.table.update(int.from_bytes(request.sender.node_id, 'big'), request.sender.address)
+
+    def _nodes(self, target):
+        return [p2p_pb2.Node(node_id=id_bytes(node_id), address=address) for node_id, address in self.table.closest(target)]
+
+    # Server side, called by the FileService handlers.
+
+    def on_ping(self, request):
+        self._seen(request)
+        return p2p_pb2.PingResponse(node=p2p_pb2.Node(node_id=id_bytes(self.node_id), address=self.address or ''))
+
+    def on_find_node(self, request):
+        self._seen(request)
+        return p2p_pb2.FindNodeResponse(nodes=self._nodes(int.from_bytes(request.target, 'big')))
+
+    def on_find_value(self, request):
+        self._seen(request)
+        key = int.from_bytes(request.key, 'big')
+        return p2p_pb2.FindValueResponse(nodes=self._nodes(key), providers=[provider_info(provider) for provider in self.store.get(key)])
+
+    def on_store(self, request):
+        self._seen(request)
+        self.store.put(int.from_bytes(request.key, 'big'), [provider_dict(info) for info in request.providers],
+                       request.ttl or DHT_RECORD_TTL)
+        return p2p_pb2.StoreResponse()
+
+    # Client side.
+
+    def _call(self, address, method, request):
+        try:
+            with self.channels.stub(address) as stub:
+                return getattr(stub, method)(request, timeout=DHT_RPC_TIMEOUT)
+        except grpc.RpcError:
+            return None
+
+    def ping(self, address):
+        reply = self._call(address, 'Ping', p2p_pb2.PingRequest(**self._sender()))
+        if reply is None or len(reply.node.node_id) != ID_BITS // 8:
+            return None
+        node_id = int.from_bytes(reply.node.node_id, 'big')
+        self.table.update(node_id, address)
+        return node_id
+
+    def bootstrap(self, addresses):
+        addresses = [address for address in addresses if address != self.address]
+        if not addresses:
+            return False
+        joined = [node_id for node_id in self._rpcs.map(self.ping, addresses) if node_id is not None]
+        if joined:
+            # Looking up our own id fills the buckets near us and tells the
+            # nodes there about us.
+            self.lookup(self.node_id)
+            logging.info(f"Joined the DHT through {len(joined)} of {len(addresses)} peers, {len(self.table)} contacts")
+        return bool(joined)
+
+    def _query(self, contact, target, find_value):
+        node_id, address = contact
+        if find_value:
+            return self._call(address, 'FindValue', p2p_pb2.FindValueRequest(key=id_bytes(target), **self._sender()))
+        return self._call(address, 'FindNode', p2p_pb2.FindNodeRequest(target=id_bytes(target), **self._sender()))
+
+    def lookup(self, target, find_value=False):
+        # Returns the closest nodes that answered, nearest first, and with
+        # find_value the providers found, stopping after the first round
+        # that found any.
+        shortlist = dict(self.table.closest(target))
+        queried = set()
+        answered = {}
+        providers = {}
+        empty_handed = []
+        while not providers:
+            nearest = sorted(shortlist, key=lambda node_id: node_id ^ target)[:DHT_K]
+            batch = [(node_id, shortlist[node_id]) for node_id in nearest if node_id not in queried][:DHT_ALPHA]
+            if not batch:
+                break
+            queried.update(node_id for node_id, _ in batch)
+            replies = self._rpcs.map(lambda contact: self._query(contact, target, find_value), batch)
+            for (node_id, address), reply in zip(batch, replies):
+                if reply is None:
+                    self.table.remove(node_id)
+                    del shortlist[node_id]
+                    continue
+                self.table.update(node_id, address)
+                answered[node_id] = address
+                for node in reply.nodes:
+                    contact_id = int.from_bytes(node.node_id, 'big')
+                    if contact_id != self.node_id and node.address and node.address != self.address:
+                        shortlist.setdefault(contact_id, node.address)
+                if find_value and reply.providers:
+                    for info in reply.providers:
+                        providers[(info.username, info.filename)] = provider_dict(info)
+                elif find_value:
+                    empty_handed.append(node_id)
+
+        if providers and empty_handed:
+            # Caching on the closest node that had nothing spreads the load of
+            # popular keys over the nodes lookups pass through on their way.
+            cache_id = min(empty_handed, key=lambda node_id: node_id ^ target)
+            self._rpcs.submit(self._call, answered[cache_id], 'Store',
+                              p2p_pb2.StoreRequest(key=id_bytes(target), ttl=DHT_RECORD_TTL // 4,
+                                                   providers=[provider_info(provider) for provider in providers.values()], **self._sender()))
+        closest = sorted(answered.items(), key=lambda contact: contact[0] ^ target)[:DHT_K]
+        return closest, list(providers.values())
+
+    def find_providers(self, key):
+        _, providers = self.lookup(key, find_value=True)
+        local = self.store.get(key)
+        if local:
+            found = {(provider['username'], provider['filename']): provider for provider in providers}
+            found.update(((provider['username'], provider['filename']), provider) for provider in local)
+            providers = list(found.values())
+        return providers
+
+    def find_all(self, keys):
+        return dict(zip(keys, self._lookups.map(self.find_providers, keys)))
+
+    def publish(self, key, providers):
+        # Returns how many nodes, this one included, took the records.
+        closest, _ = self.lookup(key)
+        local = bool(self.address) and (len(closest) < DHT_K or key ^ self.node_id < key ^ closest[-1][0])
+        if local:
+            self.store.put(key, providers, DHT_RECORD_TTL)
+        request = p2p_pb2.StoreRequest(key=id_bytes(key), ttl=DHT_RECORD_TTL,
+                                       providers=[provider_info(provider) for provider in providers], **self._sender())
+        return local + sum(reply is not None for reply in self._rpcs.map(lambda contact: self._call(contact[1], 'Store', request), closest))
+
+    def announce(self, key, provider):
+        # Publishes from the maintenance thread, now and on every republish.
+        with self._lock:
+            self._published.setdefault(key, {})[(provider['username'], provider['filename'])] = provider
+            self._pending.add(key)
+        self._wake.set()
+
+    def withdraw(self, key, username, filename):
+        # Stops republishing; copies already stored expire on their own.
+        with self._lock:
+            providers = self._published.get(key, {})
+            providers.pop((username, filename), None)
+            if not providers:
+                self._published.pop(key, None)
+                self._pending.discard(key)
+
+    def start(self, seeds):
+        # seeds returns the addresses to bootstrap from; it is called again
+        # whenever the routing table is empty.
+        threading.Thread(target=self._run, args=(seeds,), daemon=True, name='dht').start()
+        return self
+
+    def _run(self, seeds):
+        refreshed = republished = time.monotonic()
+        retry = DHT_RETRY_INTERVAL
+        while True:
+            self._wake.clear()
+            delay = DHT_RETRY_INTERVAL
+            try:
+                if not len(self.table) and not self.bootstrap(seeds()):
+                    # Backing off keeps a lone peer from asking the tracker
+                    # for seeds every few seconds.
+                    delay, retry = retry, min(DHT_MAX_RETRY_INTERVAL, retry * 2)
+                if len(self.table):
+                    retry = DHT_RETRY_INTERVAL
+                    now = time.monotonic()
+                    if now - refreshed >= DHT_REFRESH_INTERVAL:
+                        # A random id keeps far buckets fresh as well as near ones.
+                        self.lookup(random.getrandbits(ID_BITS))
+                        refreshed = now
+                    with self._lock:
+                        if now - republished >= DHT_REPUBLISH_INTERVAL:
+                            self._pending.update(self._published)
+                            republished = now
+                        pending = {key: list(self._published[key].values()) for key in self._pending if key in self._published}
+                        self._pending.clear()
+                    for key, providers in pending.items():
+                        if not self.publish(key, providers):
+                            with self._lock:
+                                self._pending.add(key)
+                self.store.expire()
+            except Exception as e:
+                logging.error(f"DHT maintenance failed: {e}")
+            self._wake.wait(delay)
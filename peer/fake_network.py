@@ -0,0 +1,36 @@
+from contextlib import contextmanager
+import grpc
+
+
+class Unreachable(grpc.RpcError):
+    pass
+
+
+class FakeNetwork:
+    # Stands in for the ChannelPool in tests: a stub calls the handlers of
+    # the DHT node or peer view registered under its address, and an
+    # address with nothing registered fails like a peer that is down.
+    HANDLERS = {'Ping': 'on_ping', 'FindNode': 'on_find_node', 'FindValue': 'on_find_value', 'Store': 'on_store',
+                'Shuffle': 'on_shuffle', 'ListPeers': 'on_list_peers'}
+
+    def __init__(self):
+        self.nodes = {}
+
+    @contextmanager
+    def stub(self, address):
+        yield FakeStub(self, address)
+
+    def call(self, address, method, request):
+        node = self.nodes.get(address)
+        if node is None:
+            raise Unreachable()
+        return getattr(node, self.HANDLERS[method])(request)
+
+
+class FakeStub:
+    def __init__(self, network, address):
+        self.network = network
+        self.address = address
+
+    def __getattr__(self, method):
+        return lambda request, timeout=None: self.network.call(self.address, method, request)
@@ -0,0 +1,122 @@
+import os
+import random
+import logging
+import threading
+import time
+import grpc
+import p2p_pb2
+
+GOSSIP_VIEW_SIZE = int(os.getenv('GOSSIP_VIEW_SIZE', '20'))
+GOSSIP_SHUFFLE_LENGTH = int(os.getenv('GOSSIP_SHUFFLE_LENGTH', '5'))
+GOSSIP_INTERVAL = float(os.getenv('GOSSIP_INTERVAL', '10'))
+GOSSIP_RPC_TIMEOUT = float(os.getenv('GOSSIP_RPC_TIMEOUT', '2'))
+# Longest wait between attempts to seed an empty view, doubled from
+# GOSSIP_INTERVAL after each attempt that finds no one.
+GOSSIP_MAX_BACKOFF = float(os.getenv('GOSSIP_MAX_BACKOFF', '300'))
+GOSSIP_JITTER = 0.2
+
+
+class PartialView:
+    # Cyclon peer sampling: each peer knows at most GOSSIP_VIEW_SIZE others,
+    # each with the time its descriptor was created by that peer. Every
+    # GOSSIP_INTERVAL the oldest entry is taken out of the view and sent a
+    # fresh descriptor of this peer plus GOSSIP_SHUFFLE_LENGTH - 1 random
+    # entries, and it answers with as many of its own. Both sides keep what
+    # they did not know, first in free slots and then in place of what they
+    # sent. A peer that does not answer has already left the view, so dead
+    # peers are dropped after one missed shuffle and descriptors of live
+    # ones keep being refreshed by their owners.
+    #
+    # Ages travel in seconds rather than as timestamps, so peers need no
+    # synchronized clocks.
+    def __init__(self, address, channels, size=GOSSIP_VIEW_SIZE, shuffle_length=GOSSIP_SHUFFLE_LENGTH):
+        self.address = address
+        self.channels = channels
+        self.size = size
+        self.shuffle_length = shuffle_length
+        self._lock = threading.Lock()
+        self._view = {}
+
+    def _descriptors(self, addresses):
+        now = time.monotonic()
+        return [p2p_pb2.PeerDescriptor(peerAddress=address, age=now - self._view[address]) for address in addresses]
+
+    def _merge(self, descriptors, sent):
+        now = time.monotonic()
+        replaceable = [address for address in sent if address in self._view]
+        for descriptor in descriptors:
+            address = descriptor.peerAddress
+            if not address or address == self.address:
+                continue
+            created = now - max(descriptor.age, 0)
+            if address in self._view:
+                self._view[address] = max(self._view[address], created)
+            elif len(self._view) < self.size:
+                self._view[address] = created
+            elif replaceable:
+                del self._view[replaceable.pop()]
+                self._view[address] = created
+
+    def add(self, addresses):
+        now = time.monotonic()
+        with self._lock:
+            for address in addresses:
+                if address != self.address and address not in self._view and len(self._view) < self.size:
+                    self._view[address] = now
+
+    def peers(self):
+        # Freshest first.
+        with self._lock:
+            return self._descriptors(sorted(self._view, key=self._view.get, reverse=True))
+
+    def __len__(self):
+        with self._lock:
+            return len(self._view)
+
+    def shuffle(self):
+        with self._lock:
+            if not self._view:
+                return False
+            target = min(self._view, key=self._view.get)
+            del self._view[target]
+            sent = random.sample(list(self._view), min(self.shuffle_length - 1, len(self._view)))
+            request = p2p_pb2.ShuffleRequest(peers=[p2p_pb2.PeerDescriptor(peerAddress=self.address, age=0)] + self._descriptors(sent))
+        try:
+            with self.channels.stub(target) as stub:
+                reply = stub.Shuffle(request, timeout=GOSSIP_RPC_TIMEOUT)
+        except grpc.RpcError:
+            logging.info(f"Dropped {target} from the peer view, it did not answer a shuffle")
+            return False
+        with self._lock:
+            self._merge(reply.peers, sent)
+        return True
+
+    def on_shuffle(self, request):
+        with self._lock:
+            sent = random.sample(list(self._view), min(self.shuffle_length, len(self._view)))
+            reply = p2p_pb2.ShuffleResponse(peers=self._descriptors(sent))
+            self._merge(request.peers, sent)
+        return reply
+
+    def on_list_peers(self, request):
+        return p2p_pb2.ListPeersResponse(peers=self.peers())
+
+    def start(self, seeds):
+        # seeds returns addresses to start from; it is called again whenever
+        # the view runs empty.
+        threading.Thread(target=self._run, args=(seeds,), daemon=True, name='gossip').start()
+        return self
+
+    def _run(self, seeds):
+        delay = GOSSIP_INTERVAL
+        while True:
+            try:
+                if not len(self):
+                    self.add(seeds())
+                if self.shuffle():
+                    delay = GOSSIP_INTERVAL
+                elif not len(self):
+                    delay = min(GOSSIP_MAX_BACKOFF, delay * 2)
+            except Exception as e:
+                logging.error(f"Gossip round failed: {e}")
+            time.sleep(delay * random.uniform(1 - GOSSIP_JITTER, 1 + GOSSIP_JITTER))
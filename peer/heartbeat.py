@@ -0,0 +1,138 @@
+import os
+import random
+import logging
+import threading
+import requests
+
+# Used until the tracker answers with its own interval.
+HEARTBEAT_INTERVAL = float(os.getenv('HEARTBEAT_INTERVAL', '4'))
+HEARTBEAT_JITTER = float(os.getenv('HEARTBEAT_JITTER', '0.2'))
+HEARTBEAT_RETRY = float(os.getenv('HEARTBEAT_RETRY', '1'))
+HEARTBEAT_MAX_BACKOFF = float(os.getenv('HEARTBEAT_MAX_BACKOFF', '60'))
+HEARTBEAT_REQUEST_TIMEOUT = float(os.getenv('HEARTBEAT_REQUEST_TIMEOUT', '5'))
+
+
+class Heartbeat:
+    # Keeps the peer alive on the tracker from a background thread, over the
+    # tracker client's keep-alive session. The tracker says how often to
+    # beat, and every wait is stretched or shortened by up to HEARTBEAT_JITTER
+    # so peers started together drift apart instead of hitting the tracker
+    # in step. A failed beat is retried after HEARTBEAT_RETRY seconds,
+    # doubling up to HEARTBEAT_MAX_BACKOFF. A tracker that no longer knows
+    # the peer gets a fresh login followed by the full file list.
+    #
+    # Files added and removed since the last acknowledged beat ride along
+    # with the next one, together with the peer's load, so sharing a file
+    # needs no request of its own.
+    def __init__(self, tracker, username, login, files, load=None):
+        self.tracker = tracker
+        self.username = username
+        self.login = login
+        self.files = files
+        self.load = load
+        self.interval = HEARTBEAT_INTERVAL
+        self._lock = threading.Condition()
+        self._added = {}
+        self._removed = set()
+        self._started = 0
+        self._finished = 0
+        self._acknowledged = 0
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True, name='heartbeat')
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def add(self, entry):
+        with self._lock:
+            self._removed.discard(entry['filename'])
+            self._added[entry['filename']] = entry
+
+    def remove(self, filename):
+        with self._lock:
+            self._added.pop(filename, None)
+            self._removed.add(filename)
+
+    def resync(self):
+        # A login clears the peer's files on the tracker, so all of them are
+        # sent again.
+        entries = self.files()
+        with self._lock:
+            self._removed.clear()
+            for entry in entries:
+                self._added[entry['filename']] = entry
+
+    def flush(self, timeout=HEARTBEAT_REQUEST_TIMEOUT):
+        # Beats now instead of at the next interval and waits for a beat that
+        # started after the call to be acknowledged.
+        with self._lock:
+            target = self._started + 1
+            self._wake.set()
+            self._lock.wait_for(lambda: self._finished >= target, timeout)
+            return self._acknowledged >= target
+
+    def _run(self):
+        failures = 0
+        while not self._stopped.is_set():
+            self._wake.clear()
+            if self._beat():
+                failures = 0
+                delay = self.interval
+            else:
+                failures += 1
+                delay = min(HEARTBEAT_MAX_BACKOFF, HEARTBEAT_RETRY * 2 ** (failures - 1))
+            self._wake.wait(delay * random.uniform(1 - HEARTBEAT_JITTER, 1 + HEARTBEAT_JITTER))
+
+    def _beat(self):
+        with self._lock:
+            self._started += 1
+            beat = self._started
+            added, removed = dict(self._added), set(self._removed)
+        payload = {'username': self.username, 'added': list(added.values()), 'removed': sorted(removed)}
+        if self.load:
+            payload['load'] = self.load()
+
+        acknowledged = False
+        try:
+            response = self.tracker.post('/heartbeat', payload, timeout=HEARTBEAT_REQUEST_TIMEOUT)
+            if response.status_code == 200:
+                self.interval = response.json().get('interval', self.interval)
+                acknowledged = True
+            elif response.status_code == 404:
+                logging.warning("The tracker does not know this peer, logging in again")
+                if self.login():
+                    # Beat again right away instead of backing off.
+                    self.resync()
+                    self._wake.set()
+            elif response.status_code == 400:
+                # Resending would be rejected forever; drop the changes.
+                logging.error(f"The tracker rejected the heartbeat, dropping {len(added) + len(removed)} file changes: {response.json().get('message')}")
+                self._forget(added, removed)
+            else:
+                logging.warning(f"Heartbeat failed with status {response.status_code}")
+        except requests.RequestException as e:
+            logging.warning(f"Heartbeat failed: {e}")
+
+        with self._lock:
+            if acknowledged:
+                self._forget(added, removed)
+                self._acknowledged = beat
+            self._finished = beat
+            self._lock.notify_all()
+        return acknowledged
+
+    def _forget(self, added, removed):
+        # Only changes that were not replaced while the beat was in flight.
+        with self._lock:
+            for filename, entry in added.items():
+                if self._added.get(filename) is entry:
+                    del self._added[filename]
+            self._removed -= removed
@@ -0,0 +1,113 @@
+import os
+import json
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+LOAD_REPORT_INTERVAL = float(os.getenv('LOAD_REPORT_INTERVAL', '2'))
+# Upload capacity in bytes/s; 0 reports the upload rate measured while the
+# server was saturated, or nothing until it has been.
+UPLOAD_CAPACITY = int(os.getenv('UPLOAD_CAPACITY', '0'))
+# Assumed for peers that have not reported a capacity.
+DEFAULT_UPLOAD_CAPACITY = float(os.getenv('DEFAULT_UPLOAD_CAPACITY', str(1024 * 1024)))
+# Transfers that must stay in progress through an interval for its upload
+# rate to count as the capacity.
+UPLOAD_SATURATION = int(os.getenv('UPLOAD_SATURATION', '2'))
+RATE_SMOOTHING = 0.3
+
+
+def load_path(grpc_port):
+    return f"peer{grpc_port}load.json"
+
+
+class UploadLoad:
+    # Transfers the peer server is serving and how fast it uploads. The
+    # server writes a snapshot to a small JSON file every LOAD_REPORT_INTERVAL
+    # seconds and the client, a separate process, sends it to the tracker
+    # with its heartbeats.
+    #
+    # Without UPLOAD_CAPACITY the capacity is learned only from saturated
+    # intervals, those with at least UPLOAD_SATURATION transfers in progress
+    # from start to end. A rate measured while the server was idle part of
+    # the time, or serving one slow client, says how much was asked for and
+    # not how much the link can carry.
+    def __init__(self, path, capacity=UPLOAD_CAPACITY):
+        self.path = path
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self.transfers = 0
+        self.rate = None
+        self.saturated_rate = None
+        self._sent = 0
+        self._since = time.monotonic()
+        self._fewest = 0
+
+    @contextmanager
+    def transfer(self):
+        with self._lock:
+            self.transfers += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.transfers -= 1
+                self._fewest = min(self._fewest, self.transfers)
+
+    def sent(self, size):
+        with self._lock:
+            self._sent += size
+
+    def snapshot(self):
+        with self._lock:
+            now = time.monotonic()
+            sample = self._sent / max(now - self._since, 1e-6)
+            self._sent, self._since = 0, now
+            self.rate = sample if self.rate is None else RATE_SMOOTHING * sample + (1 - RATE_SMOOTHING) * self.rate
+            if self._fewest >= UPLOAD_SATURATION:
+                self.saturated_rate = sample if self.saturated_rate is None else RATE_SMOOTHING * sample + (1 - RATE_SMOOTHING) * self.saturated_rate
+            self._fewest = self.transfers
+            snapshot = {'transfers': self.transfers, 'upload_rate': int(self.rate), 'time': time.time()}
+            # The tracker takes numbers only, so an unknown capacity is left out.
+            capacity = self.capacity or (int(self.saturated_rate) if self.saturated_rate else None)
+            if capacity:
+                snapshot['capacity'] = capacity
+            return snapshot
+
+    def write(self):
+        with open(f"{self.path}.tmp", 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(f"{self.path}.tmp", self.path)
+
+    def report(self):
+        while True:
+            time.sleep(LOAD_REPORT_INTERVAL)
+            try:
+                self.write()
+            except OSError as e:
+                logging.error(f"Failed to write load report: {e}")
+
+
+def read_load(path):
+    # The server's last snapshot, or None once it is a few intervals old
+    # and the server is likely gone.
+    try:
+        with open(path) as f:
+            snapshot = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if time.time() - snapshot.get('time', 0) > 3 * LOAD_REPORT_INTERVAL:
+        return None
+    return {key: snapshot[key] for key in ('transfers', 'upload_rate', 'capacity') if snapshot.get(key) is not None}
+
+
+def headroom(peer):
+    # The share of its upload capacity a new download would get next to the
+    # transfers the peer is already serving.
+    return (peer.get('capacity') or DEFAULT_UPLOAD_CAPACITY) / ((peer.get('transfers') or 0) + 1)
+
+
+def ranked(peers):
+    # Best source first. The tracker hands out peers with their loads and
+    # leaves the order to the peers, so this is the only ranking by load.
+    return sorted(peers, key=headroom, reverse=True)
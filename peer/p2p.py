@@ -12,7 +12,7 @@ def load_environment_variables(peer_number):
 
 def start_peer(peer_number):
     print(f"Starting peer {peer_number} server...")
-    server_process = subprocess.Popen(['python3', 'Pserver.py'])
+    server_process = subprocess.Popen(['python3', os.getenv('PEER_SERVER', 'Pserver.py')])
     
     print(f"Starting peer {peer_number} client...")
     client_process = subprocess.Popen(['python3', 'Pclient.py'])
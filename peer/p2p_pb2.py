@@ -14,7 +14,7 @@ _sym_db = _symbol_database.Default()
 
 
 
-DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\tp2p.proto\x12\x03p2p\"\x12\n\x10ListFilesRequest\"-\n\x11ListFilesResponse\x12\x18\n\x05\x66iles\x18\x01 \x03(\x0b\x32\t.p2p.File\"I\n\x12RequestFileRequest\x12\x10\n\x08\x66ilename\x18\x01 \x01(\t\x12\x0f\n\x07\x66ileurl\x18\x02 \x01(\t\x12\x10\n\x08username\x18\x03 \x01(\t\"\x1c\n\tFileChunk\x12\x0f\n\x07\x63ontent\x18\x01 \x01(\x0c\")\n\x04\x46ile\x12\x10\n\x08\x66ilename\x18\x01 \x01(\t\x12\x0f\n\x07\x66ileurl\x18\x02 \x01(\t\"\'\n\x13\x44iscoverFileRequest\x12\x10\n\x08\x66ilename\x18\x01 \x01(\t\"-\n\x14\x44iscoverFileResponse\x12\x15\n\rpeerAddresses\x18\x01 \x01(\t\"\x15\n\x13ListAllFilesRequest\"0\n\x14ListAllFilesResponse\x12\x18\n\x05\x66iles\x18\x01 \x03(\x0b\x32\t.p2p.File2\x95\x02\n\x0b\x46ileService\x12<\n\tListFiles\x12\x15.p2p.ListFilesRequest\x1a\x16.p2p.ListFilesResponse\"\x00\x12:\n\x0bRequestFile\x12\x17.p2p.RequestFileRequest\x1a\x0e.p2p.FileChunk\"\x00\x30\x01\x12\x45\n\x0c\x44iscoverFile\x12\x18.p2p.DiscoverFileRequest\x1a\x19.p2p.DiscoverFileResponse\"\x00\x12\x45\n\x0cListAllFiles\x12\x18.p2p.ListAllFilesRequest\x1a\x19.p2p.ListAllFilesResponse\"\x00\x62\x06proto3')
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\tp2p.proto\x12\x03p2p\"\x12\n\x10ListFilesRequest\"-\n\x11ListFilesResponse\x12\x18\n\x05\x66iles\x18\x01 \x03(\x0b\x32\t.p2p.File\"i\n\x12RequestFileRequest\x12\x10\n\x08\x66ilename\x18\x01 \x01(\t\x12\x0f\n\x07\x66ileurl\x18\x02 \x01(\t\x12\x10\n\x08username\x18\x03 \x01(\t\x12\x0e\n\x06offset\x18\x04 \x01(\x03\x12\x0e\n\x06length\x18\x05 \x01(\x03\"\x82\x01\n\tFileChunk\x12\x0f\n\x07\x63ontent\x18\x01 \x01(\x0c\x12\x10\n\x08\x66ilename\x18\x02 \x01(\t\x12\x0f\n\x07\x66ileurl\x18\x03 \x01(\t\x12\x0c\n\x04size\x18\x04 \x01(\x03\x12\x0e\n\x06offset\x18\x05 \x01(\x03\x12\x10\n\x08\x63hecksum\x18\x06 \x01(\t\x12\x11\n\tfile_hash\x18\x07 \x01(\t\")\n\x04\x46ile\x12\x10\n\x08\x66ilename\x18\x01 \x01(\t\x12\x0f\n\x07\x66ileurl\x18\x02 \x01(\t\"\'\n\x13\x44iscoverFileRequest\x12\x10\n\x08\x66ilename\x18\x01 \x01(\t\"-\n\x14\x44iscoverFileResponse\x12\x15\n\rpeerAddresses\x18\x01 \x01(\t\"\x15\n\x13ListAllFilesRequest\"0\n\x14ListAllFilesResponse\x12\x18\n\x05\x66iles\x18\x01 \x03(\x0b\x32\t.p2p.File\"\xb3\x01\n\x08PeerInfo\x12\x10\n\x08username\x18\x01 \x01(\t\x12\x10\n\x08grpc_url\x18\x02 \x01(\t\x12\x11\n\tgrpc_port\x18\x03 \x01(\t\x12\x10\n\x08\x66ilename\x18\x04 \x01(\t\x12\x14\n\x0c\x63ontent_hash\x18\x05 \x01(\t\x12\x16\n\ttransfers\x18\x06 \x01(\x05H\x00\x88\x01\x01\x12\x15\n\x08\x63\x61pacity\x18\x07 \x01(\x03H\x01\x88\x01\x01\x42\x0c\n\n_transfersB\x0b\n\t_capacity\"A\n\x14\x44iscoverFilesRequest\x12\x11\n\tfilenames\x18\x01 \x03(\t\x12\x16\n\x0e\x63ontent_hashes\x18\x02 \x03(\t\"T\n\x0c\x46ileLocation\x12\x10\n\x08\x66ilename\x18\x01 \x01(\t\x12\x1c\n\x05peers\x18\x02 \x03(\x0b\x32\r.p2p.PeerInfo\x12\x14\n\x0c\x63ontent_hash\x18\x03 \x01(\t\"9\n\x15\x44iscoverFilesResponse\x12 \n\x05\x66iles\x18\x01 \x03(\x0b\x32\x11.p2p.FileLocation\"(\n\x04Node\x12\x0f\n\x07node_id\x18\x01 \x01(\x0c\x12\x0f\n\x07\x61\x64\x64ress\x18\x02 \x01(\t\"(\n\x0bPingRequest\x12\x19\n\x06sender\x18\x01 \x01(\x0b\x32\t.p2p.Node\"\'\n\x0cPingResponse\x12\x17\n\x04node\x18\x01 \x01(\x0b\x32\t.p2p.Node\"<\n\x0f\x46indNodeRequest\x12\x19\n\x06sender\x18\x01 \x01(\x0b\x32\t.p2p.Node\x12\x0e\n\x06target\x18\x02 \x01(\x0c\",\n\x10\x46indNodeResponse\x12\x18\n\x05nodes\x18\x01 \x03(\x0b\x32\t.p2p.Node\":\n\x10\x46indValueRequest\x12\x19\n\x06sender\x18\x01 \x01(\x0b\x32\t.p2p.Node\x12\x0b\n\x03key\x18\x02 \x01(\x0c\"O\n\x11\x46indValueResponse\x12\x18\n\x05nodes\x18\x01 \x03(\x0b\x32\t.p2p.Node\x12 \n\tproviders\x18\x02 \x03(\x0b\x32\r.p2p.PeerInfo\"e\n\x0cStoreRequest\x12\x19\n\x06sender\x18\x01 \x01(\x0b\x32\t.p2p.Node\x12\x0b\n\x03key\x18\x02 \x01(\x0c\x12 \n\tproviders\x18\x03 \x03(\x0b\x32\r.p2p.PeerInfo\x12\x0b\n\x03ttl\x18\x04 \x01(\x05\"\x0f\n\rStoreResponse\"2\n\x0ePeerDescriptor\x12\x13\n\x0bpeerAddress\x18\x01 \x01(\t\x12\x0b\n\x03\x61ge\x18\x02 \x01(\x01\"\x12\n\x10ListPeersRequest\"7\n\x11ListPeersResponse\x12\"\n\x05peers\x18\x01 \x03(\x0b\x32\x13.p2p.PeerDescriptor\"4\n\x0eShuffleRequest\x12\"\n\x05peers\x18\x01 \x03(\x0b\x32\x13.p2p.PeerDescriptor\"5\n\x0fShuffleResponse\x12\"\n\x05peers\x18\x01 \x03(\x0b\x32\x13.p2p.PeerDescriptor2\xaf\x05\n\x0b\x46ileService\x12<\n\tListFiles\x12\x15.p2p.ListFilesRequest\x1a\x16.p2p.ListFilesResponse\"\x00\x12:\n\x0bRequestFile\x12\x17.p2p.RequestFileRequest\x1a\x0e.p2p.FileChunk\"\x00\x30\x01\x12\x45\n\x0c\x44iscoverFile\x12\x18.p2p.DiscoverFileRequest\x1a\x19.p2p.DiscoverFileResponse\"\x00\x12\x45\n\x0cListAllFiles\x12\x18.p2p.ListAllFilesRequest\x1a\x19.p2p.ListAllFilesResponse\"\x00\x12H\n\rDiscoverFiles\x12\x19.p2p.DiscoverFilesRequest\x1a\x1a.p2p.DiscoverFilesResponse\"\x00\x12-\n\x04Ping\x12\x10.p2p.PingRequest\x1a\x11.p2p.PingResponse\"\x00\x12\x39\n\x08\x46indNode\x12\x14.p2p.FindNodeRequest\x1a\x15.p2p.FindNodeResponse\"\x00\x12<\n\tFindValue\x12\x15.p2p.FindValueRequest\x1a\x16.p2p.FindValueResponse\"\x00\x12\x30\n\x05Store\x12\x11.p2p.StoreRequest\x1a\x12.p2p.StoreResponse\"\x00\x12<\n\tListPeers\x12\x15.p2p.ListPeersRequest\x1a\x16.p2p.ListPeersResponse\"\x00\x12\x36\n\x07Shuffle\x12\x13.p2p.ShuffleRequest\x1a\x14.p2p.ShuffleResponse\"\x00\x62\x06proto3')
 
 _globals = globals()
 _builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
@@ -26,19 +26,55 @@ if _descriptor._USE_C_DESCRIPTORS == False:
   _globals['_LISTFILESRESPONSE']._serialized_start=38
   _globals['_LISTFILESRESPONSE']._serialized_end=83
   _globals['_REQUESTFILEREQUEST']._serialized_start=85
-  _globals['_REQUESTFILEREQUEST']._serialized_end=158
-  _globals['_FILECHUNK']._serialized_start=160
-  _globals['_FILECHUNK']._serialized_end=188
-  _globals['_FILE']._serialized_start=190
-  _globals['_FILE']._serialized_end=231
-  _globals['_DISCOVERFILEREQUEST']._serialized_start=233
-  _globals['_DISCOVERFILEREQUEST']._serialized_end=272
-  _globals['_DISCOVERFILERESPONSE']._serialized_start=274
-  _globals['_DISCOVERFILERESPONSE']._serialized_end=319
-  _globals['_LISTALLFILESREQUEST']._serialized_start=321
-  _globals['_LISTALLFILESREQUEST']._serialized_end=342
-  _globals['_LISTALLFILESRESPONSE']._serialized_start=344
-  _globals['_LISTALLFILESRESPONSE']._serialized_end=392
-  _globals['_FILESERVICE']._serialized_start=395
-  _globals['_FILESERVICE']._serialized_end=672
+  _globals['_REQUESTFILEREQUEST']._serialized_end=190
+  _globals['_FILECHUNK']._serialized_start=193
+  _globals['_FILECHUNK']._serialized_end=323
+  _globals['_FILE']._serialized_start=325
+  _globals['_FILE']._serialized_end=366
+  _globals['_DISCOVERFILEREQUEST']._serialized_start=368
+  _globals['_DISCOVERFILEREQUEST']._serialized_end=407
+  _globals['_DISCOVERFILERESPONSE']._serialized_start=409
+  _globals['_DISCOVERFILERESPONSE']._serialized_end=454
+  _globals['_LISTALLFILESREQUEST']._serialized_start=456
+  _globals['_LISTALLFILESREQUEST']._serialized_end=477
+  _globals['_LISTALLFILESRESPONSE']._serialized_start=479
+  _globals['_LISTALLFILESRESPONSE']._serialized_end=527
+  _globals['_PEERINFO']._serialized_start=530
+  _globals['_PEERINFO']._serialized_end=709
+  _globals['_DISCOVERFILESREQUEST']._serialized_start=711
+  _globals['_DISCOVERFILESREQUEST']._serialized_end=776
+  _globals['_FILELOCATION']._serialized_start=778
+  _globals['_FILELOCATION']._serialized_end=862
+  _globals['_DISCOVERFILESRESPONSE']._serialized_start=864
+  _globals['_DISCOVERFILESRESPONSE']._serialized_end=921
+  _globals['_NODE']._serialized_start=923
+  _globals['_NODE']._serialized_end=963
+  _globals['_PINGREQUEST']._serialized_start=965
+  _globals['_PINGREQUEST']._serialized_end=1005
+  _globals['_PINGRESPONSE']._serialized_start=1007
+  _globals['_PINGRESPONSE']._serialized_end=1046
+  _globals['_FINDNODEREQUEST']._serialized_start=1048
+  _globals['_FINDNODEREQUEST']._serialized_end=1108
+  _globals['_FINDNODERESPONSE']._serialized_start=1110
+  _globals['_FINDNODERESPONSE']._serialized_end=1154
+  _globals['_FINDVALUEREQUEST']._serialized_start=1156
+  _globals['_FINDVALUEREQUEST']._serialized_end=1214
+  _globals['_FINDVALUERESPONSE']._serialized_start=1216
+  _globals['_FINDVALUERESPONSE']._serialized_end=1295
+  _globals['_STOREREQUEST']._serialized_start=1297
+  _globals['_STOREREQUEST']._serialized_end=1398
+  _globals['_STORERESPONSE']._serialized_start=1400
+  _globals['_STORERESPONSE']._serialized_end=1415
+  _globals['_PEERDESCRIPTOR']._serialized_start=1417
+  _globals['_PEERDESCRIPTOR']._serialized_end=1467
+  _globals['_LISTPEERSREQUEST']._serialized_start=1469
+  _globals['_LISTPEERSREQUEST']._serialized_end=1487
+  _globals['_LISTPEERSRESPONSE']._serialized_start=1489
+  _globals['_LISTPEERSRESPONSE']._serialized_end=1544
+  _globals['_SHUFFLEREQUEST']._serialized_start=1546
+  _globals['_SHUFFLEREQUEST']._serialized_end=1598
+  _globals['_SHUFFLERESPONSE']._serialized_start=1600
+  _globals['_SHUFFLERESPONSE']._serialized_end=1653
+  _globals['_FILESERVICE']._serialized_start=1656
+  _globals['_FILESERVICE']._serialized_end=2343
 # @@protoc_insertion_point(module_scope)
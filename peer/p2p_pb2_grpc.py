@@ -34,6 +34,41 @@ class FileServiceStub(object):
                 request_serializer=p2p__pb2.ListAllFilesRequest.SerializeToString,
                 response_deserializer=p2p__pb2.ListAllFilesResponse.FromString,
                 )
+        self.DiscoverFiles = channel.unary_unary(
+                '/p2p.FileService/DiscoverFiles',
+                request_serializer=p2p__pb2.DiscoverFilesRequest.SerializeToString,
+                response_deserializer=p2p__pb2.DiscoverFilesResponse.FromString,
+                )
+        self.Ping = channel.unary_unary(
+                '/p2p.FileService/Ping',
+                request_serializer=p2p__pb2.PingRequest.SerializeToString,
+                response_deserializer=p2p__pb2.PingResponse.FromString,
+                )
+        self.FindNode = channel.unary_unary(
+                '/p2p.FileService/FindNode',
+                request_serializer=p2p__pb2.FindNodeRequest.SerializeToString,
+                response_deserializer=p2p__pb2.FindNodeResponse.FromString,
+                )
+        self.FindValue = channel.unary_unary(
+                '/p2p.FileService/FindValue',
+                request_serializer=p2p__pb2.FindValueRequest.SerializeToString,
+                response_deserializer=p2p__pb2.FindValueResponse.FromString,
+                )
+        self.Store = channel.unary_unary(
+                '/p2p.FileService/Store',
+                request_serializer=p2p__pb2.StoreRequest.SerializeToString,
+                response_deserializer=p2p__pb2.StoreResponse.FromString,
+                )
+        self.ListPeers = channel.unary_unary(
+                '/p2p.FileService/ListPeers',
+                request_serializer=p2p__pb2.ListPeersRequest.SerializeToString,
+                response_deserializer=p2p__pb2.ListPeersResponse.FromString,
+                )
+        self.Shuffle = channel.unary_unary(
+                '/p2p.FileService/Shuffle',
+                request_serializer=p2p__pb2.ShuffleRequest.SerializeToString,
+                response_deserializer=p2p__pb2.ShuffleResponse.FromString,
+                )
 
 
 class FileServiceServicer(object):
@@ -63,6 +98,48 @@ class FileServiceServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def DiscoverFiles(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def Ping(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def FindNode(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def FindValue(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def Store(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def ListPeers(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def Shuffle(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
 
 def add_FileServiceServicer_to_server(servicer, server):
     rpc_method_handlers = {
@@ -86,6 +163,41 @@ def add_FileServiceServicer_to_server(servicer, server):
                     request_deserializer=p2p__pb2.ListAllFilesRequest.FromString,
                     response_serializer=p2p__pb2.ListAllFilesResponse.SerializeToString,
             ),
+            'DiscoverFiles': grpc.unary_unary_rpc_method_handler(
+                    servicer.DiscoverFiles,
+                    request_deserializer=p2p__pb2.DiscoverFilesRequest.FromString,
+                    response_serializer=p2p__pb2.DiscoverFilesResponse.SerializeToString,
+            ),
+            'Ping': grpc.unary_unary_rpc_method_handler(
+                    servicer.Ping,
+                    request_deserializer=p2p__pb2.PingRequest.FromString,
+                    response_serializer=p2p__pb2.PingResponse.SerializeToString,
+            ),
+            'FindNode': grpc.unary_unary_rpc_method_handler(
+                    servicer.FindNode,
+                    request_deserializer=p2p__pb2.FindNodeRequest.FromString,
+                    response_serializer=p2p__pb2.FindNodeResponse.SerializeToString,
+            ),
+            'FindValue': grpc.unary_unary_rpc_method_handler(
+                    servicer.FindValue,
+                    request_deserializer=p2p__pb2.FindValueRequest.FromString,
+                    response_serializer=p2p__pb2.FindValueResponse.SerializeToString,
+            ),
+            'Store': grpc.unary_unary_rpc_method_handler(
+                    servicer.Store,
+                    request_deserializer=p2p__pb2.StoreRequest.FromString,
+                    response_serializer=p2p__pb2.StoreResponse.SerializeToString,
+            ),
+            'ListPeers': grpc.unary_unary_rpc_method_handler(
+                    servicer.ListPeers,
+                    request_deserializer=p2p__pb2.ListPeersRequest.FromString,
+                    response_serializer=p2p__pb2.ListPeersResponse.SerializeToString,
+            ),
+            'Shuffle': grpc.unary_unary_rpc_method_handler(
+                    servicer.Shuffle,
+                    request_deserializer=p2p__pb2.ShuffleRequest.FromString,
+                    response_serializer=p2p__pb2.ShuffleResponse.SerializeToString,
+            ),
     }
     generic_handler = grpc.method_handlers_generic_handler(
             'p2p.FileService', rpc_method_handlers)
@@ -163,3 +275,122 @@ class FileService(object):
             p2p__pb2.ListAllFilesResponse.FromString,
             options, channel_credentials,
             insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def DiscoverFiles(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(request, target, '/p2p.FileService/DiscoverFiles',
+            p2p__pb2.DiscoverFilesRequest.SerializeToString,
+            p2p__pb2.DiscoverFilesResponse.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def Ping(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(request, target, '/p2p.FileService/Ping',
+            p2p__pb2.PingRequest.SerializeToString,
+            p2p__pb2.PingResponse.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def FindNode(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(request, target, '/p2p.FileService/FindNode',
+            p2p__pb2.FindNodeRequest.SerializeToString,
+            p2p__pb2.FindNodeResponse.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def FindValue(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(request, target, '/p2p.FileService/FindValue',
+            p2p__pb2.FindValueRequest.SerializeToString,
+            p2p__pb2.FindValueResponse.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def Store(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(request, target, '/p2p.FileService/Store',
+            p2p__pb2.StoreRequest.SerializeToString,
+            p2p__pb2.StoreResponse.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def ListPeers(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(request, target, '/p2p.FileService/ListPeers',
+            p2p__pb2.ListPeersRequest.SerializeToString,
+            p2p__pb2.ListPeersResponse.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def Shuffle(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(request, target, '/p2p.FileService/Shuffle',
+            p2p__pb2.ShuffleRequest.SerializeToString,
+            p2p__pb2.ShuffleResponse.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
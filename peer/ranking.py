@@ -0,0 +1,82 @@
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import grpc
+import p2p_pb2
+from load import headroom
+
+RTT_PROBE_TIMEOUT = float(os.getenv('RTT_PROBE_TIMEOUT', '2'))
+# Transfer size the ranking estimates download time for.
+RANK_TRANSFER_SIZE = int(os.getenv('RANK_TRANSFER_SIZE', str(8 * 1024 * 1024)))
+# Shorter transfers say more about latency than about bandwidth.
+MIN_THROUGHPUT_SAMPLE = 256 * 1024
+METER_SMOOTHING = 0.3
+
+
+def address_of(peer):
+    return f"{peer['grpc_url']}:{peer['grpc_port']}"
+
+
+class PeerMeter:
+    # What this client has observed of each peer: an EWMA of the round-trip
+    # time of a cheap call and of the throughput of past downloads. Peers
+    # are ranked by the time a RANK_TRANSFER_SIZE download is expected to
+    # take. Throughput comes from past downloads; peers never downloaded
+    # from are judged by the headroom their reported load leaves.
+    # Measurements are not capped by that headroom, which is only a guess
+    # when the peer has not reported a capacity.
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rtt = {}
+        self._throughput = {}
+
+    def _update(self, table, address, sample):
+        with self._lock:
+            previous = table.get(address)
+            table[address] = sample if previous is None else METER_SMOOTHING * sample + (1 - METER_SMOOTHING) * previous
+
+    def record_rtt(self, address, seconds):
+        self._update(self._rtt, address, seconds)
+
+    def record_transfer(self, address, size, seconds):
+        if size >= MIN_THROUGHPUT_SAMPLE and seconds > 0:
+            self._update(self._throughput, address, size / seconds)
+
+    def record_rate(self, address, rate):
+        if rate:
+            self._update(self._throughput, address, rate)
+
+    def rtt(self, address):
+        with self._lock:
+            return self._rtt.get(address)
+
+    def throughput(self, peer):
+        with self._lock:
+            measured = self._throughput.get(address_of(peer))
+        return headroom(peer) if measured is None else measured
+
+    def estimate(self, peer, size=RANK_TRANSFER_SIZE):
+        return (self.rtt(address_of(peer)) or RTT_PROBE_TIMEOUT) + size / self.throughput(peer)
+
+    def probe(self, peers, channels):
+        # Times an empty DiscoverFiles, which the peer answers without asking
+        # the tracker, on every peer not measured yet. A peer that does not
+        # answer is charged the whole timeout.
+        def ping(address):
+            start = time.perf_counter()
+            try:
+                with channels.stub(address) as stub:
+                    stub.DiscoverFiles(p2p_pb2.DiscoverFilesRequest(), timeout=RTT_PROBE_TIMEOUT)
+                self.record_rtt(address, time.perf_counter() - start)
+            except grpc.RpcError:
+                self.record_rtt(address, RTT_PROBE_TIMEOUT)
+
+        addresses = {address_of(peer) for peer in peers if self.rtt(address_of(peer)) is None}
+        if addresses:
+            with ThreadPoolExecutor(max_workers=len(addresses)) as pool:
+                list(pool.map(ping, addresses))
+
+    def rank(self, peers, channels):
+        self.probe(peers, channels)
+        return sorted(peers, key=self.estimate)
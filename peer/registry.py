@@ -0,0 +1,135 @@
+import os
+import json
+import threading
+
+REGISTRY_COMPACT_RATIO = 2
+
+registries = {}
+registries_lock = threading.Lock()
+
+
+class FileRegistry:
+    # The files a peer shares, keyed by filename. Changes are appended to a
+    # JSON-lines log instead of rewriting the whole list, and the log is
+    # replayed once on startup. Another process sharing the log (Pclient
+    # writes, Pserver reads) picks up new lines by reading from where it
+    # left off whenever the file has grown, which costs one stat per lookup.
+    def __init__(self, path, legacy_path=None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._files = {}
+        self._offset = 0
+        self._inode = None
+        self._lines = 0
+        if legacy_path and not os.path.exists(path) and os.path.exists(legacy_path):
+            self._import_legacy(legacy_path)
+        self.refresh()
+
+    def _import_legacy(self, legacy_path):
+        with open(legacy_path, 'r') as f:
+            entries = json.load(f)
+        self._write_log({entry['filename']: entry for entry in entries})
+
+    def _write_log(self, files):
+        with open(f"{self.path}.tmp", 'w') as f:
+            for entry in files.values():
+                f.write(json.dumps(dict(entry, op='add')) + '\n')
+        os.replace(f"{self.path}.tmp", self.path)
+
+    def refresh(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return
+        with self._lock:
+            if stat.st_ino != self._inode or stat.st_size < self._offset:
+                self._files, self._offset, self._lines, self._inode = {}, 0, 0, stat.st_ino
+            if stat.st_size == self._offset:
+                return
+            with open(self.path, 'r') as f:
+                f.seek(self._offset)
+                for line in f:
+                    if not line.endswith('\n'):
+                        # A line still being written; read it next time.
+                        break
+                    self._offset += len(line.encode())
+                    self._lines += 1
+                    self._apply(json.loads(line))
+
+    def _apply(self, record):
+        if record['op'] == 'add':
+            self._files[record['filename']] = {key: value for key, value in record.items() if key != 'op'}
+        elif record['op'] == 'remove':
+            self._files.pop(record['filename'], None)
+
+    def _append(self, record):
+        with self._lock:
+            with open(self.path, 'a') as f:
+                f.write(json.dumps(record) + '\n')
+        self.refresh()
+
+    def add(self, filename, fileurl, **details):
+        self._append(dict(details, op='add', filename=filename, fileurl=fileurl))
+
+    def remove(self, filename):
+        self._append({'op': 'remove', 'filename': filename})
+
+    def get(self, filename):
+        self.refresh()
+        return self._files.get(filename)
+
+    def files(self):
+        self.refresh()
+        with self._lock:
+            return list(self._files.values())
+
+    def compact(self):
+        # Rewrites the log with one line per file once superseded lines
+        # dominate it. Readers notice the new inode and reload.
+        self.refresh()
+        with self._lock:
+            if self._lines <= REGISTRY_COMPACT_RATIO * len(self._files):
+                return
+            self._write_log(self._files)
+        self.refresh()
+
+    def sync(self, shared_dir, entry_for):
+        # Registers files dropped into the share directory by hand and
+        # registers again those edited since. entry_for(name, entry) returns
+        # the fileurl and details to record, or None for a file that is gone;
+        # it gets the current entry so an unchanged file is not hashed again.
+        # Entries described from a file (those with a content hash) whose
+        # file has left the directory are removed; ones shared by URL alone
+        # never had a file there. Returns the (previous, current) entries of
+        # the files registered and the entries removed.
+        if not os.path.isdir(shared_dir):
+            return [], []
+        changed = []
+        for name in sorted(os.listdir(shared_dir)):
+            if name.endswith(('.part', '.part.json', '.swarm', '.tmp')) or not os.path.isfile(os.path.join(shared_dir, name)):
+                continue
+            entry = self.get(name)
+            details = entry_for(name, entry)
+            if details is not None and (entry is None or any(entry.get(key) != value for key, value in details.items())):
+                self.add(name, **details)
+                changed.append((entry, self.get(name)))
+        removed = [entry for entry in self.files() if entry.get('content_hash')
+                   and not os.path.isfile(os.path.join(shared_dir, os.path.basename(entry['filename'])))]
+        for entry in removed:
+            self.remove(entry['filename'])
+        return changed, removed
+
+
+def open_registry(username, create=True):
+    # With create=False only registries that already exist on disk are
+    # opened, so lookups for unknown usernames do not pile up.
+    if not username or os.path.basename(username) != username:
+        return None
+    with registries_lock:
+        registry = registries.get(username)
+        if registry is None:
+            path, legacy_path = f"{username}files.log", f"{username}files.json"
+            if not create and not os.path.exists(path) and not os.path.exists(legacy_path):
+                return None
+            registry = registries[username] = FileRegistry(path, legacy_path=legacy_path)
+        return registry
@@ -0,0 +1,294 @@
+import os
+import bisect
+import hashlib
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from tracker_client import TrackerClient, TRACKER_TIMEOUT
+from catalog import CatalogReplica
+
+# Tracker shards separated by commas, each a primary followed by its read
+# replicas separated by '|', e.g. 't1:4001|t1r:4001,t2:4001'. Empty means a
+# single tracker at SERVER_URL:SERVER_PORT.
+TRACKER_SHARDS = os.getenv('TRACKER_SHARDS', '')
+TRACKER_VNODES = int(os.getenv('TRACKER_VNODES', '64'))
+
+
+def node_url(address):
+    address = address.strip()
+    return address if '://' in address else f'http://{address}'
+
+
+def ring_hash(key):
+    return int.from_bytes(hashlib.sha1(key.encode()).digest()[:8], 'big')
+
+
+class Shard:
+    # A primary tracker and the read-only replicas serving its database.
+    # Writes go to the primary. Reads rotate over the replicas and fall back
+    # to the next node, the primary last, when one cannot be reached.
+    def __init__(self, primary, replicas=(), pool_size=10):
+        self.name = node_url(primary)
+        self.session = requests.Session()
+        self.session.mount('http://', HTTPAdapter(pool_connections=len(replicas) + 1, pool_maxsize=pool_size))
+        self.primary = TrackerClient(self.name, self.session)
+        self.replicas = [TrackerClient(node_url(replica), self.session) for replica in replicas]
+        self._turn = itertools.count()
+
+    def readers(self):
+        start = next(self._turn)
+        count = len(self.replicas)
+        return [self.replicas[(start + i) % count] for i in range(count)] + [self.primary]
+
+    def read(self, call):
+        error = None
+        for node in self.readers():
+            try:
+                return call(node)
+            except requests.RequestException as e:
+                error = e
+        raise error
+
+    def url(self, path):
+        # Lets a CatalogReplica follow the shard: each call picks the next
+        # reader, so the retry after a failure lands on another node. All
+        # nodes of a shard read one database and agree on catalog versions.
+        return self.readers()[0].url(path)
+
+
+def parse_shards(spec, pool_size=10):
+    shards = []
+    for entry in spec.split(','):
+        nodes = [node for node in entry.split('|') if node.strip()]
+        if nodes:
+            shards.append(Shard(nodes[0], nodes[1:], pool_size))
+    return shards
+
+
+class HashRing:
+    # Consistent hashing over the shards: each owns TRACKER_VNODES points on
+    # a ring of 64-bit hashes and a key belongs to the first point at or
+    # after its own hash. Points are derived from the primary's address, so
+    # adding a shard only moves the keys it takes over, about 1/N of them.
+    def __init__(self, shards, vnodes=TRACKER_VNODES):
+        points = sorted((ring_hash(f'{shard.name}#{vnode}'), index)
+                        for index, shard in enumerate(shards) for vnode in range(vnodes))
+        self.shards = shards
+        self._hashes = [point for point, _ in points]
+        self._owners = [index for _, index in points]
+
+    def shard_for(self, key):
+        position = bisect.bisect_left(self._hashes, ring_hash(key)) % len(self._hashes)
+        return self.shards[self._owners[position]]
+
+
+def merge_files(listings):
+    files = {}
+    for listing in listings:
+        for file in listing:
+            merged = files.get(file['filename'])
+            if merged is None:
+                files[file['filename']] = dict(file)
+            else:
+                merged['count'] += file['count']
+    return list(files.values())
+
+
+def merge_peers(ring, listings):
+    # listings holds one /list_peers answer per shard, in ring order. Every
+    # shard knows every peer, but only its home shard (the one owning its
+    # username) says whether it is up; the others add the files they hold.
+    files = {}
+    for listing in listings:
+        for peer in listing:
+            files[peer['username']] = files.get(peer['username'], 0) + peer['num_files']
+    return [dict(peer, num_files=files[peer['username']])
+            for shard, listing in zip(ring.shards, listings) for peer in listing
+            if ring.shard_for(peer['username']) is shard]
+
+
+def merge_located(peers):
+    # A peer can hold the same content under names kept on different shards.
+    seen = set()
+    return [peer for peer in peers if peer['username'] not in seen and not seen.add(peer['username'])]
+
+
+def first_failure(results, expected=(200,)):
+    return next(((status, body) for status, body in results if status not in expected), None)
+
+
+class ShardedTracker:
+    # Same interface as TrackerClient over several tracker shards. Files
+    # are partitioned by filename: a file lives on the shard owning its
+    # name, so finding who has a file asks a single shard. Peers log in on
+    # every shard, and each heartbeat goes to the peer's home shard (the one
+    # owning its username) and to the shards holding its files, carrying
+    # the changes to the files each of them holds. Lookups by content hash
+    # still ask every shard, since the same content can be shared under
+    # names that live on different shards. Listings are merged whole; their
+    # paging cursors are per shard and are not used here.
+    def __init__(self, shards, pool_size=10):
+        self.shards = shards
+        self.ring = HashRing(shards)
+        self._executor = ThreadPoolExecutor(max_workers=len(shards) * pool_size, thread_name_prefix='tracker-shard')
+        self._lock = threading.Lock()
+        # Filenames each peer holds on each shard, as acknowledged by it.
+        self._holdings = {}
+
+    def shard_for(self, key):
+        return self.ring.shard_for(key)
+
+    def post(self, path, payload, timeout=TRACKER_TIMEOUT):
+        if path == '/heartbeat':
+            return self.heartbeat(payload, timeout)
+        if path == '/upload_file':
+            return self.send({self.shard_for(payload['filename']): payload}, path, timeout)[0][1]
+        if path in ('/login', '/logout'):
+            with self._lock:
+                self._holdings.pop(payload['username'], None)
+            responses = self.send({shard: payload for shard in self.shards}, path, timeout)
+            return next((response for _, response in responses if response.status_code != 200),
+                        self._home_response(payload['username'], responses))
+        raise ValueError(f"{path} is not a write, use post_json")
+
+    def _home_response(self, username, responses):
+        home = self.shard_for(username)
+        return next(response for shard, response in responses if shard is home)
+
+    def send(self, payloads, path, timeout):
+        # Posts each shard its own payload, in parallel, and records which
+        # files every shard acknowledged.
+        shards = list(payloads)
+        responses = list(self._executor.map(lambda shard: shard.primary.post(path, payloads[shard], timeout), shards))
+        for shard, response in zip(shards, responses):
+            if response.status_code == 200:
+                self._record(shard, payloads[shard])
+        return list(zip(shards, responses))
+
+    def _record(self, shard, payload):
+        added = payload.get('added', [payload] if 'filename' in payload else [])
+        with self._lock:
+            held = self._holdings.setdefault(payload['username'], {}).setdefault(shard.name, set())
+            held.update(entry['filename'] for entry in added)
+            held.difference_update(payload.get('removed', []))
+
+    def heartbeat(self, payload, timeout):
+        home = self.shard_for(payload['username'])
+        with self._lock:
+            held = {name for name, files in self._holdings.get(payload['username'], {}).items() if files}
+        payloads = {shard: dict(payload, added=[], removed=[]) for shard in self.shards
+                    if shard is home or shard.name in held}
+        for entry in payload.get('added', []):
+            shard = self.shard_for(entry['filename'])
+            payloads.setdefault(shard, dict(payload, added=[], removed=[]))['added'].append(entry)
+        for filename in payload.get('removed', []):
+            shard = self.shard_for(filename)
+            payloads.setdefault(shard, dict(payload, added=[], removed=[]))['removed'].append(filename)
+
+        responses = [response for _, response in self.send(payloads, '/heartbeat', timeout)]
+        # An unknown peer logs in again everywhere; otherwise the shortest
+        # interval asked for keeps the peer alive on every shard.
+        failed = [response for response in responses if response.status_code != 200]
+        if failed:
+            return next((response for response in failed if response.status_code == 404), failed[0])
+        return min(responses, key=lambda response: response.json().get('interval', float('inf')))
+
+    def scatter(self, call):
+        return list(self._executor.map(lambda shard: shard.read(call), self.shards))
+
+    def get_json(self, path, params=None, timeout=TRACKER_TIMEOUT):
+        results = self.scatter(lambda node: node.get_json(path, params, timeout))
+        if path.startswith('/contents/'):
+            found = [body for status, body in results if status == 200]
+            if not found:
+                return first_failure(results, (404,)) or (404, None)
+            return 200, dict(found[0], count=sum(body['count'] for body in found))
+
+        failure = first_failure(results)
+        if failure:
+            return failure
+        bodies = [body for _, body in results]
+        if path == '/list_peers':
+            return 200, merge_peers(self.ring, bodies)
+        if path == '/list_files':
+            return 200, merge_files(bodies)
+        if path == '/peer_loads':
+            return 200, {'loads': {username: load for body in bodies for username, load in body['loads'].items()}}
+        raise ValueError(f"No merge for {path}")
+
+    def post_json(self, path, payload, timeout=TRACKER_TIMEOUT):
+        if path == '/discover_file':
+            return self.shard_for(payload['filename']).read(lambda node: node.post_json(path, payload, timeout))
+        if path == '/discover_files':
+            # Each filename goes to its own shard; content hashes to all.
+            content_hashes = payload.get('content_hashes', [])
+            payloads = {shard: {'filenames': [], 'content_hashes': content_hashes}
+                        for shard in (self.shards if content_hashes else [])}
+            for filename in payload.get('filenames', []):
+                shard = self.shard_for(filename)
+                payloads.setdefault(shard, {'filenames': [], 'content_hashes': content_hashes})['filenames'].append(filename)
+            results = list(self._executor.map(
+                lambda shard: shard.read(lambda node: node.post_json(path, payloads[shard], timeout)), list(payloads)))
+            failure = first_failure(results)
+            if failure:
+                return failure
+            merged = {'files': {}, 'contents': {}}
+            for _, body in results:
+                for field, locations in merged.items():
+                    for key, peers in body[field].items():
+                        locations.setdefault(key, []).extend(peers)
+            merged['contents'] = {key: merge_located(peers) for key, peers in merged['contents'].items()}
+            return 200, merged
+        raise ValueError(f"No merge for {path}")
+
+
+class ShardedCatalog:
+    # One catalog replica per shard, answering like the sharded tracker: a
+    # filename from the replica of the shard owning it, everything else put
+    # together from all of them.
+    def __init__(self, tracker):
+        self.ring = tracker.ring
+        self.replicas = {shard.name: CatalogReplica(shard) for shard in tracker.shards}
+
+    def replica_for(self, key):
+        return self.replicas[self.ring.shard_for(key).name]
+
+    @property
+    def ready(self):
+        return all(replica.ready for replica in self.replicas.values())
+
+    def start(self):
+        for replica in self.replicas.values():
+            replica.start()
+        return self
+
+    def wait_ready(self, timeout):
+        deadline = time.monotonic() + timeout
+        return all(replica.wait_ready(max(0, deadline - time.monotonic())) for replica in self.replicas.values())
+
+    def list_peers(self):
+        return merge_peers(self.ring, [self.replicas[shard.name].list_peers() for shard in self.ring.shards])
+
+    def list_files(self):
+        return merge_files(replica.list_files() for replica in self.replicas.values())
+
+    def discover(self, filename):
+        return self.replica_for(filename).discover(filename)
+
+    def discover_content(self, content_hash):
+        return merge_located(peer for replica in self.replicas.values() for peer in replica.discover_content(content_hash))
+
+
+def open_tracker(base_url, pool_size=10):
+    if TRACKER_SHARDS:
+        return ShardedTracker(parse_shards(TRACKER_SHARDS, pool_size), pool_size)
+    return TrackerClient(base_url, pool_size=pool_size)
+
+
+def open_catalog(tracker):
+    if isinstance(tracker, ShardedTracker):
+        return ShardedCatalog(tracker)
+    return CatalogReplica(tracker)
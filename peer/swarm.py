@@ -0,0 +1,235 @@
+import os
+import time
+import hashlib
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import grpc
+import p2p_pb2
+from transfer import BufferPool, file_sha256
+
+SWARM_PIECE_SIZE = int(os.getenv('SWARM_PIECE_SIZE', str(1024 * 1024)))
+SWARM_PIECE_TIMEOUT = float(os.getenv('SWARM_PIECE_TIMEOUT', '60'))
+SWARM_MAX_FAILURES = int(os.getenv('SWARM_MAX_FAILURES', '3'))
+THROUGHPUT_SMOOTHING = 0.3
+
+
+class SwarmError(Exception):
+    pass
+
+
+class PeerStats:
+    def __init__(self, peer):
+        self.peer = peer
+        self.rate = None
+        self.pieces = 0
+        self.bytes = 0
+        self.failures = 0
+        self.dropped = False
+
+    @property
+    def username(self):
+        return self.peer['username']
+
+    def record(self, size, elapsed):
+        rate = size / max(elapsed, 1e-6)
+        self.rate = rate if self.rate is None else THROUGHPUT_SMOOTHING * rate + (1 - THROUGHPUT_SMOOTHING) * self.rate
+        self.pieces += 1
+        self.bytes += size
+        self.failures = 0
+
+
+class SwarmDownload:
+    # Downloads one file from every peer that holds it at the same time. The
+    # file is split into fixed-size pieces handed out from a shared queue, so
+    # faster peers simply come back for more. A piece that fails goes back to
+    # the front of the queue, a peer that keeps failing is dropped, and once
+    # the queue is empty idle peers that are faster than the one holding a
+    # piece fetch it too, so a slow peer cannot hold up the end of the file.
+    def __init__(self, filename, fileurl, peers, path, channels, piece_size=SWARM_PIECE_SIZE, content=None, buffers=None):
+        self.filename = filename
+        self.fileurl = fileurl
+        self.path = path
+        self.partial_path = f"{path}.swarm"
+        self.piece_size = piece_size
+        self.channels = channels
+        self.stats = {peer['username']: PeerStats(peer) for peer in peers}
+        self.size = None
+        self.file_hash = None
+        self.piece_hashes = None
+        self.buffers = buffers or BufferPool()
+        if content:
+            # Registered content: pieces line up with the published piece
+            # hashes, so each one is checked before it is written.
+            self.size, self.file_hash = content['size'], content['content_hash']
+            self.piece_size, self.piece_hashes = content['piece_size'], content['piece_hashes']
+        self._changed = threading.Condition()
+        self._pending = deque()
+        self._in_flight = {}
+        self._done = set()
+        self._calls = {}
+
+    @property
+    def piece_count(self):
+        return (self.size + self.piece_size - 1) // self.piece_size
+
+    def run(self):
+        if self.file_hash is None:
+            self._probe()
+        self._pending = deque(range(self.piece_count))
+        with open(self.partial_path, 'wb') as f:
+            f.truncate(self.size)
+
+        with ThreadPoolExecutor(max_workers=len(self.stats), thread_name_prefix='swarm') as pool:
+            for stats in self.stats.values():
+                pool.submit(self._work, stats)
+
+        if len(self._done) != self.piece_count:
+            os.remove(self.partial_path)
+            raise SwarmError(f"{self.piece_count - len(self._done)} of {self.piece_count} pieces could not be downloaded from any peer")
+        if file_sha256(self.partial_path) != self.file_hash:
+            os.remove(self.partial_path)
+            raise SwarmError("the reassembled file does not match its hash")
+        os.replace(self.partial_path, self.path)
+        return self.fileurl
+
+    def _probe(self):
+        # Size and hash come from the first peer that answers a one byte range.
+        for stats in self.stats.values():
+            try:
+                with self.channels.stub(self._address(stats)) as stub:
+                    request = p2p_pb2.RequestFileRequest(filename=self.filename, fileurl=self.fileurl, username=stats.username, length=1)
+                    chunk = next(stub.RequestFile(request, timeout=SWARM_PIECE_TIMEOUT))
+            except grpc.RpcError as e:
+                logging.warning(f"Swarm: {stats.username} did not answer for '{self.filename}': {e.details()}")
+                stats.dropped = True
+                continue
+            self.size, self.file_hash = chunk.size, chunk.file_hash
+            self.fileurl = chunk.fileurl or self.fileurl
+            return
+        raise SwarmError("no peer could serve the file")
+
+    def _address(self, stats):
+        return f"{stats.peer['grpc_url']}:{stats.peer['grpc_port']}"
+
+    def _work(self, stats):
+        try:
+            with self.channels.stub(self._address(stats)) as stub, open(self.partial_path, 'r+b') as f:
+                while True:
+                    index = self._next_piece(stats)
+                    if index is None:
+                        return
+                    start = time.monotonic()
+                    with self.buffers.buffer(self.piece_size) as buffer:
+                        try:
+                            content = self._fetch(stub, stats, index, buffer)
+                        except (grpc.RpcError, ValueError) as e:
+                            if index in self._done:
+                                self._finished(stats, index, None, 0)
+                            else:
+                                self._failed(stats, index, e)
+                            continue
+                        if content is not None:
+                            f.seek(index * self.piece_size)
+                            f.write(content)
+                        self._finished(stats, index, content, time.monotonic() - start)
+        except Exception:
+            logging.exception(f"Swarm: worker for {stats.username} crashed")
+            with self._changed:
+                stats.dropped = True
+                self._requeue(stats, [index for index, holders in self._in_flight.items() if stats.username in holders])
+
+    def _next_piece(self, stats):
+        with self._changed:
+            while True:
+                if stats.dropped or len(self._done) == self.piece_count:
+                    return None
+                index = self._pending.popleft() if self._pending else self._endgame_piece(stats)
+                if index is not None:
+                    self._in_flight.setdefault(index, {})[stats.username] = time.monotonic()
+                    return index
+                if not self._in_flight:
+                    return None
+                self._changed.wait()
+
+    def _endgame_piece(self, stats):
+        # Duplicates the longest running piece held by a single slower peer.
+        if stats.rate is None:
+            return None
+        candidates = []
+        for index, holders in self._in_flight.items():
+            if len(holders) != 1 or stats.username in holders:
+                continue
+            (holder, started), = holders.items()
+            holder_rate = self.stats[holder].rate
+            if holder_rate is None or holder_rate < stats.rate:
+                candidates.append((started, index))
+        return min(candidates)[1] if candidates else None
+
+    def _fetch(self, stub, stats, index, buffer):
+        # Chunks are copied into a pooled buffer as they arrive and the piece
+        # is returned as a view of it, valid until the buffer is released.
+        offset = index * self.piece_size
+        length = min(self.piece_size, self.size - offset)
+        filename = stats.peer.get('filename') or self.filename
+        request = p2p_pb2.RequestFileRequest(filename=filename, fileurl=self.fileurl, username=stats.username, offset=offset, length=length)
+        responses = stub.RequestFile(request, timeout=SWARM_PIECE_TIMEOUT)
+        with self._changed:
+            self._calls[stats.username] = responses
+        view = memoryview(buffer)
+        received = 0
+        for chunk in responses:
+            if chunk.file_hash and chunk.file_hash != self.file_hash:
+                raise ValueError("peer has a different version of the file")
+            if chunk.offset != offset + received:
+                raise ValueError(f"expected offset {offset + received}, got {chunk.offset}")
+            if hashlib.sha256(chunk.content).hexdigest() != chunk.checksum:
+                raise ValueError(f"checksum mismatch in chunk at offset {chunk.offset}")
+            if received + len(chunk.content) > length:
+                raise ValueError(f"piece {index} is longer than {length} bytes")
+            view[received:received + len(chunk.content)] = chunk.content
+            received += len(chunk.content)
+            if index in self._done:
+                responses.cancel()
+                return None
+        if received != length:
+            raise ValueError(f"piece {index} ended after {received} of {length} bytes")
+        content = view[:length]
+        if self.piece_hashes and hashlib.sha256(content).hexdigest() != self.piece_hashes[index]:
+            raise ValueError(f"piece {index} does not match its registered hash")
+        return content
+
+    def _requeue(self, stats, indexes):
+        for index in indexes:
+            holders = self._in_flight.get(index, {})
+            holders.pop(stats.username, None)
+            if not holders:
+                self._in_flight.pop(index, None)
+                if index not in self._done:
+                    self._pending.appendleft(index)
+        self._changed.notify_all()
+
+    def _failed(self, stats, index, error):
+        reason = error.details() if isinstance(error, grpc.RpcError) else error
+        with self._changed:
+            stats.failures += 1
+            if stats.failures >= SWARM_MAX_FAILURES:
+                stats.dropped = True
+                logging.warning(f"Swarm: dropping {stats.username} after {stats.failures} failures: {reason}")
+            else:
+                logging.info(f"Swarm: piece {index} from {stats.username} failed: {reason}")
+            self._requeue(stats, [index])
+
+    def _finished(self, stats, index, content, elapsed):
+        with self._changed:
+            if content is None or index in self._done:
+                self._requeue(stats, [index])
+                return
+            stats.record(len(content), elapsed)
+            self._done.add(index)
+            for holder in self._in_flight.pop(index, {}):
+                call = self._calls.get(holder)
+                if holder != stats.username and call is not None:
+                    call.cancel()
+            self._changed.notify_all()
@@ -0,0 +1,41 @@
+import asyncio
+import threading
+import unittest
+from unittest import mock
+import Pserver
+import AsyncPserver
+
+
+def thread_name(*args):
+    return threading.current_thread().name
+
+
+class LookupTest(unittest.TestCase):
+    # Nothing that can reach the tracker may run on the event loop.
+    def lookup(self, answer, func, *args):
+        return asyncio.run(AsyncPserver.lookup(answer, func, *args))
+
+    def test_catalog_answer_stays_on_the_loop(self):
+        self.assertEqual(self.lookup(lambda filename: [], thread_name, 'a.bin'), [])
+
+    def test_tracker_lookup_runs_on_the_tracker_pool(self):
+        self.assertTrue(self.lookup(lambda filename: None, thread_name, 'a.bin').startswith('peer-tracker'))
+
+    def test_unsynced_catalog_sends_every_lookup_to_the_pool(self):
+        with mock.patch.object(type(Pserver.catalog), 'ready', new_callable=mock.PropertyMock, return_value=False):
+            self.assertIsNone(Pserver.catalog_files())
+            self.assertIsNone(Pserver.catalog_peers('a.bin'))
+            self.assertIsNone(Pserver.catalog_discover_all(['a.bin'], []))
+            self.assertTrue(self.lookup(Pserver.catalog_files, thread_name).startswith('peer-tracker'))
+
+    def test_synced_catalog_answers_without_the_tracker(self):
+        with mock.patch.object(type(Pserver.catalog), 'ready', new_callable=mock.PropertyMock, return_value=True), \
+                mock.patch.object(Pserver.catalog, 'discover', return_value=[]), \
+                mock.patch.object(Pserver.catalog, 'discover_content', return_value=[]):
+            response = self.lookup(Pserver.catalog_discover_all, thread_name, ['a.bin'], ['abc'])
+        self.assertEqual([(location.filename, location.content_hash) for location in response.files],
+                         [('a.bin', ''), ('', 'abc')])
+
+
+if __name__ == '__main__':
+    unittest.main()
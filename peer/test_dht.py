@@ -0,0 +1,158 @@
+import time
+import random
+import unittest
+import dht
+from dht import DHTNode, RoutingTable, RecordStore, key_for, make_id
+from fake_network import FakeNetwork
+
+
+def provider(username, filename='a.bin'):
+    return {'username': username, 'grpc_url': 'localhost', 'grpc_port': '5001', 'filename': filename, 'content_hash': None}
+
+
+class RoutingTableTest(unittest.TestCase):
+    def setUp(self):
+        self.table = RoutingTable(0, k=2)
+        # All three share the bucket of ids with the top bit set.
+        self.ids = [2 ** 159 + 1, 2 ** 159 + 2, 2 ** 159 + 3]
+
+    def test_full_bucket_keeps_old_contacts(self):
+        for node_id in self.ids:
+            self.table.update(node_id, f'node{node_id}')
+        self.assertEqual(len(self.table), 2)
+        self.assertEqual([node_id for node_id, _ in self.table.closest(self.ids[2])], self.ids[:2][::-1])
+
+    def test_removed_contact_is_replaced(self):
+        for node_id in self.ids:
+            self.table.update(node_id, f'node{node_id}')
+        self.table.remove(self.ids[0])
+        self.assertEqual(sorted(node_id for node_id, _ in self.table.closest(0)), self.ids[1:])
+
+    def test_ignores_own_id(self):
+        self.table.update(0, 'me')
+        self.assertEqual(len(self.table), 0)
+
+    def test_closest_orders_by_xor_distance(self):
+        table = RoutingTable(0)
+        ids = [1, 2, 3, 8, 12, 2 ** 100]
+        for node_id in ids:
+            table.update(node_id, f'node{node_id}')
+        self.assertEqual([node_id for node_id, _ in table.closest(9, count=3)], [8, 12, 1])
+
+
+class RecordStoreTest(unittest.TestCase):
+    def test_put_and_get(self):
+        store = RecordStore()
+        store.put(1, [provider('a'), provider('b')], 60)
+        store.put(1, [provider('a')], 60)
+        self.assertEqual(sorted(record['username'] for record in store.get(1)), ['a', 'b'])
+        self.assertEqual(store.get(2), [])
+
+    def test_records_expire(self):
+        store = RecordStore()
+        store.put(1, [provider('a')], 0)
+        self.assertEqual(store.get(1), [])
+        store.expire()
+        self.assertEqual(store._records, {})
+
+    def test_keeps_at_most_max_providers(self):
+        store = RecordStore()
+        store.put(1, [provider(f'old{i}') for i in range(dht.DHT_MAX_PROVIDERS)], 60)
+        time.sleep(0.01)
+        store.put(1, [provider('new')], 60)
+        usernames = {record['username'] for record in store.get(1)}
+        self.assertEqual(len(usernames), dht.DHT_MAX_PROVIDERS)
+        self.assertIn('new', usernames)
+
+
+class LookupTest(unittest.TestCase):
+    SIZE = 40
+
+    def setUp(self):
+        self.network = FakeNetwork()
+        addresses = [f'node{i}:5001' for i in range(self.SIZE)]
+        for address in addresses:
+            self.network.nodes[address] = DHTNode(address, self.network)
+        for address in addresses[1:]:
+            self.assertTrue(self.network.nodes[address].bootstrap([addresses[0]]))
+
+    def true_closest(self, target):
+        return sorted(self.network.nodes.values(), key=lambda node: node.node_id ^ target)[:dht.DHT_K]
+
+    def test_lookup_finds_the_closest_nodes(self):
+        client = DHTNode(None, self.network)
+        self.assertTrue(client.bootstrap(['node7:5001']))
+        for target in (make_id('x'), make_id('y'), random.Random(1).getrandbits(dht.ID_BITS)):
+            closest, _ = client.lookup(target)
+            self.assertEqual([node_id for node_id, _ in closest], [node.node_id for node in self.true_closest(target)])
+
+    def test_publish_then_find(self):
+        key = key_for('file', 'a.bin')
+        publisher = DHTNode(None, self.network)
+        publisher.bootstrap(['node3:5001'])
+        self.assertEqual(publisher.publish(key, [provider('alice')]), dht.DHT_K)
+        for node in self.true_closest(key):
+            self.assertEqual([record['username'] for record in node.store.get(key)], ['alice'])
+
+        seeker = DHTNode(None, self.network)
+        seeker.bootstrap(['node11:5001'])
+        self.assertEqual([record['username'] for record in seeker.find_providers(key)], ['alice'])
+        self.assertEqual(seeker.find_providers(key_for('file', 'missing.bin')), [])
+
+    def test_lookup_survives_dead_nodes(self):
+        key = key_for('content', 'abc')
+        publisher = DHTNode(None, self.network)
+        publisher.bootstrap(['node0:5001'])
+        publisher.publish(key, [provider('bob')])
+        # Half of the nodes holding the record go away.
+        for node in self.true_closest(key)[:dht.DHT_K // 2]:
+            del self.network.nodes[node.address]
+
+        seeker = next(iter(self.network.nodes.values()))
+        self.assertEqual([record['username'] for record in seeker.find_providers(key)], ['bob'])
+        alive = {node.node_id for node in self.network.nodes.values()}
+        closest, _ = seeker.lookup(key)
+        self.assertTrue(all(node_id in alive for node_id, _ in closest))
+
+    def test_find_all(self):
+        publisher = DHTNode(None, self.network)
+        publisher.bootstrap(['node5:5001'])
+        keys = [key_for('file', f'{i}.bin') for i in range(5)]
+        for i, key in enumerate(keys):
+            publisher.publish(key, [provider(f'user{i}', f'{i}.bin')])
+        found = self.network.nodes['node9:5001'].find_all(keys)
+        self.assertEqual({key: [record['username'] for record in found[key]] for key in keys},
+                         {key: [f'user{i}'] for i, key in enumerate(keys)})
+
+
+class BootstrapTest(unittest.TestCase):
+    def test_bootstrap_fails_without_reachable_seeds(self):
+        node = DHTNode('lonely:5001', FakeNetwork())
+        self.assertFalse(node.bootstrap([]))
+        self.assertFalse(node.bootstrap(['lonely:5001']))
+        self.assertFalse(node.bootstrap(['gone:5001']))
+
+    def test_retries_back_off(self):
+        node = DHTNode('lonely:5001', FakeNetwork())
+        waits = []
+
+        class Wake:
+            def clear(self):
+                pass
+
+            def set(self):
+                pass
+
+            def wait(self, delay):
+                waits.append(delay)
+                if len(waits) == 6:
+                    raise SystemExit
+
+        node._wake = Wake()
+        with self.assertRaises(SystemExit):
+            node._run(lambda: [])
+        self.assertEqual(waits, [min(dht.DHT_MAX_RETRY_INTERVAL, dht.DHT_RETRY_INTERVAL * 2 ** i) for i in range(6)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import random
+import unittest
+from unittest import mock
+import gossip
+import p2p_pb2
+from gossip import PartialView
+from fake_network import FakeNetwork
+
+
+def addresses(view):
+    return {descriptor.peerAddress for descriptor in view.peers()}
+
+
+class PartialViewTest(unittest.TestCase):
+    def setUp(self):
+        random.seed(7)
+        self.network = FakeNetwork()
+
+    def view(self, address, size=gossip.GOSSIP_VIEW_SIZE):
+        view = self.network.nodes[address] = PartialView(address, self.network, size=size)
+        return view
+
+    def test_add_keeps_the_size_and_skips_itself(self):
+        view = self.view('a', size=3)
+        view.add(['a', 'b', 'c', 'b', 'd', 'e'])
+        self.assertEqual(addresses(view), {'b', 'c', 'd'})
+
+    def test_shuffle_exchanges_entries(self):
+        a, b = self.view('a'), self.view('b')
+        a.add(['b', 'c'])
+        b.add(['d', 'e'])
+        self.assertTrue(a.shuffle())
+        # a asked its oldest entry and learned what b sent back; b learned
+        # about a and what a sent along.
+        self.assertEqual(addresses(a), {'c', 'd', 'e'})
+        self.assertEqual(addresses(b), {'a', 'c', 'd', 'e'})
+
+    def test_full_view_replaces_what_it_sent(self):
+        a, b = self.view('a', size=3), self.view('b', size=3)
+        a.add(['b', 'c', 'd'])
+        b.add(['x', 'y', 'z'])
+        self.assertTrue(a.shuffle())
+        self.assertEqual(len(a), 3)
+        self.assertEqual(len(b), 3)
+        self.assertIn('a', addresses(b))
+
+    def test_dead_peer_is_dropped(self):
+        a = self.view('a')
+        a.add(['gone'])
+        self.assertFalse(a.shuffle())
+        self.assertEqual(len(a), 0)
+        self.assertFalse(a.shuffle())
+
+    def test_newer_descriptor_wins(self):
+        a = self.view('a')
+        a._merge([p2p_pb2.PeerDescriptor(peerAddress='b', age=100)], [])
+        a._merge([p2p_pb2.PeerDescriptor(peerAddress='b', age=1)], [])
+        self.assertLess(a.peers()[0].age, 50)
+        a._merge([p2p_pb2.PeerDescriptor(peerAddress='b', age=200)], [])
+        self.assertLess(a.peers()[0].age, 50)
+
+    def test_overlay_stays_connected(self):
+        names = [f'peer{i}' for i in range(30)]
+        views = [self.view(name, size=6) for name in names]
+        # Everyone starts knowing only the next peer on a ring.
+        for i, view in enumerate(views):
+            view.add([names[(i + 1) % len(names)]])
+        for _ in range(20):
+            for view in views:
+                view.shuffle()
+        known = set()
+        for view in views:
+            self.assertGreater(len(view), 0)
+            known |= addresses(view)
+        self.assertEqual(known, set(names))
+
+
+class BackoffTest(unittest.TestCase):
+    def test_empty_view_backs_off(self):
+        view = PartialView('a', FakeNetwork())
+        sleeps = []
+
+        def sleep(delay):
+            sleeps.append(delay)
+            if len(sleeps) == 6:
+                raise SystemExit
+
+        with mock.patch('gossip.time.sleep', sleep), mock.patch('gossip.random.uniform', lambda low, high: 1):
+            with self.assertRaises(SystemExit):
+                view._run(lambda: ['gone'])
+        self.assertEqual(sleeps, [min(gossip.GOSSIP_MAX_BACKOFF, gossip.GOSSIP_INTERVAL * 2 ** i) for i in range(1, 7)])
+
+    def test_successful_shuffle_resets_the_interval(self):
+        network = FakeNetwork()
+        view = PartialView('a', network)
+        sleeps = []
+
+        def sleep(delay):
+            sleeps.append(delay)
+            if len(sleeps) == 3:
+                network.nodes['gone'] = PartialView('gone', network)
+            if len(sleeps) == 5:
+                raise SystemExit
+
+        with mock.patch('gossip.time.sleep', sleep), mock.patch('gossip.random.uniform', lambda low, high: 1):
+            with self.assertRaises(SystemExit):
+                view._run(lambda: ['gone'])
+        self.assertEqual(sleeps[:3], [gossip.GOSSIP_INTERVAL * 2, gossip.GOSSIP_INTERVAL * 4, gossip.GOSSIP_INTERVAL * 8])
+        self.assertEqual(sleeps[3], gossip.GOSSIP_INTERVAL)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+import Pclient
+from load import UploadLoad, read_load
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'server'))
+import Server
+
+
+class LoadReportTest(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp(prefix='test-load-')
+        self.path = os.path.join(self.workdir, 'load.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+
+    def test_unknown_capacity_is_left_out(self):
+        UploadLoad(self.path, capacity=0).write()
+        self.assertEqual(set(read_load(self.path)), {'transfers', 'upload_rate'})
+
+    def test_configured_capacity_is_reported(self):
+        UploadLoad(self.path, capacity=5000).write()
+        self.assertEqual(read_load(self.path)['capacity'], 5000)
+
+    def test_null_values_from_older_snapshots_are_dropped(self):
+        with open(self.path, 'w') as f:
+            f.write('{"transfers": 0, "upload_rate": 0, "capacity": null, "time": %f}' % time.time())
+        self.assertEqual(read_load(self.path), {'transfers': 0, 'upload_rate': 0})
+
+
+class HeartbeatWithLoadTest(unittest.TestCase):
+    # The load the client sends must pass the tracker's heartbeat checks,
+    # or every heartbeat fails and the peer never becomes active.
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp(prefix='test-load-')
+        self.pool = Server.pool
+        Server.DATABASE = os.path.join(self.workdir, 'peers.db')
+        Server.pool = Server.ConnectionPool(Server.DATABASE)
+        Server.init_db()
+        Server.users['alice'] = 'alice'
+        self.client = Server.app.test_client()
+        self.client.post('/login', json={'username': 'alice', 'password': 'alice', 'grpc_url': 'localhost', 'grpc_port': '5001'})
+
+    def tearDown(self):
+        Server.pool = self.pool
+        Server.heartbeats.forget('alice')
+        shutil.rmtree(self.workdir)
+
+    def heartbeat(self, capacity):
+        path = os.path.join(self.workdir, 'load.json')
+        UploadLoad(path, capacity=capacity).write()
+        with mock.patch('Pclient.load_path', lambda grpc_port: path):
+            load = Pclient.peer_load()
+        return self.client.post('/heartbeat', json={
+            'username': 'alice', 'load': load, 'removed': [],
+            'added': [{'filename': 'a.bin', 'fileurl': 'http://localhost/a.bin'}]})
+
+    def test_heartbeat_without_capacity(self):
+        response = self.heartbeat(0)
+        self.assertEqual(response.status_code, 200, response.get_json())
+        self.assertEqual([peer['username'] for peer in self.client.get('/list_peers').get_json()], ['alice'])
+        self.assertEqual([file['filename'] for file in self.client.get('/list_files').get_json()], ['a.bin'])
+
+    def test_heartbeat_with_capacity(self):
+        self.assertEqual(self.heartbeat(5000).status_code, 200)
+
+
+if __name__ == '__main__':
+    unittest.main()
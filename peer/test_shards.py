@@ -0,0 +1,116 @@
+import unittest
+from collections import Counter
+from shards import HashRing, ShardedTracker, merge_peers
+
+
+class FakeResponse:
+    def __init__(self, status_code=200, interval=30):
+        self.status_code = status_code
+        self.interval = interval
+
+    def json(self):
+        return {'interval': self.interval}
+
+
+class FakePrimary:
+    def __init__(self):
+        self.posts = []
+        self.status_code = 200
+
+    def post(self, path, payload, timeout=None):
+        self.posts.append((path, payload))
+        return FakeResponse(self.status_code)
+
+
+class FakeShard:
+    def __init__(self, name):
+        self.name = f'http://{name}:4001'
+        self.primary = FakePrimary()
+
+
+def keys(count):
+    return [f'file{i}.bin' for i in range(count)]
+
+
+class HashRingTest(unittest.TestCase):
+    def test_same_shards_give_the_same_owners(self):
+        first = HashRing([FakeShard('t1'), FakeShard('t2'), FakeShard('t3')])
+        second = HashRing([FakeShard('t3'), FakeShard('t1'), FakeShard('t2')])
+        for key in keys(500):
+            self.assertEqual(first.shard_for(key).name, second.shard_for(key).name)
+
+    def test_keys_spread_over_shards(self):
+        shards = [FakeShard(f't{i}') for i in range(4)]
+        ring = HashRing(shards)
+        owners = Counter(ring.shard_for(key).name for key in keys(8000))
+        self.assertEqual(set(owners), {s.name for s in shards})
+        # 64 points per shard keep every share within a factor of the mean.
+        for count in owners.values():
+            self.assertGreater(count, 8000 / 4 * 0.6)
+            self.assertLess(count, 8000 / 4 * 1.4)
+
+    def test_adding_a_shard_only_moves_keys_to_it(self):
+        shards = [FakeShard(f't{i}') for i in range(3)]
+        before = HashRing(shards)
+        added = FakeShard('t3')
+        after = HashRing(shards + [added])
+        moved = [key for key in keys(8000) if before.shard_for(key) is not after.shard_for(key)]
+        self.assertTrue(all(after.shard_for(key) is added for key in moved))
+        self.assertGreater(len(moved), 8000 / 4 * 0.6)
+        self.assertLess(len(moved), 8000 / 4 * 1.4)
+
+    def test_single_shard_owns_everything(self):
+        only = FakeShard('t1')
+        ring = HashRing([only])
+        self.assertTrue(all(ring.shard_for(key) is only for key in keys(100)))
+
+
+class ShardedTrackerTest(unittest.TestCase):
+    def setUp(self):
+        self.shards = [FakeShard(f't{i}') for i in range(3)]
+        self.tracker = ShardedTracker(self.shards, pool_size=1)
+
+    def heartbeats(self):
+        return {s.name: [payload for path, payload in s.primary.posts if path == '/heartbeat'] for s in self.shards}
+
+    def test_upload_goes_to_the_shard_owning_the_file(self):
+        self.tracker.post('/upload_file', {'username': 'alice', 'filename': 'a.bin'})
+        owner = self.tracker.shard_for('a.bin')
+        self.assertEqual([len(s.primary.posts) for s in self.shards], [int(s is owner) for s in self.shards])
+
+    def test_heartbeat_splits_changes_by_shard(self):
+        home = self.tracker.shard_for('alice')
+        files = keys(30)
+        self.tracker.post('/heartbeat', {'username': 'alice', 'added': [{'filename': name} for name in files], 'removed': []})
+        for s, payloads in self.heartbeats().items():
+            self.assertEqual(len(payloads), 1)
+            self.assertEqual({entry['filename'] for entry in payloads[0]['added']},
+                             {name for name in files if self.tracker.shard_for(name).name == s})
+        for s in self.shards:
+            s.primary.posts.clear()
+
+        # Without changes only the home shard and those holding files hear it.
+        holders = {self.tracker.shard_for(name).name for name in files[:1]}
+        self.tracker.post('/heartbeat', {'username': 'alice', 'added': [], 'removed': files[1:]})
+        for s in self.shards:
+            s.primary.posts.clear()
+        self.tracker.post('/heartbeat', {'username': 'alice', 'added': [], 'removed': []})
+        self.assertEqual({s for s, payloads in self.heartbeats().items() if payloads}, holders | {home.name})
+
+    def test_unknown_peer_on_any_shard_is_reported(self):
+        self.tracker.post('/heartbeat', {'username': 'alice', 'added': [{'filename': name} for name in keys(30)], 'removed': []})
+        self.shards[1].primary.status_code = 404
+        self.assertEqual(self.tracker.post('/heartbeat', {'username': 'alice', 'added': [], 'removed': []}).status_code, 404)
+
+
+class MergePeersTest(unittest.TestCase):
+    def test_home_shard_row_with_all_files(self):
+        shards = [FakeShard('t1'), FakeShard('t2')]
+        ring = HashRing(shards)
+        listings = [[{'username': 'alice', 'status': f'from {s.name}', 'num_files': i + 1}] for i, s in enumerate(shards)]
+        self.assertEqual(merge_peers(ring, listings),
+                         [{'username': 'alice', 'status': f"from {ring.shard_for('alice').name}", 'num_files': 3}])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import os
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+
+TRACKER_TIMEOUT = float(os.getenv('TRACKER_TIMEOUT', '10'))
+
+
+class TrackerClient:
+    # Thin HTTP client for the tracker. GETs are conditional: the last body
+    # and ETag of every URL are kept, so an unchanged catalog costs a 304
+    # with no payload instead of the full listing.
+    def __init__(self, base_url, session=None, pool_size=10):
+        self.base_url = base_url
+        if session is None:
+            session = requests.Session()
+            session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+        self.session = session
+        self._lock = threading.Lock()
+        self._etags = {}
+
+    def url(self, path):
+        return f'{self.base_url}{path}'
+
+    def get_json(self, path, params=None, timeout=TRACKER_TIMEOUT):
+        key = (path, tuple(sorted((params or {}).items())))
+        with self._lock:
+            cached = self._etags.get(key)
+
+        headers = {'If-None-Match': cached[0]} if cached else {}
+        response = self.session.get(self.url(path), params=params, headers=headers, timeout=timeout)
+        if response.status_code == 304 and cached:
+            return 200, cached[1]
+        if response.status_code != 200:
+            return response.status_code, None
+
+        payload = response.json()
+        etag = response.headers.get('ETag')
+        if etag:
+            with self._lock:
+                self._etags[key] = (etag, payload)
+        return 200, payload
+
+    def post(self, path, payload, timeout=TRACKER_TIMEOUT):
+        return self.session.post(self.url(path), json=payload, timeout=timeout)
+
+    def post_json(self, path, payload, timeout=TRACKER_TIMEOUT):
+        response = self.post(path, payload, timeout)
+        return response.status_code, response.json() if response.status_code == 200 else None
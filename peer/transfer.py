@@ -0,0 +1,95 @@
+import os
+import mmap
+import hashlib
+import threading
+from contextlib import contextmanager
+
+MMAP_WINDOW = int(os.getenv('MMAP_WINDOW', str(16 * 1024 * 1024)))
+BUFFER_POOL_SIZE = int(os.getenv('BUFFER_POOL_SIZE', '8'))
+HASH_BUFFER_SIZE = int(os.getenv('HASH_BUFFER_SIZE', str(1024 * 1024)))
+
+
+def mapped_views(f, start, end, step=MMAP_WINDOW):
+    # Yields memoryviews over consecutive step-sized slices of [start, end)
+    # of an open file. Each slice is mapped on its own and unmapped as soon
+    # as the caller asks for the next one, so only one slice of the file is
+    # ever mapped and resident memory does not grow with the file size.
+    # Callers must not keep a view (or a slice of it) past that point.
+    #
+    # A mapping is only safe while nobody truncates the file: touching a
+    # mapped page past the new end raises SIGBUS and kills the process, and
+    # the size check below cannot close that race. Anything that may read
+    # files other programs can change uses read_pieces instead.
+    position = start
+    while position < end:
+        # Stop early instead of mapping past the end of a file that shrank.
+        end = min(end, os.fstat(f.fileno()).st_size)
+        if position >= end:
+            return
+        base = position - position % mmap.ALLOCATIONGRANULARITY
+        length = min(step, end - position)
+        with mmap.mmap(f.fileno(), position - base + length, access=mmap.ACCESS_READ, offset=base) as mapped:
+            with memoryview(mapped) as view, view[position - base:] as piece:
+                yield piece
+        position += length
+
+
+def read_pieces(f, buffer):
+    # Yields memoryviews over buffer, refilled with readinto from the
+    # current position of an open file, one len(buffer)-sized piece at a
+    # time (the last one may be shorter). Each view is overwritten by the
+    # next read, so callers must be done with it before asking for more.
+    view = memoryview(buffer)
+    while True:
+        filled = 0
+        while filled < len(view):
+            count = f.readinto(view[filled:])
+            if not count:
+                break
+            filled += count
+        if filled:
+            yield view[:filled]
+        if filled < len(view):
+            return
+
+
+class BufferPool:
+    # Reusable bytearrays for assembling downloaded pieces, so a download
+    # allocates one buffer per worker instead of one per piece. Up to
+    # max_buffers are kept between uses; when all of them are busy a new
+    # one is allocated and simply not kept afterwards.
+    def __init__(self, max_buffers=BUFFER_POOL_SIZE):
+        self.max_buffers = max_buffers
+        self._lock = threading.Lock()
+        self._free = []
+        self.allocated = 0
+
+    @contextmanager
+    def buffer(self, size):
+        with self._lock:
+            fits = [buffer for buffer in self._free if len(buffer) >= size]
+            buffer = min(fits, key=len) if fits else None
+            if buffer is not None:
+                self._free.remove(buffer)
+            else:
+                self.allocated += 1
+        if buffer is None:
+            buffer = bytearray(size)
+        try:
+            yield buffer
+        finally:
+            with self._lock:
+                if len(self._free) < self.max_buffers:
+                    self._free.append(buffer)
+
+
+# Buffers for hashing shared files, reused across describe and digest calls.
+hash_buffers = BufferPool()
+
+
+def file_sha256(path, buffer_size=HASH_BUFFER_SIZE):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f, hash_buffers.buffer(buffer_size) as buffer:
+        for piece in read_pieces(f, memoryview(buffer)[:buffer_size]):
+            digest.update(piece)
+    return digest.hexdigest()
@@ -0,0 +1,209 @@
+import io
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+from urllib.parse import parse_qs
+from concurrent.futures import ThreadPoolExecutor
+import uvicorn
+
+import Server
+
+SERVER_PORT = os.getenv('SERVER_PORT')
+ASYNC_WORKERS = int(os.getenv('ASYNC_WORKERS', '16'))
+ASYNC_MAX_CONNECTIONS = int(os.getenv('ASYNC_MAX_CONNECTIONS', '4096'))
+
+# Every blocking SQLite call runs on this bounded pool, so the event loop
+# keeps accepting and parsing requests while queries are in flight.
+executor = ThreadPoolExecutor(max_workers=ASYNC_WORKERS, thread_name_prefix='tracker-db')
+
+JSON_HEADERS = [(b'content-type', b'application/json')]
+
+async def read_body(receive):
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            return body
+
+async def send_json(send, payload, status=200):
+    await send({'type': 'http.response.start', 'status': status, 'headers': JSON_HEADERS})
+    await send({'type': 'http.response.body', 'body': json.dumps(payload).encode()})
+
+def build_environ(scope, body):
+    server_name, server_port = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': '',
+        'PATH_INFO': scope['path'],
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server_name,
+        'SERVER_PORT': str(server_port),
+        'SERVER_PROTOCOL': f"HTTP/{scope['http_version']}",
+        'REMOTE_ADDR': (scope.get('client') or ('', 0))[0],
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        key = name.decode('latin-1').upper().replace('-', '_')
+        if key == 'CONTENT_TYPE':
+            environ[key] = value.decode('latin-1')
+        elif key != 'CONTENT_LENGTH':
+            environ[f'HTTP_{key}'] = value.decode('latin-1')
+    return environ
+
+def run_flask(loop, send, environ):
+    # Serves a route through the Flask app on a worker thread. Chunks are
+    # handed back to the event loop one at a time, so streamed responses keep
+    # their backpressure.
+    response = {}
+
+    def start_response(status, headers, exc_info=None):
+        response['status'] = int(status.split(' ', 1)[0])
+        response['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+
+    def emit(message):
+        asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+    result = Server.app.wsgi_app(environ, start_response)
+    try:
+        emit({'type': 'http.response.start', 'status': response['status'], 'headers': response['headers']})
+        for chunk in result:
+            if chunk:
+                emit({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        emit({'type': 'http.response.body', 'body': b''})
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+
+def write_through_heartbeat(username, timestamp, interval, first, data):
+    with Server.pool.connection() as db:
+        return Server.write_heartbeat(db, username, timestamp, interval, first, data)
+
+async def heartbeat(scope, receive, send, body):
+    # Most heartbeats only refresh the in-memory liveness table, so they are
+    # answered on the event loop without touching the worker pool.
+    try:
+        data = json.loads(body)
+    except ValueError:
+        data = None
+    if Server.READ_ONLY:
+        await send_json(send, {"message": "This tracker is a read-only replica, send writes to its primary"}, 403)
+        return
+    error = Server.heartbeat_error(data)
+    if error:
+        await send_json(send, {"message": error}, 400)
+        return
+    username = data['username']
+    now = time.time()
+    first, interval = Server.heartbeats.record(username, now, data.get('load'))
+    if Server.needs_write(first, data):
+        known = await asyncio.get_running_loop().run_in_executor(executor, write_through_heartbeat, username, now, interval, first, data)
+        if not known:
+            await send_json(send, {"message": "User not found"}, 404)
+            return
+    await send_json(send, Server.heartbeat_reply(interval))
+
+def fetch_changes(since):
+    with Server.pool.connection() as db:
+        return Server.fetch_changes(db, since, Server.CHANGES_PAGE_SIZE)
+
+def subscription_start(scope):
+    query = parse_qs(scope['query_string'].decode('latin-1'))
+    headers = dict(scope['headers'])
+    try:
+        return int(query['since'][0]) if 'since' in query else int(headers.get(b'last-event-id', b'0'))
+    except ValueError:
+        return 0
+
+async def subscribe(scope, receive, send, body):
+    # Same stream as the Flask /subscribe route, but an idle subscriber is
+    # only an Event waiting on the loop, not a blocked thread.
+    loop = asyncio.get_running_loop()
+    changed = asyncio.Event()
+    disconnected = asyncio.Event()
+
+    def listener(version):
+        loop.call_soon_threadsafe(changed.set)
+
+    async def watch_disconnect():
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+        disconnected.set()
+        changed.set()
+
+    watcher = asyncio.create_task(watch_disconnect())
+    Server.change_feed.add_listener(listener)
+    try:
+        await send({'type': 'http.response.start', 'status': 200,
+                    'headers': [(b'content-type', b'text/event-stream'), (b'cache-control', b'no-cache')]})
+        await send({'type': 'http.response.body', 'body': b': subscribed\n\n', 'more_body': True})
+        known = subscription_start(scope)
+        while not disconnected.is_set():
+            changed.clear()
+            rows, latest = await loop.run_in_executor(executor, fetch_changes, known)
+            if rows is None:
+                await send({'type': 'http.response.body', 'body': Server.sse_reset(latest).encode(), 'more_body': True})
+                break
+            if rows:
+                await send({'type': 'http.response.body', 'body': Server.sse_events(rows).encode(), 'more_body': True})
+                known = rows[-1]['version']
+            elif Server.change_feed.version <= known:
+                try:
+                    await asyncio.wait_for(changed.wait(), Server.SUBSCRIBE_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    await send({'type': 'http.response.body', 'body': b': keepalive\n\n', 'more_body': True})
+        if not disconnected.is_set():
+            await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        Server.change_feed.remove_listener(listener)
+        watcher.cancel()
+
+NATIVE_ROUTES = {
+    ('POST', '/heartbeat'): heartbeat,
+    ('GET', '/subscribe'): subscribe,
+}
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            if Server.READ_ONLY:
+                await asyncio.get_running_loop().run_in_executor(executor, Server.open_replica)
+            else:
+                Server.init_db()
+            Server.start_background_tasks()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            executor.shutdown(wait=True)
+            Server.pool.close()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+        return
+
+    body = await read_body(receive)
+    handler = NATIVE_ROUTES.get((scope['method'], scope['path']))
+    if handler:
+        await handler(scope, receive, send, body)
+    else:
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(executor, run_flask, loop, send, build_environ(scope, body))
+
+
+if __name__ == "__main__":
+    logging.info(f"Async tracker listening on port {SERVER_PORT} with {ASYNC_WORKERS} database workers")
+    uvicorn.run(app, host='0.0.0.0', port=int(SERVER_PORT), lifespan='on', access_log=False,
+                log_level='warning', limit_concurrency=ASYNC_MAX_CONNECTIONS, backlog=2048)
@@ -1,15 +1,46 @@
 import os
+import json
+import base64
 import logging
 import sqlite3
-from flask import Flask, request, jsonify
-import json
-from datetime import datetime
-from threading import Thread
+import queue
+from contextlib import contextmanager
+from flask import Flask, Response, request, jsonify, g, stream_with_context
+from threading import Thread, Lock, Condition
 import time
 
-HEARTBEAT_TIMEOUT = 10
+HEARTBEAT_INTERVAL = float(os.getenv('HEARTBEAT_INTERVAL', '4'))
+HEARTBEAT_MAX_INTERVAL = float(os.getenv('HEARTBEAT_MAX_INTERVAL', '60'))
+HEARTBEAT_RATE = float(os.getenv('HEARTBEAT_RATE', '500'))
+HEARTBEAT_MISSES = int(os.getenv('HEARTBEAT_MISSES', '3'))
+HEARTBEAT_FLUSH_INTERVAL = float(os.getenv('HEARTBEAT_FLUSH_INTERVAL', '2'))
+HEARTBEAT_SWEEP_INTERVAL = float(os.getenv('HEARTBEAT_SWEEP_INTERVAL', '2'))
 SERVER_URL = os.getenv('SERVER_URL')
 SERVER_PORT = os.getenv('SERVER_PORT')
+SERVER_DEBUG = os.getenv('SERVER_DEBUG', '1') == '1'
+# 'replica' serves reads from the database file of a primary on the same
+# volume and rejects writes.
+TRACKER_ROLE = os.getenv('TRACKER_ROLE', 'primary')
+READ_ONLY = TRACKER_ROLE == 'replica'
+# Status of peer p as queries see it. A replica cannot sweep expired peers
+# into 'down', and while its primary is down nobody does, so it checks
+# their heartbeat deadlines itself.
+NOW = "((julianday('now') - 2440587.5) * 86400.0)"
+PEER_STATUS = f"(CASE WHEN p.status = 'active' AND p.heartbeat_deadline < {NOW} THEN 'down' ELSE p.status END)" if READ_ONLY else "p.status"
+# file_stats is kept by the primary's triggers, which never see a peer
+# expire on a replica; replicas count active holders instead.
+FILE_STATS = f'''(
+    SELECT MIN(f.id) AS rowid, f.filename, f.fileurl, COUNT(*) AS count
+    FROM peer_files f JOIN peers p ON p.id = f.peer_id
+    WHERE {PEER_STATUS} = 'active'
+    GROUP BY f.filename
+)''' if READ_ONLY else "file_stats"
+# Active holders of content c, from content_stats on a primary for the same
+# reason.
+CONTENT_COUNT = f'''(
+    SELECT COUNT(DISTINCT f.peer_id) FROM peer_files f JOIN peers p ON p.id = f.peer_id
+    WHERE f.content_hash = c.content_hash AND {PEER_STATUS} = 'active'
+)''' if READ_ONLY else "(SELECT count FROM content_stats s WHERE s.content_hash = c.content_hash)"
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
@@ -20,56 +51,793 @@ users = {
     "2": "2",
     "3": "3"
 }
+# Extra accounts as user:password pairs separated by commas.
+users.update(entry.split(':', 1) for entry in os.getenv('TRACKER_USERS', '').split(',') if ':' in entry)
+
+DATABASE = os.getenv('DATABASE', 'peers.db')
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '8'))
+DB_JOURNAL_MODE = os.getenv('DB_JOURNAL_MODE', 'WAL')
+DB_SYNCHRONOUS = os.getenv('DB_SYNCHRONOUS', 'NORMAL')
+DB_CACHE_KB = int(os.getenv('DB_CACHE_KB', '16384'))
+
+DISCOVERY_MODES = ('exact', 'prefix', 'fts')
+PEER_STATUSES = ('online', 'active', 'down')
+# sort -> (ORDER BY clause, cursor key columns, keyset condition for rows
+# after the cursor)
+FILE_ORDERINGS = {
+    'registered': ('rowid', ('rowid',), 'rowid > :after0'),
+    'name': ('filename', ('filename',), 'filename > :after0'),
+    'count': ('count DESC, filename', ('count', 'filename'), '(count < :after0 OR (count = :after0 AND filename > :after1))'),
+}
+STREAM_BATCH_SIZE = 500
+CHANGES_RETENTION = int(os.getenv('CHANGES_RETENTION', '10000'))
+CHANGES_PAGE_SIZE = 1000
+CHANGE_FEED_INTERVAL = float(os.getenv('CHANGE_FEED_INTERVAL', '0.5'))
+SUBSCRIBE_KEEPALIVE = float(os.getenv('SUBSCRIBE_KEEPALIVE', '15'))
+DISCOVER_BATCH_LIMIT = int(os.getenv('DISCOVER_BATCH_LIMIT', '1000'))
+fts_enabled = False
+
+class ConnectionPool:
+    def __init__(self, database, size=DB_POOL_SIZE, journal_mode=DB_JOURNAL_MODE, synchronous=DB_SYNCHRONOUS, read_only=False):
+        self.database = database
+        self.read_only = read_only
+        self.size = size
+        self.journal_mode = journal_mode
+        self.synchronous = synchronous
+        # LIFO so the most recently used (warmest) connection is handed out first.
+        self._idle = queue.LifoQueue()
 
-DATABASE = 'peers.db'
+    def connect(self):
+        # Connections are handed between request threads, never shared by two
+        # at once. The statement cache keeps every query compiled per connection.
+        if self.read_only:
+            # The journal mode is the primary's to set.
+            db = sqlite3.connect(f'file:{self.database}?mode=ro', uri=True, check_same_thread=False, cached_statements=256)
+        else:
+            db = sqlite3.connect(self.database, check_same_thread=False, cached_statements=256)
+            db.execute(f'PRAGMA journal_mode = {self.journal_mode}')
+            db.execute(f'PRAGMA synchronous = {self.synchronous}')
+        db.row_factory = sqlite3.Row
+        db.execute(f'PRAGMA cache_size = -{DB_CACHE_KB}')
+        db.execute('PRAGMA temp_store = MEMORY')
+        db.execute('PRAGMA busy_timeout = 5000')
+        return db
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return self.connect()
+
+    def release(self, db):
+        if db.in_transaction:
+            db.rollback()
+        if self._idle.qsize() < self.size:
+            self._idle.put(db)
+        else:
+            db.close()
+
+    @contextmanager
+    def connection(self):
+        db = self.acquire()
+        try:
+            yield db
+        finally:
+            self.release(db)
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+pool = ConnectionPool(DATABASE, read_only=READ_ONLY)
 
 def get_db():
-    db = sqlite3.connect(DATABASE) 
-    db.row_factory = sqlite3.Row
-    return db
+    if 'db' not in g:
+        g.db = pool.acquire()
+    return g.db
+
+@app.teardown_appcontext
+def release_db(exception):
+    db = g.pop('db', None)
+    if db is not None:
+        pool.release(db)
+
+PEERS_TABLE = '''
+    CREATE TABLE IF NOT EXISTS {name} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT UNIQUE NOT NULL,
+        grpc_url TEXT NOT NULL,
+        grpc_port TEXT NOT NULL,
+        status TEXT NOT NULL,
+        last_heartbeat REAL,
+        heartbeat_deadline REAL,
+        load TEXT
+    )
+'''
 
 def init_db():
     with app.app_context():
         db = get_db()
         cursor = db.cursor()
+        cursor.execute(PEERS_TABLE.format(name='peers'))
         cursor.execute('''
-            CREATE TABLE IF NOT EXISTS peers (
+            CREATE TABLE IF NOT EXISTS peer_files (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT UNIQUE NOT NULL,
-                grpc_url TEXT NOT NULL,
-                grpc_port TEXT NOT NULL,
-                status TEXT NOT NULL,
-                files TEXT NOT NULL,
-                last_heartbeat TIMESTAMP
+                peer_id INTEGER NOT NULL REFERENCES peers(id),
+                filename TEXT NOT NULL,
+                fileurl TEXT NOT NULL,
+                content_hash TEXT
             )
         ''')
+        add_column(cursor, 'peer_files', 'content_hash', 'TEXT')
+        cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_peer_files_peer ON peer_files (peer_id, filename)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_peer_files_filename ON peer_files (filename)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_peer_files_content ON peer_files (content_hash, peer_id)')
+        migrate_files_column(cursor)
+        migrate_heartbeat_timestamps(cursor)
+        migrate_heartbeat_deadlines(cursor)
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_peers_status_deadline ON peers (status, heartbeat_deadline)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_peers_status ON peers (status)')
+        init_file_stats(cursor)
+        init_content_stats(cursor)
+        init_catalog_changes(cursor)
+        init_fts(cursor)
         db.commit()
 
+def open_replica():
+    # A replica starts once its primary has created the schema, and offers
+    # full-text discovery if the primary could build the index.
+    global fts_enabled
+    while True:
+        try:
+            with pool.connection() as db:
+                tables = {row['name'] for row in db.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        except sqlite3.OperationalError:
+            tables = set()
+        if 'catalog_changes' in tables:
+            fts_enabled = 'peer_files_fts' in tables
+            logging.info(f"Serving reads from {DATABASE} as a read-only replica")
+            return
+        logging.info(f"Waiting for the primary to create {DATABASE}")
+        time.sleep(1)
+
+def add_column(cursor, table, column, definition):
+    columns = [row['name'] for row in cursor.execute(f'PRAGMA table_info({table})')]
+    if column not in columns:
+        cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
+def migrate_files_column(cursor):
+    # Databases created before peer_files existed keep each peer's files as a
+    # JSON array in peers.files; move them into rows and drop the column.
+    columns = [column['name'] for column in cursor.execute('PRAGMA table_info(peers)')]
+    if 'files' not in columns:
+        return
+
+    logging.info("Migrating peers.files into the peer_files table.")
+    cursor.execute('''
+        INSERT OR IGNORE INTO peer_files (peer_id, filename, fileurl)
+        SELECT peers.id, json_extract(entry.value, '$.filename'), COALESCE(json_extract(entry.value, '$.fileurl'), '')
+        FROM peers, json_each(peers.files) AS entry
+        WHERE json_valid(peers.files) AND json_extract(entry.value, '$.filename') IS NOT NULL
+    ''')
+    cursor.execute(PEERS_TABLE.format(name='peers_migrated'))
+    cursor.execute('''
+        INSERT INTO peers_migrated (id, username, grpc_url, grpc_port, status, last_heartbeat)
+        SELECT id, username, grpc_url, grpc_port, status, last_heartbeat FROM peers
+    ''')
+    cursor.execute('DROP TABLE peers')
+    cursor.execute('ALTER TABLE peers_migrated RENAME TO peers')
+
+def migrate_heartbeat_timestamps(cursor):
+    # Heartbeats used to be stored as 'YYYY-MM-DD HH:MM:SS.ffffff' UTC strings;
+    # they are now Unix epoch seconds so expiry is a plain numeric comparison.
+    cursor.execute('''
+        UPDATE peers SET last_heartbeat = (julianday(last_heartbeat) - 2440587.5) * 86400.0
+        WHERE typeof(last_heartbeat) = 'text'
+    ''')
+
+def migrate_heartbeat_deadlines(cursor):
+    # Peers are now expired against a deadline set by each heartbeat, since
+    # the interval the tracker asks for changes with the number of peers.
+    add_column(cursor, 'peers', 'heartbeat_deadline', 'REAL')
+    add_column(cursor, 'peers', 'load', 'TEXT')
+    cursor.execute('''
+        UPDATE peers SET heartbeat_deadline = last_heartbeat + ?
+        WHERE heartbeat_deadline IS NULL AND last_heartbeat IS NOT NULL
+    ''', (HEARTBEAT_INTERVAL * HEARTBEAT_MISSES,))
+    cursor.execute('DROP INDEX IF EXISTS idx_peers_status_heartbeat')
+
+# URL of the first registered active holder of the file_stats row being
+# updated, or the current one if none is left.
+FIRST_ACTIVE_FILEURL = '''COALESCE((
+    SELECT f.fileurl FROM peer_files f JOIN peers p ON p.id = f.peer_id
+    WHERE f.filename = file_stats.filename AND p.status = 'active'
+    ORDER BY f.id LIMIT 1
+), file_stats.fileurl)'''
+
+def init_file_stats(cursor):
+    # Materialized filename -> active replica count behind /list_files. The
+    # triggers keep it current on every upload, login/logout and expiry, so
+    # listing never has to aggregate peer_files.
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'file_stats'")
+    exists = cursor.fetchone() is not None
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS file_stats (
+            filename TEXT PRIMARY KEY,
+            fileurl TEXT NOT NULL,
+            count INTEGER NOT NULL
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_file_stats_count ON file_stats (count DESC, filename)')
+
+    # fileurl is that of the active holder registered first. Whenever a
+    # holder goes down, leaves or changes its URL, the URL is picked again
+    # from the remaining active holders. Triggers are recreated so existing
+    # databases pick that up.
+    for name in ('file_stats_file_added', 'file_stats_file_removed', 'file_stats_file_updated',
+                 'file_stats_peer_up', 'file_stats_peer_down'):
+        cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+    cursor.execute('''
+        CREATE TRIGGER file_stats_file_added AFTER INSERT ON peer_files
+        WHEN (SELECT status FROM peers WHERE id = new.peer_id) = 'active' BEGIN
+            INSERT INTO file_stats (filename, fileurl, count) VALUES (new.filename, new.fileurl, 1)
+            ON CONFLICT(filename) DO UPDATE SET count = count + 1;
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER file_stats_file_removed AFTER DELETE ON peer_files
+        WHEN (SELECT status FROM peers WHERE id = old.peer_id) = 'active' BEGIN
+            UPDATE file_stats SET count = count - 1 WHERE filename = old.filename;
+            DELETE FROM file_stats WHERE filename = old.filename AND count <= 0;
+            UPDATE file_stats SET fileurl = {FIRST_ACTIVE_FILEURL} WHERE filename = old.filename;
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER file_stats_file_updated AFTER UPDATE OF fileurl ON peer_files
+        WHEN old.fileurl != new.fileurl AND (SELECT status FROM peers WHERE id = new.peer_id) = 'active' BEGIN
+            UPDATE file_stats SET fileurl = {FIRST_ACTIVE_FILEURL} WHERE filename = new.filename;
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER file_stats_peer_up AFTER UPDATE OF status ON peers
+        WHEN new.status = 'active' AND old.status != 'active' BEGIN
+            INSERT INTO file_stats (filename, fileurl, count)
+            SELECT filename, fileurl, 1 FROM peer_files WHERE peer_id = new.id
+            ON CONFLICT(filename) DO UPDATE SET count = count + 1;
+            UPDATE file_stats SET fileurl = {FIRST_ACTIVE_FILEURL}
+            WHERE filename IN (SELECT filename FROM peer_files WHERE peer_id = new.id);
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER file_stats_peer_down AFTER UPDATE OF status ON peers
+        WHEN old.status = 'active' AND new.status != 'active' BEGIN
+            UPDATE file_stats SET count = count - 1
+            WHERE filename IN (SELECT filename FROM peer_files WHERE peer_id = new.id);
+            DELETE FROM file_stats
+            WHERE count <= 0 AND filename IN (SELECT filename FROM peer_files WHERE peer_id = new.id);
+            UPDATE file_stats SET fileurl = {FIRST_ACTIVE_FILEURL}
+            WHERE filename IN (SELECT filename FROM peer_files WHERE peer_id = new.id);
+        END
+    ''')
+
+    if not exists:
+        # SQLite takes the bare fileurl column from the row holding MIN(f.id),
+        # so each filename reports the URL of its first registered replica.
+        cursor.execute('''
+            INSERT INTO file_stats (filename, fileurl, count)
+            SELECT filename, fileurl, count FROM (
+                SELECT f.filename, f.fileurl, COUNT(*) AS count, MIN(f.id) AS first_id
+                FROM peer_files f JOIN peers p ON p.id = f.peer_id
+                WHERE p.status = 'active'
+                GROUP BY f.filename
+                ORDER BY first_id
+            )
+        ''')
+    else:
+        # URLs kept from before holders were re-picked.
+        cursor.execute(f'UPDATE file_stats SET fileurl = {FIRST_ACTIVE_FILEURL}')
+
+def init_content_stats(cursor):
+    # Files are also identified by the SHA-256 of their content. file_contents
+    # holds the size and piece hashes registered for each content hash, and
+    # content_stats counts the active peers holding it under any filename,
+    # kept current by triggers like file_stats.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS file_contents (
+            content_hash TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            piece_size INTEGER NOT NULL,
+            piece_hashes TEXT NOT NULL
+        )
+    ''')
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'content_stats'")
+    exists = cursor.fetchone() is not None
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS content_stats (
+            content_hash TEXT PRIMARY KEY,
+            count INTEGER NOT NULL
+        )
+    ''')
+
+    # A peer holding the same content under two names is still one replica,
+    # hence the checks for another row of the same peer and hash.
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS content_stats_file_added AFTER INSERT ON peer_files
+        WHEN new.content_hash IS NOT NULL
+        AND (SELECT status FROM peers WHERE id = new.peer_id) = 'active'
+        AND NOT EXISTS (SELECT 1 FROM peer_files WHERE content_hash = new.content_hash AND peer_id = new.peer_id AND id != new.id) BEGIN
+            INSERT INTO content_stats (content_hash, count) VALUES (new.content_hash, 1)
+            ON CONFLICT(content_hash) DO UPDATE SET count = count + 1;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS content_stats_file_removed AFTER DELETE ON peer_files
+        WHEN old.content_hash IS NOT NULL
+        AND (SELECT status FROM peers WHERE id = old.peer_id) = 'active'
+        AND NOT EXISTS (SELECT 1 FROM peer_files WHERE content_hash = old.content_hash AND peer_id = old.peer_id) BEGIN
+            UPDATE content_stats SET count = count - 1 WHERE content_hash = old.content_hash;
+            DELETE FROM content_stats WHERE content_hash = old.content_hash AND count <= 0;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS content_stats_file_changed AFTER UPDATE OF content_hash ON peer_files
+        WHEN old.content_hash IS NOT new.content_hash
+        AND (SELECT status FROM peers WHERE id = new.peer_id) = 'active' BEGIN
+            UPDATE content_stats SET count = count - 1 WHERE content_hash = old.content_hash
+            AND NOT EXISTS (SELECT 1 FROM peer_files WHERE content_hash = old.content_hash AND peer_id = old.peer_id);
+            DELETE FROM content_stats WHERE content_hash = old.content_hash AND count <= 0;
+            INSERT INTO content_stats (content_hash, count)
+            SELECT new.content_hash, 1 WHERE new.content_hash IS NOT NULL
+            AND NOT EXISTS (SELECT 1 FROM peer_files WHERE content_hash = new.content_hash AND peer_id = new.peer_id AND id != new.id)
+            ON CONFLICT(content_hash) DO UPDATE SET count = count + 1;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS content_stats_peer_up AFTER UPDATE OF status ON peers
+        WHEN new.status = 'active' AND old.status != 'active' BEGIN
+            INSERT INTO content_stats (content_hash, count)
+            SELECT DISTINCT content_hash, 1 FROM peer_files WHERE peer_id = new.id AND content_hash IS NOT NULL
+            ON CONFLICT(content_hash) DO UPDATE SET count = count + 1;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS content_stats_peer_down AFTER UPDATE OF status ON peers
+        WHEN old.status = 'active' AND new.status != 'active' BEGIN
+            UPDATE content_stats SET count = count - 1
+            WHERE content_hash IN (SELECT content_hash FROM peer_files WHERE peer_id = new.id);
+            DELETE FROM content_stats
+            WHERE count <= 0 AND content_hash IN (SELECT content_hash FROM peer_files WHERE peer_id = new.id);
+        END
+    ''')
+
+    if not exists:
+        cursor.execute('''
+            INSERT INTO content_stats (content_hash, count)
+            SELECT f.content_hash, COUNT(DISTINCT f.peer_id)
+            FROM peer_files f JOIN peers p ON p.id = f.peer_id
+            WHERE p.status = 'active' AND f.content_hash IS NOT NULL
+            GROUP BY f.content_hash
+        ''')
+
+def init_catalog_changes(cursor):
+    # Append-only change log of everything the listings expose. Its highest
+    # version is the catalog version used for ETags and /changes deltas.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS catalog_changes (
+            version INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            username TEXT NOT NULL,
+            status TEXT,
+            grpc_url TEXT,
+            grpc_port TEXT,
+            filename TEXT,
+            fileurl TEXT,
+            content_hash TEXT,
+            created_at REAL NOT NULL
+        )
+    ''')
+    add_column(cursor, 'catalog_changes', 'content_hash', 'TEXT')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS catalog_peer_added AFTER INSERT ON peers BEGIN
+            INSERT INTO catalog_changes (kind, username, status, grpc_url, grpc_port, created_at)
+            VALUES ('peer', new.username, new.status, new.grpc_url, new.grpc_port, (julianday('now') - 2440587.5) * 86400.0);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS catalog_peer_changed AFTER UPDATE OF status, grpc_url, grpc_port ON peers
+        WHEN old.status != new.status OR old.grpc_url != new.grpc_url OR old.grpc_port != new.grpc_port BEGIN
+            INSERT INTO catalog_changes (kind, username, status, grpc_url, grpc_port, created_at)
+            VALUES ('peer', new.username, new.status, new.grpc_url, new.grpc_port, (julianday('now') - 2440587.5) * 86400.0);
+        END
+    ''')
+    # File triggers are recreated so databases from before content hashes
+    # pick up the new column.
+    for name in ('catalog_file_added', 'catalog_file_updated', 'catalog_file_removed'):
+        cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+    cursor.execute('''
+        CREATE TRIGGER catalog_file_added AFTER INSERT ON peer_files BEGIN
+            INSERT INTO catalog_changes (kind, username, filename, fileurl, content_hash, created_at)
+            VALUES ('file_added', (SELECT username FROM peers WHERE id = new.peer_id), new.filename, new.fileurl, new.content_hash, (julianday('now') - 2440587.5) * 86400.0);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER catalog_file_updated AFTER UPDATE OF fileurl, content_hash ON peer_files
+        WHEN old.fileurl != new.fileurl OR old.content_hash IS NOT new.content_hash BEGIN
+            INSERT INTO catalog_changes (kind, username, filename, fileurl, content_hash, created_at)
+            VALUES ('file_added', (SELECT username FROM peers WHERE id = new.peer_id), new.filename, new.fileurl, new.content_hash, (julianday('now') - 2440587.5) * 86400.0);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER catalog_file_removed AFTER DELETE ON peer_files BEGIN
+            INSERT INTO catalog_changes (kind, username, filename, fileurl, content_hash, created_at)
+            VALUES ('file_removed', (SELECT username FROM peers WHERE id = old.peer_id), old.filename, old.fileurl, old.content_hash, (julianday('now') - 2440587.5) * 86400.0);
+        END
+    ''')
+
+def catalog_version(db):
+    return db.execute('SELECT COALESCE(MAX(version), 0) FROM catalog_changes').fetchone()[0]
+
+def listing_version(db):
+    # ETag of the listings. On a replica a peer also goes down when its
+    # deadline passes, which bumps no catalog version, so the expired peers
+    # are part of it.
+    version = catalog_version(db)
+    if not READ_ONLY:
+        return version
+    count, ids = db.execute(f"SELECT COUNT(*), TOTAL(id) FROM peers p WHERE p.status = 'active' AND p.heartbeat_deadline < {NOW}").fetchone()
+    return f'{version}-{count}-{int(ids)}'
+
+def fetch_changes(db, since, limit):
+    # Returns (rows, latest), or (None, latest) when the log no longer covers
+    # 'since' (pruned, or the database was reset) and the client has to
+    # refetch the full catalog.
+    cursor = db.cursor()
+    cursor.execute('SELECT MIN(version), MAX(version) FROM catalog_changes')
+    oldest, latest = cursor.fetchone()
+    latest = latest or 0
+    if since > latest or (oldest is not None and since < oldest - 1):
+        return None, latest
+    cursor.execute('SELECT * FROM catalog_changes WHERE version > ? ORDER BY version LIMIT ?', (since, max(limit, 1)))
+    return cursor.fetchall(), latest
+
+def change_to_dict(row):
+    return {
+        "version": row['version'],
+        "kind": row['kind'],
+        "username": row['username'],
+        "status": row['status'],
+        "grpc_url": row['grpc_url'],
+        "grpc_port": row['grpc_port'],
+        "filename": row['filename'],
+        "fileurl": row['fileurl'],
+        "content_hash": row['content_hash'],
+    }
+
+def sse_events(rows):
+    return ''.join(f"id: {row['version']}\nevent: {row['kind']}\ndata: {json.dumps(change_to_dict(row))}\n\n" for row in rows)
+
+def sse_reset(latest):
+    return f"event: reset\ndata: {json.dumps({'version': latest})}\n\n"
+
+class ChangeFeed:
+    # Wakes catalog subscribers when the catalog version moves. Threads block
+    # in wait(); the async server registers listeners instead.
+    def __init__(self):
+        self._condition = Condition()
+        self._listeners = set()
+        self.version = 0
+
+    def publish(self, version):
+        with self._condition:
+            if version <= self.version:
+                return
+            self.version = version
+            self._condition.notify_all()
+            listeners = list(self._listeners)
+        for listener in listeners:
+            listener(version)
+
+    def wait(self, known, timeout):
+        with self._condition:
+            self._condition.wait_for(lambda: self.version > known, timeout)
+            return self.version
+
+    def add_listener(self, listener):
+        with self._condition:
+            self._listeners.add(listener)
+
+    def remove_listener(self, listener):
+        with self._condition:
+            self._listeners.discard(listener)
+
+change_feed = ChangeFeed()
+
+def change_feed_poller():
+    # One cheap MAX(version) query per interval, however many subscribers.
+    while True:
+        try:
+            with pool.connection() as db:
+                change_feed.publish(catalog_version(db))
+        except Exception as e:
+            logging.error(f"Error polling catalog changes: {e}")
+        time.sleep(CHANGE_FEED_INTERVAL)
+
+def init_fts(cursor):
+    # External-content FTS5 index over peer_files.filename, kept in sync by
+    # triggers. Builds of SQLite without FTS5 just lose the 'fts' mode.
+    global fts_enabled
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'peer_files_fts'")
+    exists = cursor.fetchone() is not None
+    try:
+        cursor.execute("CREATE VIRTUAL TABLE IF NOT EXISTS peer_files_fts USING fts5(filename, content='peer_files', content_rowid='id')")
+    except sqlite3.OperationalError as e:
+        logging.warning(f"Full-text file discovery disabled: {e}")
+        return
+
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS peer_files_fts_insert AFTER INSERT ON peer_files BEGIN
+            INSERT INTO peer_files_fts (rowid, filename) VALUES (new.id, new.filename);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS peer_files_fts_delete AFTER DELETE ON peer_files BEGIN
+            INSERT INTO peer_files_fts (peer_files_fts, rowid, filename) VALUES ('delete', old.id, old.filename);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS peer_files_fts_update AFTER UPDATE OF filename ON peer_files BEGIN
+            INSERT INTO peer_files_fts (peer_files_fts, rowid, filename) VALUES ('delete', old.id, old.filename);
+            INSERT INTO peer_files_fts (rowid, filename) VALUES (new.id, new.filename);
+        END
+    ''')
+    if not exists:
+        cursor.execute("INSERT INTO peer_files_fts (peer_files_fts) VALUES ('rebuild')")
+    fts_enabled = True
+
+class HeartbeatBuffer:
+    # In-memory liveness table. Heartbeats only refresh a timestamp here; the
+    # timestamps reach SQLite in one batched transaction per flush. The first
+    # heartbeat of a peer that is not yet active is reported back to the
+    # caller so the status change can be written through immediately.
+    #
+    # The interval handed back to peers grows with the number of active ones
+    # so the whole fleet sends about HEARTBEAT_RATE heartbeats per second, and
+    # each heartbeat moves its peer's deadline HEARTBEAT_MISSES intervals out.
+    def __init__(self):
+        self._lock = Lock()
+        self._pending = {}
+        self._active = set()
+
+    def interval(self):
+        return min(HEARTBEAT_MAX_INTERVAL, max(HEARTBEAT_INTERVAL, len(self._active) / HEARTBEAT_RATE))
+
+    def record(self, username, timestamp, load=None):
+        load = json.dumps(load) if load is not None else None
+        with self._lock:
+            first = username not in self._active
+            self._active.add(username)
+            interval = self.interval()
+            self._pending[username] = (timestamp, timestamp + interval * HEARTBEAT_MISSES, load)
+            return first, interval
+
+    def expire(self, username):
+        with self._lock:
+            self._active.discard(username)
+
+    def forget(self, username):
+        with self._lock:
+            self._active.discard(username)
+            self._pending.pop(username, None)
+
+    def drain(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        return pending
+
+heartbeats = HeartbeatBuffer()
+
+def flush_heartbeats():
+    pending = heartbeats.drain()
+    if pending:
+        with pool.connection() as db:
+            db.executemany('UPDATE peers SET last_heartbeat = ?, heartbeat_deadline = ?, load = COALESCE(?, load) WHERE username = ?',
+                           [(timestamp, deadline, load, username) for username, (timestamp, deadline, load) in pending.items()])
+            db.commit()
+    return len(pending)
+
+def heartbeat_flusher():
+    while True:
+        time.sleep(HEARTBEAT_FLUSH_INTERVAL)
+        try:
+            flushed = flush_heartbeats()
+            with metrics_lock:
+                metrics["heartbeats_flushed"] += flushed
+        except Exception as e:
+            logging.error(f"Error flushing heartbeats: {e}")
+
+metrics_lock = Lock()
+metrics = {
+    "sweeps": 0,
+    "last_sweep_ms": 0.0,
+    "max_sweep_ms": 0.0,
+    "last_expired": 0,
+    "expired_total": 0,
+    "heartbeats_flushed": 0,
+}
+
+def sweep_expired_peers():
+    start = time.perf_counter()
+    flushed = flush_heartbeats()
+    now = time.time()
+
+    with pool.connection() as db:
+        cursor = db.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        cursor.execute("SELECT username FROM peers WHERE status = 'active' AND heartbeat_deadline < ?", (now,))
+        expired = [row['username'] for row in cursor.fetchall()]
+        if expired:
+            cursor.execute("UPDATE peers SET status = 'down' WHERE status = 'active' AND heartbeat_deadline < ?", (now,))
+        cursor.execute('DELETE FROM catalog_changes WHERE version <= (SELECT MAX(version) FROM catalog_changes) - ?', (CHANGES_RETENTION,))
+        db.commit()
+
+    for username in expired:
+        heartbeats.expire(username)
+    if expired:
+        logging.info(f"Marked {len(expired)} peer(s) down after missing heartbeats: {', '.join(expired)}")
+
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    with metrics_lock:
+        metrics["sweeps"] += 1
+        metrics["last_sweep_ms"] = elapsed_ms
+        metrics["max_sweep_ms"] = max(metrics["max_sweep_ms"], elapsed_ms)
+        metrics["last_expired"] = len(expired)
+        metrics["expired_total"] += len(expired)
+        metrics["heartbeats_flushed"] += flushed
+    return expired
+
 def check_peer_heartbeats():
     while True:
         try:
-            db = get_db()
-            cursor = db.cursor()
-            cursor.execute('SELECT username, last_heartbeat FROM peers WHERE last_heartbeat IS NOT NULL')
-            peers = cursor.fetchall()
-            now = datetime.utcnow()
-
-            for peer in peers:
-                last_heartbeat_str = peer['last_heartbeat']
-                if last_heartbeat_str:
-                    last_heartbeat = datetime.strptime(last_heartbeat_str, '%Y-%m-%d %H:%M:%S.%f')
-                    if (now - last_heartbeat).total_seconds() > HEARTBEAT_TIMEOUT:
-                        cursor.execute('UPDATE peers SET status = ? WHERE username = ?', ('down', peer['username']))
-                    db.commit()
-            time.sleep(HEARTBEAT_TIMEOUT)
+            sweep_expired_peers()
         except Exception as e:
             logging.error(f"Error checking heartbeats: {e}")
+        time.sleep(HEARTBEAT_SWEEP_INTERVAL)
+
+def start_background_tasks():
+    change_feed_thread = Thread(target=change_feed_poller)
+    change_feed_thread.daemon = True
+    change_feed_thread.start()
+    if READ_ONLY:
+        return
+
+    heartbeat_check_thread = Thread(target=check_peer_heartbeats)
+    heartbeat_check_thread.daemon = True
+    heartbeat_check_thread.start()
 
+    heartbeat_flush_thread = Thread(target=heartbeat_flusher)
+    heartbeat_flush_thread.daemon = True
+    heartbeat_flush_thread.start()
+
+def mark_peer_active(db, username, timestamp, interval):
+    cursor = db.cursor()
+    cursor.execute('UPDATE peers SET status = ?, last_heartbeat = ?, heartbeat_deadline = ? WHERE username = ?',
+                   ('active', timestamp, timestamp + interval * HEARTBEAT_MISSES, username))
+    db.commit()
+    if not cursor.rowcount:
+        heartbeats.forget(username)
+    return cursor.rowcount > 0
+
+def heartbeat_error(data):
+    if not isinstance(data, dict) or not isinstance(data.get('username'), str):
+        return "Missing username"
+    added, removed, load = data.get('added', []), data.get('removed', []), data.get('load')
+    if not isinstance(added, list) or not isinstance(removed, list) or not all(isinstance(name, str) for name in removed):
+        return "added must be a list of files and removed a list of filenames"
+    for entry in added:
+        error = file_error(entry)
+        if error:
+            return error
+    if load is not None and (not isinstance(load, dict) or len(load) > 16
+                             or not all(isinstance(value, (int, float)) for value in load.values())):
+        return "load must be an object of at most 16 numbers"
+    return None
+
+def needs_write(first, data):
+    return first or data.get('added') or data.get('removed')
+
+def write_heartbeat(db, username, timestamp, interval, first, data):
+    # What a heartbeat cannot leave to the next flush: a peer coming back up
+    # and the file changes it carries. False for a peer the tracker does not
+    # know, which tells it to log in again.
+    if first and not mark_peer_active(db, username, timestamp, interval):
+        return False
+    if data.get('added') or data.get('removed'):
+        return apply_file_changes(db, username, data.get('added', []), data.get('removed', []))
+    return True
+
+def heartbeat_reply(interval):
+    return {"message": "Heartbeat received", "interval": interval, "timeout": interval * HEARTBEAT_MISSES}
+
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+def decode_cursor(token, size):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token.encode()))
+    except ValueError:
+        return None
+    # Only the numbers and strings of a key column; anything else would be
+    # bound as a query parameter and fail there instead of with a 400.
+    if not isinstance(values, list) or len(values) != size:
+        return None
+    if not all(isinstance(value, (int, float, str)) and not isinstance(value, bool) for value in values):
+        return None
+    return values
+
+def wants_ndjson():
+    return request.args.get('format') == 'ndjson' or request.accept_mimetypes.best == 'application/x-ndjson'
+
+def not_modified(version):
+    # The version is read before the listing query, so a concurrent change
+    # can only make the ETag older than the body, never newer.
+    if request.if_none_match.contains(str(version)):
+        response = Response(status=304)
+        response.set_etag(str(version))
+        return response
+    return None
+
+def listing_response(cursor, to_item, key_columns, limit, version):
+    # NDJSON streams rows straight from the SQLite cursor in batches. Plain
+    # JSON pages were fetched with one extra row, which tells us whether to
+    # hand out a cursor for the next page.
+    if wants_ndjson():
+        def generate():
+            while True:
+                rows = cursor.fetchmany(STREAM_BATCH_SIZE)
+                if not rows:
+                    return
+                yield ''.join(json.dumps(to_item(row)) + '\n' for row in rows)
+        response = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    else:
+        rows = cursor.fetchall()
+        next_cursor = None
+        if limit > 0 and len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor([rows[-1][column] for column in key_columns])
+        response = jsonify([to_item(row) for row in rows])
+        if next_cursor:
+            response.headers['X-Next-Cursor'] = next_cursor
+
+    response.set_etag(str(version))
+    response.headers['X-Catalog-Version'] = str(version)
+    return response
+
+def page_limit():
+    limit = request.args.get('limit', -1, type=int)
+    if limit <= 0:
+        return -1, -1
+    return limit, limit if wants_ndjson() else limit + 1
+
+WRITE_ENDPOINTS = ('login', 'logout', 'heartbeat', 'upload_file')
+
+@app.before_request
+def reject_replica_writes():
+    if READ_ONLY and request.endpoint in WRITE_ENDPOINTS:
+        return jsonify({"message": "This tracker is a read-only replica, send writes to its primary"}), 403
 
 @app.route('/')
 def index():
     return "P2P File Sharing Server is running."
 
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    with metrics_lock:
+        return jsonify(metrics), 200
+
 @app.route('/login', methods=['POST'])
 def login():
     data = request.json
@@ -78,22 +846,22 @@ def login():
     grpc_url = data.get('grpc_url')
     grpc_port = data.get('grpc_port')
     status = 'online'
-    files = '[]'
 
     if username in users and users[username] == password:
         logging.info(f"User '{username}' logged in successfully.")
         db = get_db()
         cursor = db.cursor()
         cursor.execute('''
-            INSERT INTO peers (username, grpc_url, grpc_port, status, files)
-            VALUES (?, ?, ?, ?, ?)
+            INSERT INTO peers (username, grpc_url, grpc_port, status)
+            VALUES (?, ?, ?, ?)
             ON CONFLICT(username) DO UPDATE SET
                 grpc_url=excluded.grpc_url,
                 grpc_port=excluded.grpc_port,
-                status=excluded.status,
-                files=excluded.files
-        ''', (username, grpc_url, grpc_port, status, files))
+                status=excluded.status
+        ''', (username, grpc_url, grpc_port, status))
+        cursor.execute('DELETE FROM peer_files WHERE peer_id = (SELECT id FROM peers WHERE username = ?)', (username,))
         db.commit()
+        heartbeats.forget(username)
         return jsonify({"message": f"User {username} logged in successfully"}), 200
     else:
         logging.warning(f"Login failed for user '{username}'.")
@@ -107,6 +875,7 @@ def logout():
     db = get_db()
     cursor = db.cursor()
 
+    heartbeats.forget(username)
     cursor.execute('UPDATE peers SET status = ? WHERE username = ?', ('down', username))
     db.commit()
 
@@ -115,109 +884,352 @@ def logout():
 @app.route('/heartbeat', methods=['POST'])
 def heartbeat():
     data = request.json
-    username = data['username']
-    now = datetime.utcnow()
+    error = heartbeat_error(data)
+    if error:
+        return jsonify({"message": error}), 400
 
-    db = get_db()
-    cursor = db.cursor()
-
-    cursor.execute('UPDATE peers SET status = ?, last_heartbeat = ? WHERE username = ?', ('active', now, username))
-    db.commit()
+    # Besides keeping the peer alive, a heartbeat carries the files added
+    # and removed since the last acknowledged one and the peer's load.
+    username = data['username']
+    now = time.time()
+    first, interval = heartbeats.record(username, now, data.get('load'))
+    if needs_write(first, data) and not write_heartbeat(get_db(), username, now, interval, first, data):
+        return jsonify({"message": "User not found"}), 404
 
-    return jsonify({"message": "Heartbeat received"}), 200
+    return jsonify(heartbeat_reply(interval)), 200
 
 @app.route('/list_peers', methods=['GET'])
 def list_peers():
-    db = get_db()
-    cursor = db.cursor()
-    cursor.execute('SELECT username, grpc_url, grpc_port, status, files FROM peers WHERE status = "active"')
-    active_peers = cursor.fetchall()
+    status = request.args.get('status', 'active')
+    limit, fetch = page_limit()
+    conditions = ['p.id > :after0']
+    params = {'after0': 0, 'limit': fetch}
 
-    peers_list = []
-    for peer in active_peers:
-        files_list = json.loads(peer['files']) if peer['files'] else []
-        num_files = len(files_list)
+    if status != 'all':
+        if status not in PEER_STATUSES:
+            return jsonify({"message": f"Unsupported status '{status}'"}), 400
+        conditions.append(f'{PEER_STATUS} = :status')
+        params['status'] = status
+    if 'cursor' in request.args:
+        after = decode_cursor(request.args['cursor'], 1)
+        if after is None:
+            return jsonify({"message": "Invalid cursor"}), 400
+        params['after0'] = after[0]
 
-        peers_list.append({
-            "username": peer["username"],
-            "grpc_url": peer["grpc_url"],
-            "grpc_port": peer["grpc_port"],
-            "status": peer["status"],
-            "num_files": num_files  
-        })
+    db = get_db()
+    version = listing_version(db)
+    unchanged = not_modified(version)
+    if unchanged:
+        return unchanged
+
+    cursor = db.cursor()
+    cursor.execute(f'''
+        SELECT p.id, p.username, p.grpc_url, p.grpc_port, {PEER_STATUS} AS status,
+               (SELECT COUNT(*) FROM peer_files f WHERE f.peer_id = p.id) AS num_files
+        FROM peers p
+        WHERE {' AND '.join(conditions)}
+        ORDER BY p.id
+        LIMIT :limit
+    ''', params)
 
-    return jsonify(peers_list), 200
+    return listing_response(cursor, lambda peer: {
+        "username": peer["username"],
+        "grpc_url": peer["grpc_url"],
+        "grpc_port": peer["grpc_port"],
+        "status": peer["status"],
+        "num_files": peer["num_files"]
+    }, ('id',), limit, version)
 
 @app.route('/upload_file', methods=['POST'])
 def upload_file():
     data = request.json
-    username = data['username']
-    filename = data['filename']
-    fileurl = data['fileurl']
+    error = file_error(data)
+    if error:
+        return jsonify({"message": error}), 400
 
-    db = get_db()
-    cursor = db.cursor()
+    if apply_file_changes(get_db(), data['username'], [data], []):
+        return jsonify({"message": "File uploaded successfully"}), 200
+    else:
+        return jsonify({"message": "User not found"}), 404
 
-    cursor.execute('SELECT files FROM peers WHERE username = ?', (username,))
-    user_record = cursor.fetchone()
+def file_error(entry):
+    if not isinstance(entry, dict) or not isinstance(entry.get('filename'), str) or not isinstance(entry.get('fileurl'), str):
+        return "Each file needs a filename and a fileurl"
+    if entry.get('content_hash') is not None:
+        return invalid_content(entry)
+    return None
 
-    if user_record:
-        try:
-            current_files = json.loads(user_record['files']) if user_record['files'] else []
-        except json.JSONDecodeError:
-            current_files = []
+def apply_file_changes(db, username, added, removed):
+    # Shared by /upload_file and heartbeat deltas, in one transaction. Adds
+    # and removals are idempotent, so a peer can resend a delta it never saw
+    # acknowledged.
+    cursor = db.cursor()
+    peer = cursor.execute('SELECT id FROM peers WHERE username = ?', (username,)).fetchone()
+    if peer is None:
+        return False
+    cursor.executemany('''
+        INSERT INTO file_contents (content_hash, size, piece_size, piece_hashes) VALUES (?, ?, ?, ?)
+        ON CONFLICT(content_hash) DO NOTHING
+    ''', [(entry['content_hash'], entry['size'], entry['piece_size'], json.dumps(entry['piece_hashes']))
+          for entry in added if entry.get('content_hash') is not None])
+    cursor.executemany('''
+        INSERT INTO peer_files (peer_id, filename, fileurl, content_hash) VALUES (?, ?, ?, ?)
+        ON CONFLICT(peer_id, filename) DO UPDATE SET fileurl=excluded.fileurl, content_hash=excluded.content_hash
+    ''', [(peer['id'], entry['filename'], entry['fileurl'], entry.get('content_hash')) for entry in added])
+    if removed:
+        cursor.execute('DELETE FROM peer_files WHERE peer_id = ? AND filename IN (SELECT value FROM json_each(?))',
+                       (peer['id'], json.dumps(removed)))
+    db.commit()
+    return True
 
-        current_files.append({'filename': filename, 'fileurl': fileurl})
-        updated_files = json.dumps(current_files)
+def is_digest(value):
+    return isinstance(value, str) and len(value) == 64 and all(c in '0123456789abcdef' for c in value)
 
-        cursor.execute('UPDATE peers SET files = ? WHERE username = ?', (updated_files, username))
-        db.commit()
+def invalid_content(data):
+    size, piece_size, piece_hashes = data.get('size'), data.get('piece_size'), data.get('piece_hashes')
+    if not is_digest(data['content_hash']):
+        return "content_hash must be a lowercase hex SHA-256 digest"
+    if not isinstance(size, int) or size < 0 or not isinstance(piece_size, int) or piece_size <= 0:
+        return "size and piece_size must be non-negative integers"
+    if not isinstance(piece_hashes, list) or len(piece_hashes) != -(-size // piece_size) or not all(map(is_digest, piece_hashes)):
+        return "piece_hashes must hold one SHA-256 digest per piece"
+    return None
+
+@app.route('/contents/<content_hash>', methods=['GET'])
+def get_content(content_hash):
+    db = get_db()
+    row = db.execute(f'''
+        SELECT c.content_hash, c.size, c.piece_size, c.piece_hashes, COALESCE({CONTENT_COUNT}, 0) AS count
+        FROM file_contents c
+        WHERE c.content_hash = ?
+    ''', (content_hash,)).fetchone()
+    if row is None:
+        return jsonify({"message": "Content not found"}), 404
+    return jsonify({
+        "content_hash": row['content_hash'],
+        "size": row['size'],
+        "piece_size": row['piece_size'],
+        "piece_hashes": json.loads(row['piece_hashes']),
+        "count": row['count'],
+    }), 200
 
-        return jsonify({"message": "File uploaded successfully"}), 200
-    else:
-        return jsonify({"message": "User not found"}), 404
-    
 @app.route('/list_files', methods=['GET'])
 def list_files():
+    sort = request.args.get('sort', 'registered')
+    prefix = request.args.get('prefix')
+    min_count = request.args.get('min_count', type=int)
+    offset = request.args.get('offset', 0, type=int)
+    limit, fetch = page_limit()
+    if sort not in FILE_ORDERINGS:
+        return jsonify({"message": f"Unsupported sort '{sort}'"}), 400
+    order_by, key_columns, after_condition = FILE_ORDERINGS[sort]
+    conditions = []
+    params = {'limit': fetch, 'offset': max(offset, 0)}
+
+    if prefix:
+        conditions.append('filename >= :prefix AND filename < :prefix_end')
+        params.update(prefix=prefix, prefix_end=prefix + '\U0010ffff')
+    if min_count is not None:
+        conditions.append('count >= :min_count')
+        params['min_count'] = min_count
+    if 'cursor' in request.args:
+        if 'offset' in request.args:
+            return jsonify({"message": "offset cannot be combined with cursor"}), 400
+        after = decode_cursor(request.args['cursor'], len(key_columns))
+        if after is None:
+            return jsonify({"message": "Invalid cursor"}), 400
+        conditions.append(after_condition)
+        params.update((f'after{i}', value) for i, value in enumerate(after))
+
     db = get_db()
+    version = listing_version(db)
+    unchanged = not_modified(version)
+    if unchanged:
+        return unchanged
+
     cursor = db.cursor()
-    cursor.execute("SELECT files FROM peers WHERE status = 'active'")
-    
-    file_counts = {}
+    cursor.execute(f'''
+        SELECT rowid, filename, fileurl, count FROM {FILE_STATS}
+        {'WHERE ' + ' AND '.join(conditions) if conditions else ''}
+        ORDER BY {order_by}
+        LIMIT :limit OFFSET :offset
+    ''', params)
+
+    return listing_response(cursor, lambda row: {"filename": row['filename'], "fileurl": row['fileurl'], "count": row['count']},
+                            key_columns, limit, version)
+
+@app.route('/changes', methods=['GET'])
+def changes():
+    since = request.args.get('since', 0, type=int)
+    limit = min(request.args.get('limit', CHANGES_PAGE_SIZE, type=int), CHANGES_PAGE_SIZE)
+
+    rows, latest = fetch_changes(get_db(), since, limit)
+    if rows is None:
+        return jsonify({"message": "Changes since this version are no longer available", "version": latest}), 410
+
+    version = rows[-1]['version'] if rows else latest
+    return jsonify({
+        "version": version,
+        "more": version < latest,
+        "changes": [change_to_dict(row) for row in rows]
+    }), 200
+
+@app.route('/catalog', methods=['GET'])
+def catalog():
+    # Full snapshot for catalog replicas, read in one transaction so that it
+    # matches the version it reports. Replicas then follow /subscribe.
+    db = get_db()
+    cursor = db.cursor()
+    cursor.execute('BEGIN')
+    version = catalog_version(db)
+    cursor.execute(f'SELECT p.id, p.username, p.grpc_url, p.grpc_port, {PEER_STATUS} AS status FROM peers p ORDER BY p.id')
+    peers = {row['id']: {
+        "username": row['username'],
+        "grpc_url": row['grpc_url'],
+        "grpc_port": row['grpc_port'],
+        "status": row['status'],
+        "files": []
+    } for row in cursor.fetchall()}
+    cursor.execute('SELECT peer_id, filename, fileurl, content_hash FROM peer_files ORDER BY id')
     for row in cursor.fetchall():
-        peer_files = json.loads(row['files'])
-        for file in peer_files:
-            if file['filename'] in file_counts:
-                file_counts[file['filename']]['count'] += 1
-            else:
-                file['count'] = 1 
-                file_counts[file['filename']] = file
+        peers[row['peer_id']]["files"].append({"filename": row['filename'], "fileurl": row['fileurl'], "content_hash": row['content_hash']})
+    db.commit()
+
+    response = jsonify({"version": version, "peers": list(peers.values())})
+    response.headers['X-Catalog-Version'] = str(version)
+    return response
+
+@app.route('/subscribe', methods=['GET'])
+def subscribe():
+    # Server-sent events, one per catalog change, resuming after 'since' or
+    # the Last-Event-ID of a reconnecting client.
+    since = request.args.get('since', type=int)
+    if since is None:
+        since = request.headers.get('Last-Event-ID', 0, type=int)
 
-    return jsonify(list(file_counts.values())), 200  
+    def generate():
+        # An immediate comment flushes the headers, so the client knows it is
+        # subscribed before the first change arrives.
+        yield ': subscribed\n\n'
+        known = since
+        while True:
+            with pool.connection() as db:
+                rows, latest = fetch_changes(db, known, CHANGES_PAGE_SIZE)
+            if rows is None:
+                yield sse_reset(latest)
+                return
+            if rows:
+                yield sse_events(rows)
+                known = rows[-1]['version']
+            elif change_feed.wait(known, SUBSCRIBE_KEEPALIVE) <= known:
+                yield ': keepalive\n\n'
+
+    return Response(generate(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
 
 
 @app.route('/discover_file', methods=['POST'])
 def discover_file():
     data = request.json
     filename = data.get('filename')
+    mode = data.get('mode', 'exact')
+
+    if not filename:
+        return jsonify({"message": "Missing filename"}), 400
+    if mode not in DISCOVERY_MODES or (mode == 'fts' and not fts_enabled):
+        return jsonify({"message": f"Unsupported discovery mode '{mode}'"}), 400
+
+    if mode == 'exact':
+        condition, params = 'f.filename = ?', (filename,)
+    elif mode == 'prefix':
+        # A range on the filename index instead of LIKE, which SQLite cannot
+        # serve from a case-sensitive index.
+        condition, params = 'f.filename >= ? AND f.filename < ?', (filename, filename + '\U0010ffff')
+    else:
+        phrase = '"' + filename.replace('"', '""') + '"'
+        condition, params = 'f.id IN (SELECT rowid FROM peer_files_fts WHERE peer_files_fts MATCH ?)', (phrase,)
 
     db = get_db()
     cursor = db.cursor()
-    cursor.execute("SELECT username, grpc_url, grpc_port FROM peers WHERE files LIKE ?", (f'%{filename}%',))
+    cursor.execute(f'''
+        SELECT DISTINCT p.username, p.grpc_url, p.grpc_port, p.load
+        FROM peer_files f JOIN peers p ON p.id = f.peer_id
+        WHERE {PEER_STATUS} = 'active' AND {condition}
+    ''', params)
     peers = cursor.fetchall()
 
     if peers:
-        peers_info = [{"username": peer["username"], "grpc_url": peer["grpc_url"], "grpc_port": peer["grpc_port"]} for peer in peers]
+        peers_info = [dict(username=peer["username"], grpc_url=peer["grpc_url"], grpc_port=peer["grpc_port"], **peer_load(peer))
+                      for peer in peers]
         return jsonify(peers_info), 200
     else:
         return jsonify({"message": "File not found"}), 404
 
 
-if __name__ == "__main__":
-    init_db()
+@app.route('/discover_files', methods=['POST'])
+def discover_files():
+    data = request.json
+    filenames = data.get('filenames', [])
+    content_hashes = data.get('content_hashes', [])
 
-    heartbeat_check_thread = Thread(target=check_peer_heartbeats)
-    heartbeat_check_thread.daemon = True
-    heartbeat_check_thread.start()
+    for name, values in (('filenames', filenames), ('content_hashes', content_hashes)):
+        if not isinstance(values, list) or not all(isinstance(value, str) for value in values):
+            return jsonify({"message": f"{name} must be a list of strings"}), 400
+    if len(filenames) + len(content_hashes) > DISCOVER_BATCH_LIMIT:
+        return jsonify({"message": f"At most {DISCOVER_BATCH_LIMIT} filenames per request"}), 400
+
+    # One indexed lookup for the whole batch instead of a request per file.
+    # Content hashes find every active holder whatever name it shares the
+    # file under, once per peer.
+    files = {filename: [] for filename in filenames}
+    contents = {content_hash: [] for content_hash in content_hashes}
+    db = get_db()
+    cursor = db.cursor()
+    if filenames:
+        cursor.execute(f'''
+            SELECT f.filename, f.content_hash, p.username, p.grpc_url, p.grpc_port, p.load
+            FROM peer_files f JOIN peers p ON p.id = f.peer_id
+            WHERE {PEER_STATUS} = 'active' AND f.filename IN (SELECT value FROM json_each(?))
+        ''', (json.dumps(filenames),))
+        for row in cursor:
+            files[row["filename"]].append(located_peer(row))
+    if content_hashes:
+        cursor.execute(f'''
+            SELECT f.filename, f.content_hash, p.username, p.grpc_url, p.grpc_port, p.load
+            FROM peer_files f JOIN peers p ON p.id = f.peer_id
+            WHERE {PEER_STATUS} = 'active' AND f.content_hash IN (SELECT value FROM json_each(?))
+            ORDER BY f.id
+        ''', (json.dumps(content_hashes),))
+        seen = set()
+        for row in cursor:
+            if (row["content_hash"], row["username"]) not in seen:
+                seen.add((row["content_hash"], row["username"]))
+                contents[row["content_hash"]].append(located_peer(row))
+
+    return jsonify({"files": files, "contents": contents}), 200
+
+@app.route('/peer_loads', methods=['GET'])
+def peer_loads():
+    # For peers that answer discovery from their catalog replica, which does
+    # not follow load changes.
+    db = get_db()
+    rows = db.execute(f"SELECT username, load FROM peers p WHERE {PEER_STATUS} = 'active' AND load IS NOT NULL").fetchall()
+    return jsonify({"loads": {row["username"]: peer_load(row) for row in rows}}), 200
+
+def located_peer(row):
+    return dict(username=row["username"], grpc_url=row["grpc_url"], grpc_port=row["grpc_port"],
+                filename=row["filename"], content_hash=row["content_hash"], **peer_load(row))
+
+def peer_load(row):
+    # Transfers in progress and upload capacity (bytes/s) from the peer's
+    # last heartbeat; None when it has not reported them.
+    load = json.loads(row["load"]) if row["load"] else {}
+    return {"transfers": load.get("transfers"), "capacity": load.get("capacity")}
+
+if __name__ == "__main__":
+    if READ_ONLY:
+        open_replica()
+    else:
+        init_db()
+    start_background_tasks()
 
-    app.run(host='0.0.0.0', port=(SERVER_PORT), debug=True)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=(SERVER_PORT), debug=SERVER_DEBUG)
\ No newline at end of file
@@ -0,0 +1,85 @@
+import os
+import sys
+import random
+import logging
+import argparse
+import tempfile
+import threading
+import time
+
+import Server
+
+# Mixed tracker traffic: most requests are heartbeats, the rest are split
+# between listings and uploads, roughly what a steady peer fleet produces.
+TRAFFIC_MIX = [('heartbeat', 0.7), ('list_peers', 0.1), ('list_files', 0.1), ('upload_file', 0.1)]
+
+CONFIGS = {
+    'before': {'size': 0, 'journal_mode': 'DELETE', 'synchronous': 'FULL'},
+    'after': {'size': Server.DB_POOL_SIZE, 'journal_mode': 'WAL', 'synchronous': 'NORMAL'},
+}
+
+def send(client, action, username, counter):
+    if action == 'heartbeat':
+        return client.post('/heartbeat', json={'username': username})
+    elif action == 'list_peers':
+        return client.get('/list_peers')
+    elif action == 'list_files':
+        return client.get('/list_files')
+    else:
+        return client.post('/upload_file', json={'username': username, 'filename': f'file{counter}.bin', 'fileurl': f'http://{username}/file{counter}.bin'})
+
+def worker(usernames, requests_per_thread, seed, errors):
+    rng = random.Random(seed)
+    client = Server.app.test_client()
+    actions, weights = zip(*TRAFFIC_MIX)
+    for counter in range(requests_per_thread):
+        action = rng.choices(actions, weights)[0]
+        response = send(client, action, rng.choice(usernames), f'{seed}-{counter}')
+        if response.status_code != 200:
+            errors.append(action)
+
+def run(name, args):
+    workdir = tempfile.mkdtemp(prefix=f'bench-{name}-')
+    Server.DATABASE = os.path.join(workdir, 'peers.db')
+    Server.pool = Server.ConnectionPool(Server.DATABASE, **CONFIGS[name])
+    Server.init_db()
+
+    client = Server.app.test_client()
+    usernames = [f'peer{i}' for i in range(args.peers)]
+    for username in usernames:
+        Server.users[username] = username
+        client.post('/login', json={'username': username, 'password': username, 'grpc_url': 'localhost', 'grpc_port': '5001'})
+        client.post('/heartbeat', json={'username': username})
+
+    errors = []
+    per_thread = args.requests // args.threads
+    threads = [threading.Thread(target=worker, args=(usernames, per_thread, seed, errors)) for seed in range(args.threads)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    Server.pool.close()
+    total = per_thread * args.threads
+    print(f"{name:>6}: {total} requests in {elapsed:.2f}s -> {total / elapsed:,.0f} req/s ({len(errors)} errors)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Mixed heartbeat/list/upload throughput against the tracker's SQLite layer.")
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--peers', type=int, default=200)
+    parser.add_argument('configs', nargs='*', default=list(CONFIGS), help=f"any of: {', '.join(CONFIGS)}")
+    args = parser.parse_args()
+    unknown = set(args.configs) - set(CONFIGS)
+    if unknown:
+        parser.error(f"unknown config(s): {', '.join(sorted(unknown))}")
+
+    logging.getLogger().setLevel(logging.WARNING)
+    print(f"{args.requests} requests, {args.threads} threads, {args.peers} peers")
+    for name in args.configs:
+        run(name, args)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,123 @@
+import os
+import sys
+import random
+import argparse
+import tempfile
+import threading
+import subprocess
+import time
+import requests
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Same traffic shape as bench_db.py: a heartbeat-heavy fleet that also lists
+# and uploads.
+TRAFFIC_MIX = [('heartbeat', 0.7), ('list_peers', 0.1), ('list_files', 0.1), ('upload_file', 0.1)]
+
+TARGETS = {
+    'flask': 'Server.py',
+    'async': 'AsyncServer.py',
+}
+
+def send(session, base_url, action, username, counter):
+    if action == 'heartbeat':
+        return session.post(f'{base_url}/heartbeat', json={'username': username})
+    elif action == 'list_peers':
+        return session.get(f'{base_url}/list_peers')
+    elif action == 'list_files':
+        return session.get(f'{base_url}/list_files')
+    else:
+        return session.post(f'{base_url}/upload_file', json={'username': username, 'filename': f'file{counter}.bin', 'fileurl': f'http://{username}/file{counter}.bin'})
+
+def worker(base_url, usernames, deadline, seed, latencies, errors):
+    rng = random.Random(seed)
+    session = requests.Session()
+    actions, weights = zip(*TRAFFIC_MIX)
+    counter = 0
+    while time.monotonic() < deadline:
+        action = rng.choices(actions, weights)[0]
+        start = time.perf_counter()
+        try:
+            response = send(session, base_url, action, rng.choice(usernames), f'{seed}-{counter}')
+            ok = response.status_code == 200
+        except requests.RequestException:
+            ok = False
+        latencies.append(time.perf_counter() - start)
+        if not ok:
+            errors.append(action)
+        counter += 1
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+def run_load(name, base_url, args):
+    usernames = args.users.split(',')
+    session = requests.Session()
+    for username in usernames:
+        session.post(f'{base_url}/login', json={'username': username, 'password': username, 'grpc_url': 'localhost', 'grpc_port': '5001'})
+        session.post(f'{base_url}/heartbeat', json={'username': username})
+
+    latencies, errors = [], []
+    deadline = time.monotonic() + args.duration
+    threads = [threading.Thread(target=worker, args=(base_url, usernames, deadline, seed, latencies, errors)) for seed in range(args.concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    if not latencies:
+        print(f"{name:>6}: no requests completed")
+        return
+    print(f"{name:>6}: {len(latencies)} requests, {len(errors)} errors, {len(latencies) / elapsed:,.0f} req/s, "
+          f"p50 {percentile(latencies, 0.50) * 1000:.1f} ms, p99 {percentile(latencies, 0.99) * 1000:.1f} ms")
+
+def wait_until_up(base_url, timeout=15):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(f'{base_url}/').status_code == 200:
+                return True
+        except requests.ConnectionError:
+            pass
+        time.sleep(0.2)
+    return False
+
+def spawn(name, port):
+    workdir = tempfile.mkdtemp(prefix=f'loadgen-{name}-')
+    env = dict(os.environ, SERVER_URL='localhost', SERVER_PORT=str(port), SERVER_DEBUG='0')
+    return subprocess.Popen([sys.executable, os.path.join(HERE, TARGETS[name])], cwd=workdir, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP load generator for the tracker. Without --url it starts the "
+                                                 "Flask and async servers in turn on fresh databases and compares them.")
+    parser.add_argument('--url', action='append', help="benchmark an already running tracker instead (repeatable)")
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--users', default='1,2,3', help="comma separated accounts, password equal to username")
+    parser.add_argument('--port', type=int, default=4101)
+    args = parser.parse_args()
+
+    print(f"{args.concurrency} concurrent clients for {args.duration:.0f}s per target")
+    if args.url:
+        for url in args.url:
+            run_load(url, url.rstrip('/'), args)
+        return
+
+    for name in TARGETS:
+        base_url = f'http://127.0.0.1:{args.port}'
+        process = spawn(name, args.port)
+        try:
+            if not wait_until_up(base_url):
+                print(f"{name:>6}: server did not start")
+                continue
+            run_load(name, base_url, args)
+        finally:
+            process.terminate()
+            process.wait()
+
+if __name__ == '__main__':
+    sys.exit(main())